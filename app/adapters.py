@@ -0,0 +1,164 @@
+"""
+LoRA Adapter Cache
+One base model shared by any number of named PEFT adapters. Adapters are
+loaded on first use and evicted least-recently-used once the cache holds
+more than ADAPTER_CACHE_SIZE of them or more than ADAPTER_CACHE_MB of
+weights, so an extra adapter costs megabytes instead of a model copy.
+
+The active adapter is model-wide state in PEFT, so generations hold it
+through AdapterCache.use(): calls for the active adapter run side by side,
+and a call for another one (or for the bare base model) waits for them to
+finish before switching.
+
+Settings (environment):
+  LORA_ADAPTERS       - extra adapters as "name=hub_id_or_path,..." (fingesg4 is always available)
+  ADAPTER_CACHE_SIZE  - adapters kept loaded (default 4)
+  ADAPTER_CACHE_MB    - memory for loaded adapter weights (default 512)
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from app import metrics
+from app.logger import get_logger, log_event
+
+logger = get_logger("adapters")
+
+DEFAULT_ADAPTER = "fingesg4"
+DEFAULT_ADAPTER_ID = "DeepakJ1218/fingesg4"
+
+ADAPTER_CACHE_SIZE = int(os.getenv("ADAPTER_CACHE_SIZE", "4"))
+ADAPTER_CACHE_MB = float(os.getenv("ADAPTER_CACHE_MB", "512"))
+
+
+def parse_registry(spec: str) -> Dict[str, str]:
+    """Adapter names to hub ids / local paths from LORA_ADAPTERS ("esg-banking=org/repo,v2=./adapters/v2")"""
+    registry = {DEFAULT_ADAPTER: DEFAULT_ADAPTER_ID}
+    for entry in (spec or "").split(","):
+        if not entry.strip():
+            continue
+        name, _, source = entry.partition("=")
+        if not name.strip() or not source.strip():
+            raise ValueError(f"LORA_ADAPTERS entry must be name=hub_id_or_path: {entry!r}")
+        registry[name.strip()] = source.strip()
+    return registry
+
+
+class AdapterCache:
+    def __init__(
+        self,
+        model,
+        registry: Dict[str, str],
+        max_adapters: int = ADAPTER_CACHE_SIZE,
+        max_bytes: float = ADAPTER_CACHE_MB * 1024 * 1024,
+        pinned=(DEFAULT_ADAPTER,)
+    ):
+        """
+        Args:
+            model: PeftModel with the pinned adapters already loaded
+            registry: Every adapter that may be requested, name -> hub id or path
+            pinned: Adapters that are never evicted
+        """
+        self.model = model
+        self.registry = registry
+        self.max_adapters = max(max_adapters, len(pinned))
+        self.max_bytes = max_bytes
+        self.pinned = set(pinned)
+
+        self.loaded: "OrderedDict[str, int]" = OrderedDict()
+        for name in pinned:
+            self.loaded[name] = self._adapter_bytes(name)
+
+        self._cond = threading.Condition()
+        self._active: Optional[str] = model.active_adapter
+        self._in_use = 0
+        self._switch_waiters = 0
+        self._update_gauges()
+
+    def names(self) -> List[str]:
+        return list(self.registry)
+
+    def _adapter_bytes(self, name: str) -> int:
+        marker = f".{name}."
+        return sum(
+            parameter.numel() * parameter.element_size()
+            for parameter_name, parameter in self.model.named_parameters()
+            if marker in parameter_name
+        )
+
+    def _update_gauges(self):
+        metrics.LORA_ADAPTERS_LOADED.set(len(self.loaded))
+        metrics.LORA_ADAPTER_BYTES.set(sum(self.loaded.values()))
+
+    def _ensure_loaded(self, name: str):
+        if name in self.loaded:
+            self.loaded.move_to_end(name)
+            metrics.record_cache("lora_adapter", True)
+            return
+        metrics.record_cache("lora_adapter", False)
+
+        self.model.load_adapter(self.registry[name], adapter_name=name)
+        self.loaded[name] = self._adapter_bytes(name)
+        log_event(logger, "adapter_loaded", adapter=name, source=self.registry[name], bytes=self.loaded[name])
+
+        # Evict least recently used; the one just loaded and pinned ones stay
+        while len(self.loaded) > self.max_adapters or sum(self.loaded.values()) > self.max_bytes:
+            victim = next((loaded for loaded in self.loaded if loaded not in self.pinned and loaded != name), None)
+            if victim is None:
+                break
+            self.model.delete_adapter(victim)
+            freed = self.loaded.pop(victim)
+            log_event(logger, "adapter_evicted", adapter=victim, bytes=freed)
+        self._update_gauges()
+
+    def _activate(self, name: Optional[str]):
+        if name is None:
+            self.model.base_model.disable_adapter_layers()
+        else:
+            self._ensure_loaded(name)
+            self.model.base_model.enable_adapter_layers()
+            self.model.set_adapter(name)
+        self._active = name
+
+    @contextmanager
+    def use(self, name: Optional[str]):
+        """
+        Hold an adapter active for one generation (None = bare base model)
+
+        Raises KeyError for names missing from the registry.
+        """
+        if name is not None and name not in self.registry:
+            raise KeyError(f"Unknown adapter: {name}")
+
+        with self._cond:
+            waiting_to_switch = False
+            try:
+                while True:
+                    if name == self._active:
+                        # Pending switches go first so a steady stream for one adapter can't starve another
+                        if self._switch_waiters - waiting_to_switch == 0:
+                            break
+                    elif self._in_use == 0:
+                        break
+                    elif not waiting_to_switch:
+                        self._switch_waiters += 1
+                        waiting_to_switch = True
+                    self._cond.wait()
+            finally:
+                if waiting_to_switch:
+                    self._switch_waiters -= 1
+            if name != self._active:
+                try:
+                    self._activate(name)
+                except Exception:
+                    self._cond.notify_all()  # let other waiters retry their own switch
+                    raise
+            self._in_use += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify_all()
@@ -1,28 +1,49 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, status, Response, Request
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, HTTPException, Depends, Query, status, Response, Request, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from typing import Optional, List
-from datetime import timedelta
+from typing import Optional, List, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import uuid
 
-from app import models, schemas, crud, auth, database
-from app.ml_engine_lmstudio import model_instance  # 200x faster with LM Studio!
-from app.context_helper import TokenContextManager
-from app.utils import extract_text_from_pdf
+from app import models, schemas, crud, auth, database, metrics, tracing, jobs, memory, export, responses, esg_store, singleflight, sidebar_cache, capture
+from app.esg_extract import METRICS as ESG_METRICS, UNITS as ESG_UNITS
+from app.engine import model_instance, context_manager, schedule_model, supports_adapters, available_adapters
+from app.logger import get_logger, log_event
+from app.scheduler import AdmissionRejected
+from app.utils import extract_text_from_file
 
 router = APIRouter()
+logger = get_logger("api")
 
 # Cookie name for the token
 COOKIE_NAME = "access_token"
 
-# Initialize token context manager with 2048 token limit
-if model_instance is not None:
-    context_manager = TokenContextManager(
-        tokenizer=model_instance.tokenizer,
-        max_context_tokens=2048
-    )
-else:
-    print("⚠️  WARNING: Model not loaded. Context manager disabled.")
-    context_manager = None
+SUPPORTED_FILE_TYPES = ["application/pdf", "text/plain"]
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+
+# Uploads are copied to disk this many bytes at a time
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# Multipart boundaries and headers on top of the file itself
+UPLOAD_OVERHEAD = 64 * 1024
+UPLOAD_PATHS = ("/chat/file", "/chat/file/jobs")
+
+# How often REST handlers check whether the client went away mid-generation
+DISCONNECT_POLL_SECONDS = 0.25
+
+# Status for requests abandoned by the client (nginx convention)
+CLIENT_CLOSED_REQUEST = 499
+
+# Duplicate /chat submissions share one generation (see app.singleflight)
+chat_flights = singleflight.SingleFlight("chat")
 
 # ============================================
 # AUTH HELPERS
@@ -40,8 +61,106 @@ async def get_current_user_from_cookie(
     request: Request, 
     db: Session = Depends(database.get_db)
 ) -> models.User:
-    token = await get_token_from_cookie(request)
-    return await auth.get_current_user(token=token, db=db)
+    with tracing.span("auth"):
+        token = await get_token_from_cookie(request)
+        return await auth.get_current_user(token=token, db=db)
+
+# ============================================
+# MODEL HELPERS
+# ============================================
+async def run_model(
+    message: str,
+    context: str,
+    user_id: int,
+    prompt_tokens: Optional[int] = None,
+    cancel_event: threading.Event = None,
+    on_token=None,
+    adapter: Optional[str] = None
+) -> str:
+    """Run the model through the scheduler without blocking the event loop"""
+    if cancel_event is None:
+        cancel_event = threading.Event()
+    future = schedule_model(message, context, user_id, prompt_tokens, cancel_event, on_token, adapter=adapter)
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        cancel_event.set()  # request task cancelled: stop the generation too
+        raise
+
+def too_many_requests(rejected: AdmissionRejected) -> HTTPException:
+    detail = "Server is busy, please retry shortly." if rejected.reason == "queue_full" else "Rate limit exceeded, please slow down."
+    return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(rejected.retry_after)})
+
+async def predict_unless_disconnected(
+    request: Request,
+    message: str,
+    context: str,
+    user_id: int,
+    prompt_tokens: Optional[int] = None,
+    adapter: Optional[str] = None
+) -> Optional[str]:
+    """
+    Run the model, aborting generation if the HTTP client disconnects
+
+    Returns None when the client went away (nothing should be saved).
+    Raises 429 with Retry-After when admission control sheds the request.
+    """
+    cancel_event = threading.Event()
+    
+    async def watch_disconnect():
+        while not cancel_event.is_set():
+            if await request.is_disconnected():
+                cancel_event.set()
+                return
+            await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+    
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        response = await run_model(message, context, user_id, prompt_tokens, cancel_event=cancel_event, adapter=adapter)
+    except AdmissionRejected as rejected:
+        raise too_many_requests(rejected)
+    finally:
+        watcher.cancel()
+    
+    if cancel_event.is_set():
+        metrics.GENERATIONS_CANCELLED.labels(reason="client_disconnect").inc()
+        log_event(logger, "generation_cancelled", reason="client_disconnect", path=request.url.path)
+        return None
+    return response
+
+def adapter_error(adapter: Optional[str]) -> Optional[str]:
+    """Why a requested LoRA adapter can't be used, or None when it can (or none was asked for)"""
+    if not adapter:
+        return None
+    if not supports_adapters():
+        return "Adapter selection needs the hf engine (MODEL_ENGINE=hf)"
+    if adapter not in available_adapters():
+        return f"Unknown adapter. Available: {', '.join(available_adapters())}"
+    return None
+
+def message_response(msg: models.Message) -> schemas.MessageResponse:
+    return schemas.MessageResponse(
+        id=msg.id,
+        conversation_id=msg.conversation_id,
+        role=msg.role,
+        content=msg.content,
+        file_name=msg.file_name,
+        created_at=msg.created_at
+    )
+
+def resolve_chat_conversation(db: Session, user_id: int, conversation_id: Optional[int], message: str) -> models.Conversation:
+    """Get the conversation for a chat message, creating it when missing"""
+    conv = crud.get_conversation(db, conversation_id) if conversation_id is not None else None
+    if not conv:
+        # New chat, or frontend sent a non-existent ID: auto-generate title from first message
+        title = message[:50] + "..." if len(message) > 50 else message
+        conv = crud.create_conversation(db, user_id, title)
+    return conv
+
+def refresh_summary_later(background_tasks: BackgroundTasks, metadata: dict, conversation_id: int, user_id: int):
+    """Fold aged-out turns into the conversation summary after the response is sent"""
+    if metadata.get("summary_due"):
+        background_tasks.add_task(memory.refresh_summary, conversation_id, user_id)
 
 # ============================================
 # AUTH ROUTES
@@ -91,6 +210,20 @@ async def get_current_user(
     """Get current logged-in user"""
     return current_user
 
+# ============================================
+# MONITORING
+# ============================================
+@router.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics (inference, context, database, caches)"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@router.get("/adapters")
+async def list_adapters():
+    """LoRA adapters that /chat can select with "adapter" (empty unless MODEL_ENGINE=hf)"""
+    return {"adapters": available_adapters()}
+
 # ============================================
 # CONVERSATION ROUTES
 # ============================================
@@ -106,22 +239,13 @@ async def get_conversations(
     except:
         user_id = 1  # Demo user fallback
     
-    conversations = crud.get_user_conversations(db, user_id)
-    
-    # Add message count to each conversation
-    response_convs = []
-    for conv in conversations:
-        conv_data = schemas.ConversationResponse(
-            id=conv.id,
-            user_id=conv.user_id,
-            title=conv.title,
-            created_at=conv.created_at,
-            updated_at=conv.updated_at,
-            message_count=len(conv.messages)
-        )
-        response_convs.append(conv_data)
-    
-    return response_convs
+    # Served from the write-through sidebar cache; the database is only read on a miss
+    entry = sidebar_cache.listing(user_id, lambda: crud.get_user_conversation_rows(db, user_id, sidebar_cache.SIDEBAR_LIMIT))
+    last_updated = datetime.fromisoformat(entry["last_modified"]) if entry["last_modified"] else None
+    # ETag only: a deleted conversation doesn't move the newest updated_at
+    if responses.is_not_modified(request, entry["etag"]):
+        return responses.not_modified(entry["etag"], last_updated)
+    return responses.json_response(request, entry["rows"], entry["etag"], last_updated)
 
 @router.post("/conversations", response_model=schemas.ConversationResponse)
 async def create_conversation(
@@ -131,6 +255,7 @@ async def create_conversation(
 ):
     """Create a new conversation"""
     conv = crud.create_conversation(db, current_user.id, conversation.title)
+    capture.note_conversation(conv.id, new=True)
     return schemas.ConversationResponse(
         id=conv.id,
         user_id=conv.user_id,
@@ -157,28 +282,33 @@ async def get_conversation(
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    # Get messages
-    messages = crud.get_conversation_messages(db, conversation_id)
+    # Any new message moves updated_at and last_message_id: 304 without reading messages
+    etag = responses.make_etag("conversation", conv.id, conv.title, conv.updated_at, conv.last_message_id)
+    if responses.is_not_modified(request, etag, conv.updated_at):
+        return responses.not_modified(etag, conv.updated_at)
     
-    return schemas.ConversationWithMessages(
-        id=conv.id,
-        user_id=conv.user_id,
-        title=conv.title,
-        created_at=conv.created_at,
-        updated_at=conv.updated_at,
-        message_count=len(messages),
-        messages=[
-            schemas.MessageResponse(
-                id=msg.id,
-                conversation_id=msg.conversation_id,
-                role=msg.role,
-                content=msg.content,
-                file_name=msg.file_name,
-                created_at=msg.created_at
-            )
+    crud.ensure_hot(db, conv)
+    messages = crud.get_conversation_message_rows(db, conversation_id)
+    payload = {
+        "title": conv.title,
+        "id": conv.id,
+        "user_id": conv.user_id,
+        "created_at": conv.created_at,
+        "updated_at": conv.updated_at,
+        "message_count": len(messages),
+        "messages": [
+            {
+                "role": msg.role,
+                "content": msg.content,
+                "id": msg.id,
+                "conversation_id": msg.conversation_id,
+                "file_name": msg.file_name,
+                "created_at": msg.created_at,
+            }
             for msg in messages
-        ]
-    )
+        ],
+    }
+    return responses.json_response(request, payload, etag, conv.updated_at)
 
 @router.delete("/conversations/{conversation_id}")
 async def delete_conversation(
@@ -200,12 +330,311 @@ async def delete_conversation(
     crud.delete_conversation(db, conversation_id)
     return {"message": "Conversation deleted"}
 
+# ============================================
+# SEARCH
+# ============================================
+@router.get("/search", response_model=schemas.SearchResponse)
+async def search_messages(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(database.get_db)
+):
+    """Full-text search over the user's messages and uploaded file text (ranked, paginated)"""
+    try:
+        current_user = await get_current_user_from_cookie(request, db)
+        user_id = current_user.id
+    except:
+        user_id = 1  # Demo user fallback
+    
+    try:
+        # One extra row tells us whether there is a next page without a COUNT(*)
+        rows = crud.search_messages(db, user_id, q, limit + 1, offset)
+    except Exception as e:
+        log_event(logger, "search_failed", query=q, error=str(e))
+        raise HTTPException(status_code=503, detail="Search is not available")
+    
+    hits = [
+        schemas.SearchHit(
+            message_id=row.id,
+            conversation_id=row.conversation_id,
+            conversation_title=row.title,
+            role=row.role,
+            file_name=row.file_name,
+            snippet=row.snippet or "",
+            rank=row.rank,
+            created_at=row.created_at,
+        )
+        for row in rows[:limit]
+    ]
+    return schemas.SearchResponse(query=q, hits=hits, limit=limit, offset=offset, has_more=len(rows) > limit)
+
+# ============================================
+# DOCUMENT LIBRARY (scripts.ingest_corpus)
+# ============================================
+def document_response(document: models.Document) -> schemas.DocumentResponse:
+    return schemas.DocumentResponse(
+        id=document.id,
+        file_name=document.file_name,
+        source_path=document.source_path,
+        size_bytes=document.size_bytes,
+        tokens=document.tokens,
+        chunk_count=document.chunk_count,
+        created_at=document.created_at
+    )
+
+@router.get("/documents", response_model=List[schemas.DocumentResponse])
+async def list_documents(
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(database.get_db)
+):
+    """Bulk-loaded reports of the current user, newest first"""
+    try:
+        current_user = await get_current_user_from_cookie(request, db)
+        user_id = current_user.id
+    except:
+        user_id = 1  # Demo user fallback
+    
+    return [document_response(document) for document in crud.get_user_documents(db, user_id, limit, offset)]
+
+@router.get("/documents/search", response_model=schemas.DocumentSearchResponse)
+async def search_documents(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(database.get_db)
+):
+    """Full-text search over the chunks of the user's bulk-loaded reports (ranked, paginated)"""
+    try:
+        current_user = await get_current_user_from_cookie(request, db)
+        user_id = current_user.id
+    except:
+        user_id = 1  # Demo user fallback
+    
+    try:
+        rows = crud.search_documents(db, user_id, q, limit + 1, offset)
+    except Exception as e:
+        log_event(logger, "document_search_failed", query=q, error=str(e))
+        raise HTTPException(status_code=503, detail="Search is not available")
+    
+    hits = [
+        schemas.DocumentSearchHit(
+            document_id=row.document_id,
+            file_name=row.file_name,
+            source_path=row.source_path,
+            chunk_index=row.chunk_index,
+            snippet=row.snippet or "",
+            rank=row.rank,
+        )
+        for row in rows[:limit]
+    ]
+    return schemas.DocumentSearchResponse(query=q, hits=hits, limit=limit, offset=offset, has_more=len(rows) > limit)
+
+@router.get("/documents/{document_id}", response_model=schemas.DocumentDetailResponse)
+async def get_document(
+    document_id: int,
+    request: Request,
+    db: Session = Depends(database.get_db)
+):
+    """A bulk-loaded report with its text chunks in order"""
+    try:
+        current_user = await get_current_user_from_cookie(request, db)
+        user_id = current_user.id
+    except:
+        user_id = 1  # Demo user fallback
+    
+    document = crud.get_document(db, document_id)
+    if document is None or document.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    return schemas.DocumentDetailResponse(
+        id=document.id,
+        file_name=document.file_name,
+        source_path=document.source_path,
+        size_bytes=document.size_bytes,
+        tokens=document.tokens,
+        chunk_count=document.chunk_count,
+        created_at=document.created_at,
+        chunks=[
+            schemas.DocumentChunkResponse(chunk_index=chunk.chunk_index, content=chunk.content, tokens=chunk.tokens)
+            for chunk in document.chunks
+        ]
+    )
+
+# ============================================
+# EXPORT
+# ============================================
+@router.get("/export/conversations")
+async def export_conversations(
+    request: Request,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Download the user's full history as gzipped NDJSON (see app.export)
+    
+    Streamed from a server-side cursor, so memory stays flat however many
+    messages there are. Exports for all users: python -m scripts.history export
+    """
+    try:
+        current_user = await get_current_user_from_cookie(request, db)
+        user_id = current_user.id
+    except:
+        user_id = 1  # Demo user fallback
+    
+    def stream():
+        # Own session: the request-scoped one is closed before the body is sent
+        export_db = database.SessionLocal()
+        try:
+            yield from export.gzip_stream(export.iter_export_lines(export_db, user_id))
+        finally:
+            export_db.close()
+    
+    return StreamingResponse(
+        stream(),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="conversations-{user_id}.ndjson.gz"'}
+    )
+
+# ============================================
+# ESG ANALYTICS
+# ============================================
+def check_esg_metric(metric: Optional[str]):
+    if metric is not None and metric not in ESG_METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric. Use one of: {', '.join(ESG_METRICS)}")
+
+@router.get("/esg/companies", response_model=List[schemas.ESGCompany])
+async def list_esg_companies(
+    request: Request,
+    db: Session = Depends(database.get_db)
+):
+    """Companies with ESG figures extracted from the user's uploaded reports"""
+    try:
+        current_user = await get_current_user_from_cookie(request, db)
+        user_id = current_user.id
+    except:
+        user_id = 1  # Demo user fallback
+    
+    return esg_store.store.list_companies(user_id)
+
+@router.get("/esg/compare", response_model=schemas.ESGComparison)
+async def compare_esg_metric(
+    request: Request,
+    metric: str,
+    companies: Optional[str] = Query(None, description="Comma-separated company names (default: all)"),
+    year: Optional[int] = Query(None, ge=1900, le=2100),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Compare one ESG metric across companies from the figure store
+    
+    Answered from memory-mapped columns without calling the model, e.g.
+    /esg/compare?metric=scope1_emissions&companies=Acme,Globex&year=2023
+    """
+    try:
+        current_user = await get_current_user_from_cookie(request, db)
+        user_id = current_user.id
+    except:
+        user_id = 1  # Demo user fallback
+    
+    check_esg_metric(metric)
+    names = [name.strip() for name in companies.split(",") if name.strip()] if companies else None
+    return esg_store.store.compare(user_id, metric, names, year)
+
+@router.get("/esg/series", response_model=schemas.ESGSeries)
+async def get_esg_series(
+    request: Request,
+    company: str,
+    metric: Optional[str] = None,
+    db: Session = Depends(database.get_db)
+):
+    """Year-by-year ESG figures for one company (all metrics unless one is given)"""
+    try:
+        current_user = await get_current_user_from_cookie(request, db)
+        user_id = current_user.id
+    except:
+        user_id = 1  # Demo user fallback
+    
+    check_esg_metric(metric)
+    series = esg_store.store.series(user_id, company, metric)
+    if not series:
+        raise HTTPException(status_code=404, detail="No ESG figures for this company")
+    return {
+        "company": company,
+        "units": {name: ESG_UNITS[name][0] for name in series},
+        "series": series,
+    }
+
 # ============================================
 # MESSAGE / CHAT ROUTES
 # ============================================
+async def answer_chat(
+    db: Session,
+    user_id: int,
+    chat_request: schemas.ChatRequest,
+    cancel_event: threading.Event
+) -> Optional[schemas.ChatResponse]:
+    """Generate and save one chat turn; None if cancelled (nothing is saved then)"""
+    # Create new conversation if needed (frontend may also send non-existent IDs)
+    conv = resolve_chat_conversation(db, user_id, chat_request.conversation_id, chat_request.message)
+    conversation_id = conv.id
+    capture.note_conversation(conversation_id, new=conversation_id != chat_request.conversation_id)
+    
+    # Get conversation context (1200 tokens)
+    context, metadata = context_manager.get_conversation_context(
+        db, conversation_id, chat_request.message
+    )
+    
+    log_event(
+        logger, "context_built",
+        conversation_id=conversation_id,
+        messages_included=metadata["messages_included"],
+        context_tokens=metadata["context_tokens"],
+        truncated=metadata["was_truncated"],
+    )
+    
+    # Call model WITH CONTEXT
+    try:
+        assistant_response = await run_model(
+            chat_request.message, context, user_id, metadata["total_tokens"],
+            cancel_event=cancel_event, adapter=chat_request.adapter
+        )
+    except AdmissionRejected as rejected:
+        raise too_many_requests(rejected)
+    if cancel_event.is_set():
+        metrics.GENERATIONS_CANCELLED.labels(reason="client_disconnect").inc()
+        log_event(logger, "generation_cancelled", reason="client_disconnect", path="/chat")
+        return None
+    capture.note_chat(chat_request.message, metadata["total_tokens"], assistant_response, model_instance.tokenizer)
+    
+    # Save user message
+    user_msg = crud.create_message(
+        db, conversation_id, "user", chat_request.message
+    )
+    
+    # Save assistant response
+    assistant_msg = crud.create_message(
+        db, conversation_id, "assistant", assistant_response
+    )
+    if metadata.get("summary_due"):
+        asyncio.get_running_loop().run_in_executor(None, memory.refresh_summary, conversation_id, user_id)
+    
+    # Get updated conversation
+    conv = crud.get_conversation(db, conversation_id)
+    
+    return schemas.ChatResponse(
+        message=message_response(assistant_msg),
+        conversation_id=conversation_id,
+        conversation_title=conv.title
+    )
+
 @router.post("/chat", response_model=schemas.ChatResponse)
 async def send_message(
     request: Request,
+    response: Response,
     chat_request: schemas.ChatRequest,
     db: Session = Depends(database.get_db)
 ):
@@ -217,6 +646,10 @@ async def send_message(
     2. Builds context from previous messages (1200 token limit)
     3. Calls model with context
     4. Saves user message and assistant response
+    
+    Duplicate submissions (same user, conversation, message and optional
+    Idempotency-Key header) share one generation: concurrent ones wait for
+    it and recent ones get its result replayed (X-Coalesced: joined/replayed).
     """
     try:
         current_user = await get_current_user_from_cookie(request, db)
@@ -224,21 +657,9 @@ async def send_message(
     except:
         user_id = 1  # Demo user fallback
     
-    # Create new conversation if needed
-    if chat_request.conversation_id is None:
-        # Auto-generate title from first message
-        title = chat_request.message[:50] + "..." if len(chat_request.message) > 50 else chat_request.message
-        conv = crud.create_conversation(db, user_id, title)
-        conversation_id = conv.id
-    else:
-        # Check if conversation exists
-        conversation_id = chat_request.conversation_id
-        conv = crud.get_conversation(db, conversation_id)
-        if not conv:
-            # Conversation doesn't exist - create it (frontend may send non-existent IDs)
-            title = chat_request.message[:50] + "..." if len(chat_request.message) > 50 else chat_request.message
-            conv = crud.create_conversation(db, user_id, title)
-            conversation_id = conv.id
+    error = adapter_error(chat_request.adapter)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
     
     # Verify model is loaded
     if model_instance is None:
@@ -253,46 +674,129 @@ async def send_message(
             detail="Context manager not initialized. Please contact administrator."
         )
     
-    # Get conversation context (1200 tokens)
-    context, metadata = context_manager.get_conversation_context(
-        db, conversation_id, chat_request.message
+    async def generate_reply(cancel_event: threading.Event):
+        # Own session: the shared generation can outlive the request that started it
+        flight_db = database.SessionLocal()
+        try:
+            return await answer_chat(flight_db, user_id, chat_request, cancel_event)
+        finally:
+            flight_db.close()
+    
+    key = singleflight.chat_key(
+        user_id, chat_request.conversation_id, chat_request.message,
+        request.headers.get("idempotency-key"), chat_request.adapter
     )
+    # Stops waiting if this client disconnects; generation stops once no client is left
+    result, outcome = await chat_flights.run(key, generate_reply, request.is_disconnected, DISCONNECT_POLL_SECONDS)
+    if result is None:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    if outcome != singleflight.LEADER:
+        response.headers["X-Coalesced"] = outcome
+        capture.note_conversation(result.conversation_id)
+        log_event(logger, "chat_coalesced", outcome=outcome, user_id=user_id, conversation_id=result.conversation_id)
+    return result
+
+class UploadTooLarge(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=413, detail="File too large (max 10MB)")
+
+class UploadSizeLimit:
+    """
+    ASGI middleware: cap upload request bodies at MAX_FILE_SIZE + UPLOAD_OVERHEAD
     
-    print(f"📜 Context: {metadata['messages_included']} messages, "
-          f"{metadata['context_tokens']} tokens, truncated={metadata['was_truncated']}")
+    A Content-Length over the limit is refused before the body is read;
+    without one (chunked transfer) the body bytes are counted as they are
+    received, so the multipart parser stops, and nothing more is written
+    to its temp file, as soon as the limit is crossed.
+    """
+    def __init__(self, app, limit: int = MAX_FILE_SIZE + UPLOAD_OVERHEAD):
+        self.app = app
+        self.limit = limit
     
-    # Call model WITH CONTEXT
-    assistant_response = model_instance.predict(chat_request.message, context)
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in UPLOAD_PATHS:
+            return await self.app(scope, receive, send)
+        
+        headers = dict(scope["headers"])
+        length = headers.get(b"content-length", b"").decode("latin-1")
+        if length.isdigit() and int(length) > self.limit:
+            return await self.reject(scope, send)
+        
+        received = 0
+        started = False
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    raise UploadTooLarge()
+            return message
+        
+        async def tracking_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+        
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadTooLarge:
+            # Normally turned into a 413 by FastAPI's exception handling already
+            if not started:
+                await self.reject(scope, send)
     
-    # Save user message
-    user_msg = crud.create_message(
-        db, conversation_id, "user", chat_request.message
-    )
+    @staticmethod
+    async def reject(scope, send):
+        response = JSONResponse(status_code=413, content={"detail": "File too large (max 10MB)"})
+        await response(scope, None, send)
+
+async def spool_upload(file: UploadFile, path: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Validate an upload and copy it to disk in chunks
     
-    # Save assistant response
-    assistant_msg = crud.create_message(
-        db, conversation_id, "assistant", assistant_response
-    )
+    Hashes while reading and stops with 413 as soon as MAX_FILE_SIZE is
+    crossed, so memory per upload stays at one chunk whatever the file size.
     
-    # Get updated conversation
-    conv = crud.get_conversation(db, conversation_id)
+    Args:
+        file: The uploaded file
+        path: Where to write it (default: a new temp file)
     
-    return schemas.ChatResponse(
-        message=schemas.MessageResponse(
-            id=assistant_msg.id,
-            conversation_id=assistant_msg.conversation_id,
-            role=assistant_msg.role,
-            content=assistant_msg.content,
-            file_name=assistant_msg.file_name,
-            created_at=assistant_msg.created_at
-        ),
-        conversation_id=conversation_id,
-        conversation_title=conv.title
-    )
+    Returns:
+        Tuple of (path, sha256 hex digest); the caller removes the file
+    """
+    if file.content_type not in SUPPORTED_FILE_TYPES:
+        raise HTTPException(status_code=400, detail="Only PDF and TXT files are supported")
+    
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix="finesg-upload-")
+        os.close(fd)
+    
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_FILE_SIZE:
+                    raise HTTPException(status_code=413, detail="File too large (max 10MB)")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    
+    log_event(logger, "upload_spooled", file_name=file.filename, size=size, sha256=digest.hexdigest())
+    return path, digest.hexdigest()
 
 @router.post("/chat/file", response_model=schemas.ChatResponse)
 async def send_message_with_file(
     request: Request,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     conversation_id: Optional[int] = None,
     db: Session = Depends(database.get_db)
@@ -302,20 +806,14 @@ async def send_message_with_file(
     
     Accepts PDF or TXT files, extracts content, and processes with model
     """
-    # Validate file type
-    if file.content_type not in ["application/pdf", "text/plain"]:
-        raise HTTPException(status_code=400, detail="Only PDF and TXT files are supported")
+    path, _ = await spool_upload(file)
+    capture.note(file_bytes=os.path.getsize(path))
     
-    # Read file
-    content = await file.read()
-    if len(content) > 10 * 1024 * 1024:  # 10MB limit
-        raise HTTPException(status_code=400, detail="File too large (max 10MB)")
-    
-    # Extract text
-    if file.content_type == "application/pdf":
-        file_text = extract_text_from_pdf(content)
-    else:
-        file_text = content.decode("utf-8")
+    # Extract text (PDFs are read through a memory map)
+    try:
+        file_text = await asyncio.to_thread(extract_text_from_file, path, file.content_type)
+    finally:
+        os.remove(path)
     
     if not file_text.strip():
         raise HTTPException(status_code=400, detail="Could not extract text from file")
@@ -327,14 +825,19 @@ async def send_message_with_file(
     except:
         user_id = 1
     
+    # Structured ESG figures for /esg/* analytics, off the response path
+    background_tasks.add_task(esg_store.ingest_report, user_id, file.filename, file_text)
+    
     # Create conversation if needed
     if conversation_id is None:
         conv = crud.create_conversation(db, user_id, f"File: {file.filename}")
         conversation_id = conv.id
+        capture.note_conversation(conversation_id, new=True)
     else:
         conv = crud.get_conversation(db, conversation_id)
         if not conv:
             raise HTTPException(status_code=404, detail="Conversation not found")
+        capture.note_conversation(conversation_id)
     
     # Get context
     user_message = f"Analyze this file: {file.filename}"
@@ -350,8 +853,13 @@ async def send_message_with_file(
         db, conversation_id, file_text
     )
     
-    # Call model
-    assistant_response = model_instance.predict(file_text, context)
+    # Call model (aborted if the client disconnects)
+    assistant_response = await predict_unless_disconnected(
+        request, file_text, context, user_id, metadata["total_tokens"]
+    )
+    if assistant_response is None:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    capture.note_chat(file_text, metadata["total_tokens"], assistant_response, model_instance.tokenizer)
     
     # Save user message with file
     user_msg = crud.create_message(
@@ -364,6 +872,7 @@ async def send_message_with_file(
     assistant_msg = crud.create_message(
         db, conversation_id, "assistant", assistant_response
     )
+    refresh_summary_later(background_tasks, metadata, conversation_id, user_id)
     
     conv = crud.get_conversation(db, conversation_id)
     
@@ -380,12 +889,235 @@ async def send_message_with_file(
         conversation_title=conv.title
     )
 
+# ============================================
+# WEBSOCKET CHAT
+# ============================================
+async def get_websocket_user_id(websocket: WebSocket) -> int:
+    db = database.SessionLocal()
+    try:
+        user = await auth.get_current_user(token=websocket.cookies.get(COOKIE_NAME), db=db)
+        return user.id
+    except Exception:
+        return 1  # Demo user fallback
+    finally:
+        db.close()
+
+@router.websocket("/ws/chat")
+async def websocket_chat(websocket: WebSocket):
+    """
+    Streaming chat over a WebSocket
+    
+    Several conversations can run at once over one connection. Frames are JSON:
+      client: {"type": "chat", "request_id": str, "message": str, "conversation_id": int | null, "adapter": str?}
+              {"type": "cancel", "request_id": str}
+      server: {"type": "start", "request_id", "conversation_id"}
+              {"type": "token", "request_id", "text"}
+              {"type": "done", "request_id", "conversation_id", "conversation_title", "message"}
+              {"type": "cancelled", "request_id"} | {"type": "error", "request_id", "detail"}
+    A cancel frame, or closing the socket, aborts the in-flight generation;
+    cancelled turns are not saved.
+    """
+    await websocket.accept()
+    user_id = await get_websocket_user_id(websocket)
+    loop = asyncio.get_running_loop()
+    outbox: asyncio.Queue = asyncio.Queue()
+    in_flight = {}  # request_id -> cancel event
+    tasks = set()
+    connected = True
+    
+    async def send_frames():
+        # Single writer: token callbacks from model threads all go through the outbox
+        while True:
+            frame = await outbox.get()
+            await websocket.send_json(frame)
+    
+    async def handle_chat(request_id: str, message: str, conversation_id: Optional[int], adapter: Optional[str]):
+        cancel_event = in_flight[request_id]
+        db = database.SessionLocal()
+        try:
+            conv = resolve_chat_conversation(db, user_id, conversation_id, message)
+            await outbox.put({"type": "start", "request_id": request_id, "conversation_id": conv.id})
+            
+            context, metadata = context_manager.get_conversation_context(db, conv.id, message)
+            
+            def on_token(text: str):
+                loop.call_soon_threadsafe(outbox.put_nowait, {"type": "token", "request_id": request_id, "text": text})
+            
+            try:
+                response = await run_model(
+                    message, context, user_id, metadata["total_tokens"],
+                    cancel_event=cancel_event, on_token=on_token, adapter=adapter
+                )
+            except AdmissionRejected as rejected:
+                await outbox.put({
+                    "type": "error", "request_id": request_id, "status": 429,
+                    "detail": too_many_requests(rejected).detail, "retry_after": rejected.retry_after
+                })
+                return
+            
+            if cancel_event.is_set():
+                reason = "client_cancel" if connected else "client_disconnect"
+                metrics.GENERATIONS_CANCELLED.labels(reason=reason).inc()
+                log_event(logger, "generation_cancelled", reason=reason, path="/ws/chat")
+                await outbox.put({"type": "cancelled", "request_id": request_id})
+                return
+            
+            crud.create_message(db, conv.id, "user", message)
+            assistant_msg = crud.create_message(db, conv.id, "assistant", response)
+            if metadata.get("summary_due"):
+                loop.run_in_executor(None, memory.refresh_summary, conv.id, user_id)
+            await outbox.put({
+                "type": "done",
+                "request_id": request_id,
+                "conversation_id": conv.id,
+                "conversation_title": conv.title,
+                "message": jsonable_encoder(message_response(assistant_msg)),
+            })
+        except Exception as e:
+            await outbox.put({"type": "error", "request_id": request_id, "detail": str(e)})
+        finally:
+            in_flight.pop(request_id, None)
+            db.close()
+    
+    sender = asyncio.create_task(send_frames())
+    try:
+        while True:
+            try:
+                frame = json.loads(await websocket.receive_text())
+                if not isinstance(frame, dict):
+                    raise ValueError("frame must be an object")
+            except ValueError:
+                await outbox.put({"type": "error", "request_id": None, "detail": "Invalid JSON frame"})
+                continue
+            
+            kind = frame.get("type")
+            request_id = str(frame.get("request_id") or uuid.uuid4().hex)
+            
+            if kind == "chat":
+                if model_instance is None or context_manager is None:
+                    await outbox.put({"type": "error", "request_id": request_id, "detail": "AI model is not available"})
+                elif not frame.get("message"):
+                    await outbox.put({"type": "error", "request_id": request_id, "detail": "Empty message"})
+                elif adapter_error(frame.get("adapter")):
+                    await outbox.put({"type": "error", "request_id": request_id, "detail": adapter_error(frame.get("adapter"))})
+                elif request_id in in_flight:
+                    await outbox.put({"type": "error", "request_id": request_id, "detail": "Duplicate request_id"})
+                else:
+                    in_flight[request_id] = threading.Event()
+                    task = asyncio.create_task(handle_chat(request_id, frame["message"], frame.get("conversation_id"), frame.get("adapter")))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            elif kind == "cancel":
+                cancel_event = in_flight.get(request_id)
+                if cancel_event is not None:
+                    cancel_event.set()
+            else:
+                await outbox.put({"type": "error", "request_id": request_id, "detail": f"Unknown frame type: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Client is gone: stop every generation still running for it
+        connected = False
+        for cancel_event in list(in_flight.values()):
+            cancel_event.set()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        sender.cancel()
+
+# ============================================
+# BACKGROUND FILE JOBS
+# ============================================
+def file_job_response(db: Session, job: models.FileJob) -> schemas.FileJobResponse:
+    message = None
+    if job.message_id is not None:
+        msg = db.query(models.Message).filter(models.Message.id == job.message_id).first()
+        if msg:
+            message = schemas.MessageResponse(
+                id=msg.id,
+                conversation_id=msg.conversation_id,
+                role=msg.role,
+                content=msg.content,
+                file_name=msg.file_name,
+                created_at=msg.created_at
+            )
+    return schemas.FileJobResponse(
+        id=job.id,
+        status=job.status,
+        stage=job.stage,
+        progress=job.progress,
+        conversation_id=job.conversation_id,
+        file_name=job.file_name,
+        error=job.error,
+        message=message,
+        created_at=job.created_at,
+        updated_at=job.updated_at
+    )
+
+@router.post("/chat/file/jobs", response_model=schemas.FileJobResponse, status_code=202)
+async def submit_file_job(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    conversation_id: Optional[int] = None,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Queue a file for background analysis
+    
+    Returns 202 with a job id immediately; poll GET /jobs/{job_id} for
+    progress. The assistant reply is written to the conversation when done.
+    """
+    file_path, _ = await spool_upload(file, jobs.upload_path(file.filename))
+    capture.note(file_bytes=os.path.getsize(file_path))
+    
+    try:
+        current_user = await get_current_user_from_cookie(request, db)
+        user_id = current_user.id
+    except:
+        user_id = 1
+    
+    if conversation_id is None:
+        conv = crud.create_conversation(db, user_id, f"File: {file.filename}")
+        conversation_id = conv.id
+        capture.note_conversation(conversation_id, new=True)
+    else:
+        conv = crud.get_conversation(db, conversation_id)
+        if not conv:
+            os.remove(file_path)
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        capture.note_conversation(conversation_id)
+    
+    job = crud.create_file_job(db, user_id, conversation_id, file.filename, file.content_type, file_path)
+    jobs.notify()
+    
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return file_job_response(db, job)
+
+@router.get("/jobs/{job_id}", response_model=schemas.FileJobResponse)
+async def get_file_job(
+    job_id: int,
+    request: Request,
+    db: Session = Depends(database.get_db)
+):
+    """Status and progress of a file analysis job"""
+    try:
+        current_user = await get_current_user_from_cookie(request, db)
+        user_id = current_user.id
+    except:
+        user_id = 1
+    
+    job = crud.get_file_job(db, job_id)
+    if not job or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return file_job_response(db, job)
+
 # ============================================
 # LEGACY COMPATIBILITY (for existing frontend)
 # ============================================
 @router.post("/predict")
 async def predict_legacy(
     request: Request,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(database.get_db)
 ):
     """
@@ -414,6 +1146,7 @@ async def predict_legacy(
     else:
         conv = crud.create_conversation(db, user_id, "Chat")
         conversation_id = conv.id
+    capture.note_conversation(conversation_id, new=not convs)
     
     # Verify model is loaded
     if model_instance is None or context_manager is None:
@@ -424,12 +1157,16 @@ async def predict_legacy(
         }
     
     # Get context and call model
-    context, _ = context_manager.get_conversation_context(db, conversation_id, message)
-    response = model_instance.predict(message, context)
+    context, metadata = context_manager.get_conversation_context(db, conversation_id, message)
+    response = await predict_unless_disconnected(request, message, context, user_id, metadata["total_tokens"])
+    if response is None:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    capture.note_chat(message, metadata["total_tokens"], response, model_instance.tokenizer)
     
     # Save messages
     crud.create_message(db, conversation_id, "user", message)
     crud.create_message(db, conversation_id, "assistant", response)
+    refresh_summary_later(background_tasks, metadata, conversation_id, user_id)
     
     return {"id": conversation_id, "input_text": message, "output_text": response}
 
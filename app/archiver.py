@@ -0,0 +1,76 @@
+"""
+Cold Storage Archiver
+A background thread that moves the messages of conversations inactive for
+ARCHIVE_AFTER_DAYS into messages_archive, keeping the hot messages table
+(and the page cache) down to recently used conversations. Archived
+conversations are rehydrated when reopened (crud.ensure_hot) and stay
+searchable and exportable meanwhile.
+
+Settings (environment):
+  ARCHIVE_AFTER_DAYS        - inactivity before archiving (default 30, 0 disables)
+  ARCHIVE_INTERVAL_SECONDS  - time between archival passes (default 3600)
+"""
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from app import crud, database, metrics
+from app.logger import get_logger, log_event
+
+logger = get_logger("archiver")
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+# Conversations archived per transaction batch; keeps write locks short
+ARCHIVE_BATCH = 100
+
+_stop = threading.Event()
+_thread = None
+
+
+def archive_inactive(after_days: float = ARCHIVE_AFTER_DAYS) -> int:
+    """Archive every conversation idle for after_days; returns how many were moved"""
+    older_than = datetime.now(timezone.utc) - timedelta(days=after_days)
+    archived = 0
+    db = database.SessionLocal()
+    try:
+        while not _stop.is_set():
+            conversation_ids = crud.find_inactive_conversations(db, older_than, ARCHIVE_BATCH)
+            if not conversation_ids:
+                break
+            for conversation_id in conversation_ids:
+                moved = crud.archive_conversation(db, conversation_id, older_than)
+                if moved:
+                    metrics.ARCHIVE_MOVES.labels(direction="archived").inc()
+                    metrics.ARCHIVE_MESSAGES.labels(direction="archived").inc(moved)
+                    archived += 1
+    finally:
+        db.close()
+    if archived:
+        log_event(logger, "conversations_archived", count=archived, older_than=older_than.isoformat())
+    return archived
+
+
+def _loop():
+    while not _stop.is_set():
+        try:
+            archive_inactive()
+        except Exception as e:
+            log_event(logger, "archive_error", error=str(e))
+        _stop.wait(ARCHIVE_INTERVAL_SECONDS)
+
+
+def start_archiver():
+    global _thread
+    if ARCHIVE_AFTER_DAYS <= 0:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="archiver", daemon=True)
+    _thread.start()
+
+
+def stop_archiver(timeout: float = 5):
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout)
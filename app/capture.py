@@ -0,0 +1,198 @@
+"""
+Traffic Capture
+Opt-in recording of the shape of real API traffic, one JSON line per
+request, for benchmarks.replay to re-issue against a test instance:
+
+  t, method, path (route template), status, latency_ms,
+  request_bytes, response_bytes, session, coalesced
+  + what handlers add with note_*(): conversation, new_conversation,
+    query_route, message_words, message_chars, prompt_tokens,
+    completion_tokens, file_bytes
+
+No message text, file contents, titles, emails or ids are written.
+Sessions (the auth cookie) and conversations are salted HMACs, so replay
+can keep a conversation's turns together and in order without the capture
+revealing whose they were. Sampling is per session, so sampled sessions
+are captured whole.
+
+The WebSocket chat is not captured (it is one long-lived connection, not
+a sequence of requests).
+
+Settings (environment):
+  CAPTURE_FILE        - JSONL file to append to (unset = capture off)
+  CAPTURE_SAMPLE_RATE - fraction of sessions captured (default 1.0)
+  CAPTURE_SALT        - HMAC key; set it to link sessions across restarts (default: random per process)
+"""
+import contextvars
+import hashlib
+import hmac
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from typing import Optional
+
+from app import routing
+from app.logger import get_logger, log_event
+
+logger = get_logger("capture")
+
+CAPTURE_FILE = os.getenv("CAPTURE_FILE", "")
+CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", "1.0"))
+CAPTURE_SALT = (os.getenv("CAPTURE_SALT") or secrets.token_hex(16)).encode("utf-8")
+
+# Not application traffic
+SKIP_PREFIXES = ("/metrics", "/docs", "/redoc", "/openapi.json", "/static")
+
+# Records waiting for the writer thread; past this they are dropped, never waited on
+QUEUE_SIZE = 10000
+
+_notes: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("capture_notes", default=None)
+
+
+def enabled() -> bool:
+    return bool(CAPTURE_FILE)
+
+
+def anonymize(kind: str, value) -> str:
+    """Stable, salted stand-in for an identifier (same value -> same hash within a salt)"""
+    digest = hmac.new(CAPTURE_SALT, f"{kind}:{value}".encode("utf-8"), hashlib.sha256)
+    return digest.hexdigest()[:16]
+
+
+def _sampled(session: str) -> bool:
+    if CAPTURE_SAMPLE_RATE >= 1:
+        return True
+    return int(session, 16) / 16 ** len(session) < CAPTURE_SAMPLE_RATE
+
+
+# ============================================
+# HANDLER ANNOTATIONS
+# ============================================
+def capturing() -> bool:
+    """Whether the current request is being recorded (skip extra work otherwise)"""
+    return _notes.get() is not None
+
+
+def note(**fields):
+    """Add fields to the current request's record (no-op outside a captured request)"""
+    notes = _notes.get()
+    if notes is not None:
+        notes.update(fields)
+
+
+def note_conversation(conversation_id: int, new: bool = False):
+    note(conversation=anonymize("conversation", conversation_id), new_conversation=new)
+
+
+def note_chat(message: str, prompt_tokens: int, reply: str, tokenizer):
+    """Size and route of one model turn; only the lengths are kept"""
+    if not capturing():
+        return
+    note(
+        query_route=routing.classify(message),
+        message_words=len(message.split()),
+        message_chars=len(message),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=len(tokenizer.encode(reply)),
+    )
+
+
+# ============================================
+# WRITER
+# ============================================
+class CaptureWriter:
+    """Appends records from a queue on a background thread so requests never wait on disk"""
+    def __init__(self, path: str):
+        self.path = path
+        self.queue: "queue.Queue[dict]" = queue.Queue(maxsize=QUEUE_SIZE)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, record: dict):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                log_event(logger, "capture_dropped", dropped=self.dropped)
+
+    def _run(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                record = self.queue.get()
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+                # Write out a burst before flushing
+                while True:
+                    try:
+                        record = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    f.write(json.dumps(record, separators=(",", ":")) + "\n")
+                f.flush()
+
+
+_writer: Optional[CaptureWriter] = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer() -> CaptureWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = CaptureWriter(CAPTURE_FILE)
+                log_event(logger, "capture_started", path=CAPTURE_FILE, sample_rate=CAPTURE_SAMPLE_RATE)
+    return _writer
+
+
+# ============================================
+# MIDDLEWARE
+# ============================================
+async def capture_middleware(request, call_next):
+    """Record the anonymized shape of each request when CAPTURE_FILE is set"""
+    if not CAPTURE_FILE or request.url.path.startswith(SKIP_PREFIXES):
+        return await call_next(request)
+
+    # Logged-out clients share the demo user; tell them apart by address
+    cookie = request.cookies.get("access_token")
+    session = anonymize("session", cookie or (request.client.host if request.client else ""))
+    if not _sampled(session):
+        return await call_next(request)
+
+    notes = {}
+    token = _notes.set(notes)
+    started = time.time()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _notes.reset(token)
+    latency_ms = (time.perf_counter() - start) * 1000
+
+    # Template, not the concrete path: /conversations/{conversation_id}
+    route = request.scope.get("route")
+    if "conversation_id" in request.path_params and "conversation" not in notes:
+        notes["conversation"] = anonymize("conversation", request.path_params["conversation_id"])
+
+    record = {
+        "t": round(started, 3),
+        "method": request.method,
+        "path": getattr(route, "path", request.url.path),
+        "status": response.status_code,
+        "latency_ms": round(latency_ms, 2),
+        "request_bytes": int(request.headers.get("content-length") or 0),
+        "response_bytes": int(response.headers.get("content-length") or 0),
+        "session": session,
+    }
+    if response.headers.get("x-coalesced"):
+        record["coalesced"] = response.headers["x-coalesced"]
+    record.update(notes)
+    _get_writer().put(record)
+    return response
@@ -0,0 +1,103 @@
+"""
+Chat Template Prompt Assembly
+Builds prompts for the local Qwen models directly as token ids, in the
+ChatML format of Qwen's chat template:
+
+  <|im_start|>system\\n{route instructions}<|im_end|>\\n
+  <|im_start|>system\\n{conversation summary}<|im_end|>\\n      (when there is one)
+  <|im_start|>user\\n...<|im_end|>\\n                          (history turns)
+  <|im_start|>assistant\\n...<|im_end|>\\n
+  <|im_start|>user\\n{message}<|im_end|>\\n
+  <|im_start|>assistant\\n
+
+The tokenizer splits text at special tokens before encoding it, so each
+turn tokenizes on its own: concatenating per-turn ids gives exactly the ids
+of the rendered template. A message's turn is therefore encoded once
+(TokenContextManager caches it) and reused in every later prompt, and the
+prompt length known while budgeting the context is the length generated
+from.
+"""
+from typing import Dict, List, Optional
+
+from app import routing
+
+IM_START = "<|im_start|>"
+IM_END = "<|im_end|>"
+
+
+class ChatContext(str):
+    """
+    Conversation context as text (for engines that take string prompts)
+    that also carries the same parts as chat-template token ids
+
+    turn_ids holds the summary turn (if any) and the history turns, oldest
+    first; query_ids is the turn of query, the message the context was
+    built for.
+    """
+    def __new__(cls, text: str, query: str = "", query_ids: Optional[List[int]] = None, turn_ids: Optional[List] = None):
+        context = super().__new__(cls, text)
+        context.query = query
+        context.query_ids = query_ids
+        context.turn_ids = turn_ids
+        return context
+
+
+class ChatTemplate:
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.im_start = tokenizer.convert_tokens_to_ids(IM_START)
+        self.im_end = tokenizer.convert_tokens_to_ids(IM_END)
+        self.newline = self._encode("\n")
+        self.generation_prompt = [self.im_start] + self._encode("assistant\n")
+        self._system: Dict[str, List[int]] = {}
+
+    @classmethod
+    def for_tokenizer(cls, tokenizer) -> Optional["ChatTemplate"]:
+        """Template for tokenizers with the ChatML special tokens; None for the stub / LM Studio estimates"""
+        convert = getattr(tokenizer, "convert_tokens_to_ids", None)
+        if convert is None:
+            return None
+        unknown = getattr(tokenizer, "unk_token_id", None)
+        for token in (IM_START, IM_END):
+            token_id = convert(token)
+            if token_id is None or token_id == unknown:
+                return None
+        return cls(tokenizer)
+
+    def _encode(self, text: str) -> List[int]:
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def turn(self, role: str, content: str) -> List[int]:
+        """Ids of one <|im_start|>role ... <|im_end|> turn"""
+        return [self.im_start] + self._encode(f"{role}\n{content}") + [self.im_end] + self.newline
+
+    def system(self, route: str) -> List[int]:
+        """The route's instruction turn (encoded once per route)"""
+        if route not in self._system:
+            self._system[route] = self.turn("system", routing.ROUTE_INSTRUCTIONS[route])
+        return self._system[route]
+
+    def prompt_ids(self, route: str, message: str, context: str = "") -> List[int]:
+        """
+        Full prompt ids for message
+
+        A ChatContext built for this message contributes its cached ids;
+        plain-text context (e.g. from the remote engine's socket or the
+        summary refresh) becomes one extra system turn.
+        """
+        ids = list(self.system(route))
+        query_ids = None
+        if isinstance(context, ChatContext) and context.turn_ids is not None:
+            for turn_ids in context.turn_ids:
+                ids.extend(turn_ids)
+            if context.query == message:
+                query_ids = context.query_ids
+        elif context and context.strip():
+            ids.extend(self.turn("system", context.strip()))
+        ids.extend(query_ids if query_ids is not None else self.turn("user", message))
+        ids.extend(self.generation_prompt)
+        return ids
+
+    def overhead(self, route: str) -> int:
+        """Prompt tokens outside the conversation: instructions and the assistant header"""
+        return len(self.system(route)) + len(self.generation_prompt)
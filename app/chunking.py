@@ -0,0 +1,69 @@
+"""
+Text Chunking
+Splits extracted document text into pieces of at most max_tokens tokens
+for storage, packing whole lines together and only breaking inside a line
+(at word boundaries) when a single line is over the limit.
+
+Token counts are the sum of the per-line counts, which can be a token or
+two off from encoding the joined chunk in one go.
+"""
+from typing import List, Tuple
+
+CHUNK_TOKENS = 512
+
+
+def _split_long_line(line: str, line_tokens: int, tokenizer, max_tokens: int) -> List[Tuple[str, int]]:
+    words = line.split()
+    # Words per chunk at the line's average tokens per word; shrunk below when a window doesn't fit
+    window = max(1, len(words) * max_tokens // line_tokens)
+    pieces = []
+    start = 0
+    while start < len(words):
+        end = min(len(words), start + window)
+        piece = " ".join(words[start:end])
+        tokens = len(tokenizer.encode(piece))
+        while tokens > max_tokens and end - start > 1:
+            end = start + max(1, (end - start) * 3 // 4)
+            piece = " ".join(words[start:end])
+            tokens = len(tokenizer.encode(piece))
+        pieces.append((piece, tokens))
+        start = end
+    return pieces
+
+
+def chunk_text(text: str, tokenizer, max_tokens: int = CHUNK_TOKENS) -> List[Tuple[str, int]]:
+    """
+    Split text into chunks of at most max_tokens tokens
+
+    Args:
+        text: Extracted document text
+        tokenizer: Anything with encode(text) -> list (the engines' tokenizers)
+        max_tokens: Chunk size limit
+
+    Returns:
+        List of (chunk text, token count) in document order
+    """
+    chunks = []
+    lines, line_tokens = [], 0
+
+    def flush():
+        nonlocal lines, line_tokens
+        if lines:
+            chunks.append(("\n".join(lines), line_tokens))
+        lines, line_tokens = [], 0
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        tokens = len(tokenizer.encode(line))
+        if tokens > max_tokens:
+            flush()
+            chunks.extend(_split_long_line(line, tokens, tokenizer, max_tokens))
+            continue
+        if line_tokens + tokens > max_tokens:
+            flush()
+        lines.append(line)
+        line_tokens += tokens
+    flush()
+    return chunks
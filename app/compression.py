@@ -0,0 +1,76 @@
+"""
+Transparent Text Compression
+CompressedText stores large text values as zstd (or zlib when zstandard is
+not installed) behind a short magic prefix. Reads accept compressed values
+from either codec and legacy plaintext rows, so existing databases keep
+working and rows are compressed as they are rewritten or archived.
+
+Only SQLite stores the compressed bytes; Postgres already compresses large
+TEXT values itself (TOAST), so there values are passed through as text.
+"""
+import threading
+import zlib
+
+from sqlalchemy.types import Text, TypeDecorator
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB_MAGIC = b"\x01zl"
+ZSTD_MAGIC = b"\x01zs"
+
+# Short values (most chat turns) stay plaintext: compression wouldn't pay off
+COMPRESS_MIN_CHARS = 512
+
+# zstd contexts aren't safe to share between threads
+_local = threading.local()
+
+
+def _zstd(kind: str):
+    codec = getattr(_local, kind, None)
+    if codec is None:
+        codec = zstandard.ZstdCompressor(level=6) if kind == "compressor" else zstandard.ZstdDecompressor()
+        setattr(_local, kind, codec)
+    return codec
+
+
+def compress_text(value: str) -> bytes:
+    data = value.encode("utf-8")
+    if zstandard is not None:
+        return ZSTD_MAGIC + _zstd("compressor").compress(data)
+    return ZLIB_MAGIC + zlib.compress(data, 6)
+
+
+def decompress_value(value):
+    """Plain text for a stored value: compressed bytes, legacy plaintext or None"""
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    value = bytes(value)
+    if value.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed value found but zstandard is not installed")
+        return _zstd("decompressor").decompress(value[len(ZSTD_MAGIC):]).decode("utf-8")
+    if value.startswith(ZLIB_MAGIC):
+        return zlib.decompress(value[len(ZLIB_MAGIC):]).decode("utf-8")
+    return value.decode("utf-8")
+
+
+class CompressedText(TypeDecorator):
+    """Text column compressed on write (SQLite, values over COMPRESS_MIN_CHARS)"""
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "sqlite" or len(value) < COMPRESS_MIN_CHARS:
+            return value
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress_value(value)
+
+
+def register_sqlite_functions(dbapi_connection):
+    """finesg_decompress(value) for SQL that reads compressed columns (search index)"""
+    dbapi_connection.create_function("finesg_decompress", 1, decompress_value, deterministic=True)
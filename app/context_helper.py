@@ -1,71 +1,169 @@
 """
 Token-based Context Manager
-Implements 1200 token sliding window for conversation context
+Implements 1200 token sliding window for conversation context, plus a
+rolling summary of the turns older than the window (see app.memory)
+
+With a tokenizer that has Qwen's chat template (hf / onnx / remote), every
+message is counted as its chat-template turn, whose token ids are cached
+per message, and the context also carries those ids (ChatContext) so the
+HF engine builds the prompt without re-tokenizing the history. Budgets
+then cover the exact prompt: instructions, summary, history, query and
+the assistant header.
+
+Settings (environment):
+  SUMMARY_RECENT_TOKENS      - history kept verbatim (default 768)
+  SUMMARY_BATCH_TOKENS       - aged-out tokens that trigger a summary refresh (default 256)
+  MESSAGE_TOKEN_CACHE_SIZE   - messages whose token ids are cached (default 20000)
 """
-from typing import List, Tuple
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 from sqlalchemy.orm import Session
-from app import models
+from app import models, metrics, routing, tracing
+from app.chat_template import ChatContext, ChatTemplate
+
+# Raw turns kept verbatim; older ones are folded into the conversation summary
+SUMMARY_RECENT_TOKENS = int(os.getenv("SUMMARY_RECENT_TOKENS", "768"))
+# Refresh the summary once this many tokens have aged out of the recent window
+SUMMARY_BATCH_TOKENS = int(os.getenv("SUMMARY_BATCH_TOKENS", "256"))
+# Messages never change once written, so their token ids are cached by identity
+MESSAGE_TOKEN_CACHE_SIZE = int(os.getenv("MESSAGE_TOKEN_CACHE_SIZE", "20000"))
 
 class TokenContextManager:
-    def __init__(self, tokenizer, max_context_tokens: int = 1200):
+    def __init__(self, tokenizer, max_context_tokens: int = 1200, recent_tokens: int = SUMMARY_RECENT_TOKENS):
         """
         Initialize context manager with token limit
         
         Args:
             tokenizer: HuggingFace tokenizer instance
             max_context_tokens: Maximum tokens for context window (default: 1200)
+            recent_tokens: History tokens kept verbatim before turns are summarized
         """
         self.tokenizer = tokenizer
         self.max_context_tokens = max_context_tokens
+        self.recent_tokens = recent_tokens
+        self.template = ChatTemplate.for_tokenizer(tokenizer)
+        self._message_ids: "OrderedDict[tuple, array]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def format_message(message: models.Message) -> str:
+        return f"{message.role.capitalize()}: {message.content}\n"
+    
+    def message_ids(self, message: models.Message) -> array:
+        """Token ids of a message's turn (chat template, else the plain-text line), tokenized once"""
+        # created_at too: SQLite may hand a deleted message's id to a new one
+        key = (message.id, message.created_at)
+        with self._lock:
+            ids = self._message_ids.get(key)
+            if ids is not None:
+                self._message_ids.move_to_end(key)
+        metrics.record_cache("message_tokens", ids is not None)
+        if ids is not None:
+            return ids
+        
+        if self.template is not None:
+            ids = array("i", self.template.turn(message.role, message.content))
+        else:
+            ids = array("i", self.tokenizer.encode(self.format_message(message)))
+        with self._lock:
+            self._message_ids[key] = ids
+            while len(self._message_ids) > MESSAGE_TOKEN_CACHE_SIZE:
+                self._message_ids.popitem(last=False)
+        return ids
+    
+    def message_tokens(self, message: models.Message) -> int:
+        return len(self.message_ids(message))
+    
+    def split_for_summary(
+        self,
+        messages: List[models.Message],
+        summary_until_id: Optional[int] = None
+    ) -> Tuple[List[models.Message], int]:
+        """
+        Find the unsummarized messages that fell out of the recent window
+        
+        Returns:
+            Tuple of (older messages in chronological order, their token count)
+        """
+        unsummarized = [m for m in messages if summary_until_id is None or m.id > summary_until_id]
+        recent = 0
+        for index in range(len(unsummarized) - 1, -1, -1):
+            recent += self.message_tokens(unsummarized[index])
+            if recent > self.recent_tokens:
+                older = unsummarized[:index + 1]
+                return older, sum(self.message_tokens(m) for m in older)
+        return [], 0
     
     def build_context_from_messages(
         self,
         messages: List[models.Message],
-        current_query: str = ""
+        current_query: str = "",
+        summary: Optional[str] = None
     ) -> Tuple[str, dict]:
         """
         Build conversation context that fits within token limit
         
         Args:
-            messages: List of Message objects from database (chronological order)
+            messages: List of Message objects from database (chronological order),
+                without the ones already covered by summary
             current_query: The new user message
+            summary: Rolling summary of the earlier conversation, if any
         
         Returns:
-            Tuple of (context_string, metadata_dict)
+            Tuple of (context_string, metadata_dict); with a chat template
+            the string is a ChatContext carrying the prompt's token ids
         """
-        # Start with current query
-        current_tokens = len(self.tokenizer.encode(current_query))
-        remaining_tokens = self.max_context_tokens - current_tokens
+        # Start with current query (and the summary, which is always kept)
+        summary_text = f"Summary of earlier conversation:\n{summary}\n\n" if summary else ""
+        if self.template is not None:
+            query_ids = self.template.turn("user", current_query)
+            summary_ids = self.template.turn("system", summary_text.strip()) if summary_text else []
+            current_tokens = len(query_ids)
+            summary_tokens = len(summary_ids)
+            # Instructions and assistant header are part of the prompt too
+            overhead_tokens = self.template.overhead(routing.classify(current_query))
+        else:
+            current_tokens = len(self.tokenizer.encode(current_query))
+            summary_tokens = len(self.tokenizer.encode(summary_text)) if summary_text else 0
+            overhead_tokens = 0
+        remaining_tokens = self.max_context_tokens - current_tokens - summary_tokens - overhead_tokens
         
         # Build context from most recent messages backwards
         context_messages = []
         total_context_tokens = 0
-        messages_included = 0
         was_truncated = False
         
         # Go backwards through messages
         for message in reversed(messages):
-            message_text = f"{message.role.capitalize()}: {message.content}\n"
-            message_tokens = len(self.tokenizer.encode(message_text))
+            message_ids = self.message_ids(message)
             
-            if total_context_tokens + message_tokens <= remaining_tokens:
-                context_messages.insert(0, message_text)  # Insert at beginning to maintain order
-                total_context_tokens += message_tokens
-                messages_included += 1
+            if total_context_tokens + len(message_ids) <= remaining_tokens:
+                context_messages.append((message, message_ids))
+                total_context_tokens += len(message_ids)
             else:
                 was_truncated = True
                 break
+        context_messages.reverse()  # back to chronological order
+        messages_included = len(context_messages)
         
         # Build final context string
-        context_string = ""
+        context_string = summary_text
         if context_messages:
-            context_string = "Previous conversation:\n" + "".join(context_messages) + "\n"
+            context_string += "Previous conversation:\n" + "".join(self.format_message(m) for m, _ in context_messages) + "\n"
+        if self.template is not None:
+            turn_ids = ([summary_ids] if summary_ids else []) + [ids for _, ids in context_messages]
+            context_string = ChatContext(context_string, current_query, query_ids, turn_ids)
         
         metadata = {
             "messages_included": messages_included,
-            "context_tokens": total_context_tokens,
+            "context_tokens": total_context_tokens + summary_tokens,
+            "summary_tokens": summary_tokens,
             "current_query_tokens": current_tokens,
-            "total_tokens": total_context_tokens + current_tokens,
+            "total_tokens": total_context_tokens + summary_tokens + current_tokens + overhead_tokens,
             "was_truncated": was_truncated,
             "max_tokens": self.max_context_tokens
         }
@@ -89,10 +187,25 @@ class TokenContextManager:
         Returns:
             Tuple of (context_string, metadata_dict)
         """
-        from app.crud import get_conversation_messages
+        from app.crud import ensure_hot, get_conversation, get_conversation_messages
         
-        # Get all messages from conversation
-        messages = get_conversation_messages(db, conversation_id)
+        start = time.perf_counter()
         
-        # Build context within token limit
-        return self.build_context_from_messages(messages, current_query)
+        with tracing.span("context"):
+            # Reopened conversations come back from cold storage first
+            conversation = ensure_hot(db, get_conversation(db, conversation_id))
+            summary = conversation.summary if conversation else None
+            summary_until_id = conversation.summary_until_id if conversation else None
+            
+            # Get the messages not yet covered by the summary
+            messages = get_conversation_messages(db, conversation_id, after_id=summary_until_id)
+            
+            # Build context within token limit
+            context_string, metadata = self.build_context_from_messages(messages, current_query, summary)
+            
+            # Tokens that aged out of the recent window since the last summary
+            _, older_tokens = self.split_for_summary(messages)
+            metadata["summary_due"] = older_tokens >= SUMMARY_BATCH_TOKENS
+        
+        metrics.record_context(time.perf_counter() - start, metadata)
+        return context_string, metadata
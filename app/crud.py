@@ -1,14 +1,17 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from app import models, schemas, auth
+from sqlalchemy import delete, desc, func, insert, select, text
+from app import models, schemas, auth, metrics, search, sidebar_cache
 from typing import List, Optional
+from datetime import datetime, timezone
 
 # ============================================
 # USER CRUD
 # ============================================
+@metrics.timed_db
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
+@metrics.timed_db
 def create_user(db: Session, user: schemas.UserCreate):
     hashed_password = auth.get_password_hash(user.password)
     db_user = models.User(email=user.email, hashed_password=hashed_password)
@@ -20,6 +23,7 @@ def create_user(db: Session, user: schemas.UserCreate):
 # ============================================
 # CONVERSATION CRUD
 # ============================================
+@metrics.timed_db
 def create_conversation(db: Session, user_id: int, title: str = "New Chat") -> models.Conversation:
     """Create a new conversation for a user"""
     conversation = models.Conversation(
@@ -29,12 +33,15 @@ def create_conversation(db: Session, user_id: int, title: str = "New Chat") -> m
     db.add(conversation)
     db.commit()
     db.refresh(conversation)
+    sidebar_cache.conversation_created(conversation)
     return conversation
 
+@metrics.timed_db
 def get_conversation(db: Session, conversation_id: int) -> Optional[models.Conversation]:
     """Get a conversation by ID"""
     return db.query(models.Conversation).filter(models.Conversation.id == conversation_id).first()
 
+@metrics.timed_db
 def get_user_conversations(db: Session, user_id: int, limit: int = 50) -> List[models.Conversation]:
     """Get all conversations for a user"""
     return (
@@ -45,18 +52,70 @@ def get_user_conversations(db: Session, user_id: int, limit: int = 50) -> List[m
         .all()
     )
 
+@metrics.timed_db
+def get_user_conversation_rows(db: Session, user_id: int, limit: int = 50) -> list:
+    """Conversation list as row tuples with message counts, in one query (no ORM objects)"""
+    hot_count = (
+        db.query(func.count(models.Message.id))
+        .filter(models.Message.conversation_id == models.Conversation.id)
+        .correlate(models.Conversation)
+        .scalar_subquery()
+    )
+    cold_count = (
+        db.query(func.count(models.MessageArchive.id))
+        .filter(models.MessageArchive.conversation_id == models.Conversation.id)
+        .correlate(models.Conversation)
+        .scalar_subquery()
+    )
+    # Archived conversations only pay for the second (indexed) count
+    message_count = hot_count + func.coalesce(cold_count, 0)
+    return (
+        db.query(
+            models.Conversation.id,
+            models.Conversation.user_id,
+            models.Conversation.title,
+            models.Conversation.created_at,
+            models.Conversation.updated_at,
+            message_count.label("message_count")
+        )
+        .filter(models.Conversation.user_id == user_id)
+        .order_by(desc(models.Conversation.updated_at))
+        .limit(limit)
+        .all()
+    )
+
+@metrics.timed_db
 def delete_conversation(db: Session, conversation_id: int):
     """Delete a conversation and all its messages"""
     conversation = get_conversation(db, conversation_id)
     if conversation:
+        db.query(models.MessageArchive).filter(
+            models.MessageArchive.conversation_id == conversation_id
+        ).delete(synchronize_session=False)
+        user_id = conversation.user_id
         db.delete(conversation)
         db.commit()
+        sidebar_cache.conversation_deleted(user_id, conversation_id)
         return True
     return False
 
+@metrics.timed_db
+def update_conversation_summary(db: Session, conversation_id: int, summary: str, until_message_id: int):
+    """Store the rolling summary and the last message it covers (keeps updated_at as is)"""
+    db.query(models.Conversation).filter(models.Conversation.id == conversation_id).update(
+        {
+            models.Conversation.summary: summary,
+            models.Conversation.summary_until_id: until_message_id,
+            models.Conversation.updated_at: models.Conversation.updated_at,
+        },
+        synchronize_session=False
+    )
+    db.commit()
+
 # ============================================
 # MESSAGE CRUD
 # ============================================
+@metrics.timed_db
 def create_message(
     db: Session,
     conversation_id: int,
@@ -77,32 +136,56 @@ def create_message(
     db.commit()
     db.refresh(message)
     
-    # Update conversation's updated_at timestamp
+    # Update conversation's updated_at timestamp and message high-water mark
     conversation = get_conversation(db, conversation_id)
     if conversation:
-        from datetime import datetime, timezone
         conversation.updated_at = datetime.now(timezone.utc)
+        conversation.last_message_id = message.id
         db.commit()
+        sidebar_cache.message_created(conversation.user_id, conversation_id, conversation.updated_at)
     
     return message
 
+@metrics.timed_db
 def get_conversation_messages(
     db: Session,
     conversation_id: int,
-    limit: Optional[int] = None
+    limit: Optional[int] = None,
+    after_id: Optional[int] = None
 ) -> List[models.Message]:
-    """Get all messages in a conversation"""
+    """Get all messages in a conversation (optionally only those after message after_id)"""
     query = (
         db.query(models.Message)
         .filter(models.Message.conversation_id == conversation_id)
         .order_by(models.Message.created_at)
     )
     
+    if after_id is not None:
+        query = query.filter(models.Message.id > after_id)
+    
     if limit:
         query = query.limit(limit)
     
     return query.all()
 
+@metrics.timed_db
+def get_conversation_message_rows(db: Session, conversation_id: int) -> list:
+    """Messages of a conversation as row tuples, without the stored file text"""
+    return (
+        db.query(
+            models.Message.id,
+            models.Message.conversation_id,
+            models.Message.role,
+            models.Message.content,
+            models.Message.file_name,
+            models.Message.created_at
+        )
+        .filter(models.Message.conversation_id == conversation_id)
+        .order_by(models.Message.created_at)
+        .all()
+    )
+
+@metrics.timed_db
 def get_recent_messages(
     db: Session,
     conversation_id: int,
@@ -116,3 +199,412 @@ def get_recent_messages(
         .limit(limit)
         .all()
     )[::-1]  # Reverse to chronological order
+
+# ============================================
+# FILE JOB CRUD
+# ============================================
+@metrics.timed_db
+def create_file_job(
+    db: Session,
+    user_id: int,
+    conversation_id: int,
+    file_name: str,
+    content_type: str,
+    file_path: str
+) -> models.FileJob:
+    """Queue a file analysis job"""
+    job = models.FileJob(
+        user_id=user_id,
+        conversation_id=conversation_id,
+        file_name=file_name,
+        content_type=content_type,
+        file_path=file_path
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+@metrics.timed_db
+def get_file_job(db: Session, job_id: int) -> Optional[models.FileJob]:
+    return db.query(models.FileJob).filter(models.FileJob.id == job_id).first()
+
+@metrics.timed_db
+def claim_next_file_job(db: Session) -> Optional[models.FileJob]:
+    """
+    Atomically move the oldest queued job to running
+
+    The conditional UPDATE makes this safe with several workers or processes:
+    only one of them sees rowcount == 1 for a given job.
+    """
+    while True:
+        candidate = (
+            db.query(models.FileJob.id)
+            .filter(models.FileJob.status == "queued")
+            .order_by(models.FileJob.id)
+            .first()
+        )
+        if candidate is None:
+            return None
+        claimed = (
+            db.query(models.FileJob)
+            .filter(models.FileJob.id == candidate.id, models.FileJob.status == "queued")
+            .update({
+                models.FileJob.status: "running",
+                models.FileJob.stage: "starting",
+                models.FileJob.attempts: models.FileJob.attempts + 1,
+                models.FileJob.updated_at: datetime.now(timezone.utc)
+            }, synchronize_session=False)
+        )
+        db.commit()
+        if claimed:
+            return get_file_job(db, candidate.id)
+
+@metrics.timed_db
+def update_file_job(db: Session, job: models.FileJob, **fields) -> models.FileJob:
+    """Update status/stage/progress/error/message_id of a job"""
+    for key, value in fields.items():
+        setattr(job, key, value)
+    db.commit()
+    return job
+
+@metrics.timed_db
+def complete_file_job(
+    db: Session,
+    job: models.FileJob,
+    user_content: str,
+    assistant_content: str,
+    file_content: Optional[str] = None
+) -> models.Message:
+    """
+    Write a job's user/assistant message pair and mark it done in one transaction
+
+    A failure anywhere rolls back both messages with the status change, so the
+    retry of a requeued job can't add the pair to the conversation twice.
+    """
+    user_message = models.Message(
+        conversation_id=job.conversation_id,
+        role="user",
+        content=user_content,
+        file_name=job.file_name,
+        file_content=file_content
+    )
+    db.add(user_message)
+    db.flush()
+    assistant_message = models.Message(conversation_id=job.conversation_id, role="assistant", content=assistant_content)
+    db.add(assistant_message)
+    db.flush()
+
+    conversation = get_conversation(db, job.conversation_id)
+    if conversation:
+        conversation.updated_at = datetime.now(timezone.utc)
+        conversation.last_message_id = assistant_message.id
+    job.status = "done"
+    job.stage = "done"
+    job.progress = 100
+    job.message_id = assistant_message.id
+    job.error = None
+    db.commit()
+
+    if conversation:
+        sidebar_cache.message_created(conversation.user_id, job.conversation_id, conversation.updated_at)
+    return assistant_message
+
+@metrics.timed_db
+def count_file_jobs(db: Session, status: str) -> int:
+    return db.query(models.FileJob).filter(models.FileJob.status == status).count()
+
+@metrics.timed_db
+def requeue_stale_file_jobs(db: Session, older_than: datetime) -> int:
+    """Put running jobs whose worker died (no update since older_than) back in the queue"""
+    count = (
+        db.query(models.FileJob)
+        .filter(models.FileJob.status == "running", models.FileJob.updated_at < older_than)
+        .update({models.FileJob.status: "queued", models.FileJob.stage: "queued"}, synchronize_session=False)
+    )
+    db.commit()
+    return count
+
+# ============================================
+# ARCHIVE CRUD
+# ============================================
+ARCHIVE_COLUMNS = ("id", "conversation_id", "role", "content", "file_name", "file_content", "created_at")
+
+def _move_messages(db: Session, source, target, conversation_id: int) -> int:
+    """Copy a conversation's rows as stored (already compressed) and delete the originals"""
+    db.execute(
+        insert(target).from_select(
+            ARCHIVE_COLUMNS,
+            select(*[source.c[name] for name in ARCHIVE_COLUMNS]).where(source.c.conversation_id == conversation_id)
+        )
+    )
+    return db.execute(delete(source).where(source.c.conversation_id == conversation_id)).rowcount
+
+@metrics.timed_db
+def find_inactive_conversations(db: Session, older_than: datetime, limit: int = 100) -> List[int]:
+    """
+    Ids of conversations not updated since older_than and not archived yet
+    (skipping those with a file job still queued or running, which will add messages)
+    """
+    has_active_jobs = (
+        db.query(models.FileJob.id)
+        .filter(
+            models.FileJob.conversation_id == models.Conversation.id,
+            models.FileJob.status.in_(("queued", "running"))
+        )
+        .exists()
+    )
+    rows = (
+        db.query(models.Conversation.id)
+        .filter(
+            models.Conversation.archived_at.is_(None),
+            models.Conversation.updated_at < older_than,
+            ~has_active_jobs
+        )
+        .order_by(models.Conversation.updated_at)
+        .limit(limit)
+        .all()
+    )
+    return [row.id for row in rows]
+
+@metrics.timed_db
+def archive_conversation(db: Session, conversation_id: int, older_than: datetime) -> int:
+    """
+    Move an inactive conversation's messages to messages_archive
+
+    The conditional UPDATE claims the conversation, so one that received a
+    message in the meantime (or is already archived) is left alone.
+    Finished file jobs lose their message_id link, whose foreign key
+    would otherwise block deleting the hot rows.
+    Returns the number of messages moved.
+    """
+    claimed = db.query(models.Conversation).filter(
+        models.Conversation.id == conversation_id,
+        models.Conversation.archived_at.is_(None),
+        models.Conversation.updated_at < older_than
+    ).update(
+        {
+            models.Conversation.archived_at: datetime.now(timezone.utc),
+            models.Conversation.updated_at: models.Conversation.updated_at,
+        },
+        synchronize_session=False
+    )
+    if not claimed:
+        db.rollback()
+        return 0
+    db.query(models.FileJob).filter(
+        models.FileJob.conversation_id == conversation_id,
+        models.FileJob.message_id.isnot(None)
+    ).update(
+        {models.FileJob.message_id: None, models.FileJob.updated_at: models.FileJob.updated_at},
+        synchronize_session=False
+    )
+    moved = _move_messages(db, models.Message.__table__, models.MessageArchive.__table__, conversation_id)
+    db.commit()
+    return moved
+
+@metrics.timed_db
+def rehydrate_conversation(db: Session, conversation_id: int) -> int:
+    """Move an archived conversation's messages back to the hot table; returns how many"""
+    claimed = db.query(models.Conversation).filter(
+        models.Conversation.id == conversation_id,
+        models.Conversation.archived_at.isnot(None)
+    ).update(
+        {
+            models.Conversation.archived_at: None,
+            models.Conversation.updated_at: models.Conversation.updated_at,
+        },
+        synchronize_session=False
+    )
+    if not claimed:
+        db.rollback()
+        return 0  # not archived, or another request already brought it back
+    moved = _move_messages(db, models.MessageArchive.__table__, models.Message.__table__, conversation_id)
+    db.commit()
+    return moved
+
+def ensure_hot(db: Session, conversation: models.Conversation) -> models.Conversation:
+    """Bring an archived conversation's messages back before they are read"""
+    if conversation is not None and conversation.archived_at is not None:
+        moved = rehydrate_conversation(db, conversation.id)
+        if moved:
+            metrics.ARCHIVE_MOVES.labels(direction="rehydrated").inc()
+            metrics.ARCHIVE_MESSAGES.labels(direction="rehydrated").inc(moved)
+        db.refresh(conversation)
+    return conversation
+
+# ============================================
+# EXPORT / IMPORT CRUD
+# ============================================
+EXPORT_CONVERSATION_COLUMNS = ("id", "user_id", "title", "summary", "summary_until_id", "created_at", "updated_at")
+EXPORT_MESSAGE_COLUMNS = ("id", "conversation_id", "role", "content", "file_name", "file_content", "created_at")
+
+def iter_conversation_rows(db: Session, user_id: Optional[int] = None, batch_size: int = 1000):
+    """Stream conversation rows (tuples of EXPORT_CONVERSATION_COLUMNS) with a server-side cursor"""
+    columns = [getattr(models.Conversation, name) for name in EXPORT_CONVERSATION_COLUMNS]
+    query = db.query(*columns).order_by(models.Conversation.id)
+    if user_id is not None:
+        query = query.filter(models.Conversation.user_id == user_id)
+    return query.yield_per(batch_size)
+
+def iter_message_rows(db: Session, user_id: Optional[int] = None, batch_size: int = 1000, model=models.Message):
+    """Stream message rows (tuples of EXPORT_MESSAGE_COLUMNS) grouped by conversation; model=MessageArchive for cold ones"""
+    columns = [getattr(model, name) for name in EXPORT_MESSAGE_COLUMNS]
+    query = db.query(*columns).order_by(model.conversation_id, model.id)
+    if user_id is not None:
+        query = query.join(models.Conversation, models.Conversation.id == model.conversation_id)
+        query = query.filter(models.Conversation.user_id == user_id)
+    return query.yield_per(batch_size)
+
+@metrics.timed_db
+def bulk_insert_conversations(db: Session, rows: List[dict]) -> List[int]:
+    """
+    One executemany INSERT for a batch of conversation dicts (caller commits)
+
+    Ids are assigned by the database (keeping Postgres sequences in step)
+    and returned in the order of rows.
+    """
+    if not rows:
+        return []
+    table = models.Conversation.__table__
+    result = db.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows)
+    return list(result.scalars())
+
+@metrics.timed_db
+def bulk_insert_messages(db: Session, rows: List[dict]):
+    """One executemany INSERT for a batch of message dicts (caller commits)"""
+    if rows:
+        db.execute(insert(models.Message.__table__), rows)
+
+# ============================================
+# DOCUMENT CRUD (bulk corpus ingestion)
+# ============================================
+@metrics.timed_db
+def get_document_hashes(db: Session, user_id: int) -> set:
+    """Content hashes of every document the user already has"""
+    rows = db.query(models.Document.sha256).filter(models.Document.user_id == user_id)
+    return {sha256 for (sha256,) in rows}
+
+@metrics.timed_db
+def get_document_ids(db: Session, user_id: int, hashes: List[str]) -> dict:
+    """Ids the database assigned to the user's documents with these content hashes (sha256 -> id)"""
+    rows = db.query(models.Document.id, models.Document.sha256).filter(
+        models.Document.user_id == user_id,
+        models.Document.sha256.in_(hashes)
+    )
+    return {sha256: document_id for document_id, sha256 in rows}
+
+@metrics.timed_db
+def get_user_documents(db: Session, user_id: int, limit: int = 50, offset: int = 0) -> List[models.Document]:
+    return (
+        db.query(models.Document)
+        .filter(models.Document.user_id == user_id)
+        .order_by(models.Document.id.desc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+
+@metrics.timed_db
+def get_document(db: Session, document_id: int) -> Optional[models.Document]:
+    return db.query(models.Document).filter(models.Document.id == document_id).first()
+
+@metrics.timed_db
+def bulk_insert_documents(db: Session, rows: List[dict]):
+    """One executemany INSERT for a batch of document dicts (caller commits)"""
+    if rows:
+        db.execute(insert(models.Document.__table__), rows)
+
+@metrics.timed_db
+def bulk_insert_document_chunks(db: Session, rows: List[dict]):
+    """One executemany INSERT for a batch of chunk dicts (caller commits)"""
+    if rows:
+        db.execute(insert(models.DocumentChunk.__table__), rows)
+
+# ============================================
+# SEARCH CRUD
+# ============================================
+SQLITE_SEARCH = text("""
+    SELECT m.id, m.conversation_id, c.title, m.role, m.file_name, m.created_at,
+           snippet(messages_fts, -1, '<mark>', '</mark>', '…', 16) AS snippet,
+           bm25(messages_fts) AS rank
+    FROM messages_fts
+    JOIN (
+        SELECT id, conversation_id, role, file_name, created_at FROM messages
+        UNION ALL
+        SELECT id, conversation_id, role, file_name, created_at FROM messages_archive
+    ) m ON m.id = messages_fts.rowid
+    JOIN conversations c ON c.id = m.conversation_id
+    WHERE messages_fts MATCH :query AND c.user_id = :user_id
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+""")
+
+POSTGRES_SEARCH = text("""
+    SELECT m.id, m.conversation_id, c.title, m.role, m.file_name, m.created_at,
+           ts_headline('english', coalesce(m.content, '') || ' ' || coalesce(m.file_content, ''), q,
+                       'StartSel=<mark>, StopSel=</mark>, MaxFragments=1, MaxWords=24, MinWords=8') AS snippet,
+           -ts_rank(m.search_vector, q) AS rank
+    FROM (
+        SELECT id, conversation_id, role, content, file_name, file_content, created_at, search_vector FROM messages
+        UNION ALL
+        SELECT id, conversation_id, role, content, file_name, file_content, created_at, search_vector FROM messages_archive
+    ) m
+    JOIN conversations c ON c.id = m.conversation_id,
+         websearch_to_tsquery('english', :query) q
+    WHERE m.search_vector @@ q AND c.user_id = :user_id
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+""")
+
+@metrics.timed_db
+def search_messages(db: Session, user_id: int, query: str, limit: int = 20, offset: int = 0) -> list:
+    """
+    Ranked full-text hits over the user's messages and uploaded file text
+    (best first; rank is lower-is-better on both backends)
+    """
+    if db.bind.dialect.name == "postgresql":
+        statement, match = POSTGRES_SEARCH, query
+    else:
+        statement, match = SQLITE_SEARCH, search.to_fts5_query(query)
+        if not match:
+            return []
+    params = {"query": match, "user_id": user_id, "limit": limit, "offset": offset}
+    return db.execute(statement, params).all()
+
+SQLITE_DOCUMENT_SEARCH = text("""
+    SELECT d.id AS document_id, d.file_name, d.source_path, ch.chunk_index,
+           snippet(document_chunks_fts, 0, '<mark>', '</mark>', '…', 16) AS snippet,
+           bm25(document_chunks_fts) AS rank
+    FROM document_chunks_fts
+    JOIN document_chunks ch ON ch.id = document_chunks_fts.rowid
+    JOIN documents d ON d.id = ch.document_id
+    WHERE document_chunks_fts MATCH :query AND d.user_id = :user_id
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+""")
+
+POSTGRES_DOCUMENT_SEARCH = text("""
+    SELECT d.id AS document_id, d.file_name, d.source_path, ch.chunk_index,
+           ts_headline('english', coalesce(ch.content, ''), q,
+                       'StartSel=<mark>, StopSel=</mark>, MaxFragments=1, MaxWords=24, MinWords=8') AS snippet,
+           -ts_rank(ch.search_vector, q) AS rank
+    FROM document_chunks ch
+    JOIN documents d ON d.id = ch.document_id,
+         websearch_to_tsquery('english', :query) q
+    WHERE ch.search_vector @@ q AND d.user_id = :user_id
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+""")
+
+@metrics.timed_db
+def search_documents(db: Session, user_id: int, query: str, limit: int = 20, offset: int = 0) -> list:
+    """Ranked full-text hits over the chunks of the user's bulk-loaded documents (best first)"""
+    if db.bind.dialect.name == "postgresql":
+        statement, match = POSTGRES_DOCUMENT_SEARCH, query
+    else:
+        statement, match = SQLITE_DOCUMENT_SEARCH, search.to_fts5_query(query)
+        if not match:
+            return []
+    params = {"query": match, "user_id": user_id, "limit": limit, "offset": offset}
+    return db.execute(statement, params).all()
@@ -1,15 +1,95 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.orm import sessionmaker, declarative_base
+from app.compression import register_sqlite_functions
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
 
+connect_args = {"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args=connect_args
 )
+
+if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        # The search index triggers decompress message text in SQL
+        register_sqlite_functions(dbapi_connection)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def add_missing_columns(bind=engine):
+    """
+    Add columns and indexes declared on the models but missing from
+    existing tables (create_all only creates new tables). New columns must
+    be nullable.
+    """
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                    print(f"Added column {table.name}.{column.name}")
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    print(f"Added index {index.name}")
+
+def migrate_message_ids(bind=engine):
+    """
+    Keep message ids unique across messages and messages_archive (SQLite)
+
+    Rebuilds a messages table created without AUTOINCREMENT (the search
+    triggers and view on it are dropped; search.setup_search_index creates
+    them again) and seeds its sqlite_sequence entry from the highest id in
+    either table, so archiving never frees ids for new messages.
+    """
+    if bind.dialect.name != "sqlite":
+        return
+    from app import models
+    table = models.Message.__table__
+    with bind.begin() as connection:
+        sql = connection.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'messages'")
+        ).scalar()
+        if sql is None:
+            return
+        if "AUTOINCREMENT" not in sql.upper():
+            dependents = connection.execute(text(
+                "SELECT type, name FROM sqlite_master WHERE type IN ('trigger', 'view') AND sql LIKE '%messages%'"
+            )).all()
+            for kind, name in dependents:
+                connection.execute(text(f'DROP {kind.upper()} "{name}"'))
+            for index in table.indexes:
+                connection.execute(text(f'DROP INDEX IF EXISTS "{index.name}"'))
+
+            create = str(CreateTable(table).compile(dialect=bind.dialect))
+            connection.execute(text(create.replace("CREATE TABLE messages", "CREATE TABLE messages_rebuilt", 1)))
+            columns = ", ".join(column.name for column in table.columns)
+            connection.execute(text(f"INSERT INTO messages_rebuilt ({columns}) SELECT {columns} FROM messages"))
+            connection.execute(text("DROP TABLE messages"))
+            connection.execute(text("ALTER TABLE messages_rebuilt RENAME TO messages"))
+            for index in table.indexes:
+                index.create(connection)
+            print("Rebuilt messages with AUTOINCREMENT ids")
+
+        highest = connection.execute(text(
+            "SELECT max(coalesce((SELECT max(id) FROM messages), 0), "
+            "coalesce((SELECT max(id) FROM messages_archive), 0), "
+            "coalesce((SELECT seq FROM sqlite_sequence WHERE name = 'messages'), 0))"
+        )).scalar()
+        connection.execute(text("DELETE FROM sqlite_sequence WHERE name IN ('messages', 'messages_rebuilt')"))
+        connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('messages', :seq)"), {"seq": highest})
+
 def get_db():
     db = SessionLocal()
     try:
@@ -0,0 +1,78 @@
+"""
+Model Engine Selection
+MODEL_ENGINE picks the backend shared by the API and tools:
+  lmstudio - LM Studio OpenAI-compatible server (default, 200x faster)
+  hf       - local transformers + PEFT models (app.ml_engine)
+  stub     - deterministic fake model for benchmarks (app.ml_engine_stub)
+  onnx     - onnxruntime CPU sessions exported by scripts.export_onnx (app.ml_engine_onnx)
+  remote   - shared inference server process (python -m app.inference_server)
+"""
+import os
+import threading
+from typing import Optional
+
+from app import routing
+from app.context_helper import TokenContextManager
+from app.scheduler import inference_scheduler, estimate_cost
+
+MODEL_ENGINE = os.getenv("MODEL_ENGINE", "lmstudio").lower()
+
+if MODEL_ENGINE == "hf":
+    from app.ml_engine import model_instance
+elif MODEL_ENGINE == "stub":
+    from app.ml_engine_stub import model_instance
+elif MODEL_ENGINE == "onnx":
+    from app.ml_engine_onnx import model_instance
+elif MODEL_ENGINE == "remote":
+    from app.ml_engine_remote import model_instance
+else:
+    from app.ml_engine_lmstudio import model_instance
+
+# Initialize token context manager with 2048 token limit
+if model_instance is not None:
+    context_manager = TokenContextManager(
+        tokenizer=model_instance.tokenizer,
+        max_context_tokens=2048
+    )
+else:
+    print("⚠️  WARNING: Model not loaded. Context manager disabled.")
+    context_manager = None
+
+
+def schedule_model(
+    message: str,
+    context: str,
+    user_id: int,
+    prompt_tokens: Optional[int] = None,
+    cancel_event: threading.Event = None,
+    on_token=None,
+    enforce_limits: bool = True,
+    adapter: Optional[str] = None
+):
+    """
+    Queue a model call with the inference scheduler, prioritised by its
+    expected cost (route, prompt tokens, max_tokens)
+
+    adapter selects a named LoRA adapter (hf engine, see supports_adapters).
+    Returns a concurrent.futures.Future; raises AdmissionRejected when shed.
+    """
+    route = routing.classify(message)
+    if prompt_tokens is None:
+        prompt_tokens = len(model_instance.tokenizer.encode(context + message))
+    cost = estimate_cost(route, prompt_tokens, routing.token_budget(route, message))
+    extra = {"adapter": adapter} if adapter else {}
+    return inference_scheduler.submit(
+        model_instance.predict, message, context,
+        user_id=user_id, route=route, cost=cost,
+        cancel_event=cancel_event, enforce_limits=enforce_limits,
+        on_token=on_token, **extra
+    )
+
+
+def supports_adapters() -> bool:
+    """Whether the engine can serve named LoRA adapters per request"""
+    return hasattr(model_instance, "adapters")
+
+
+def available_adapters() -> list:
+    return model_instance.adapters.names() if supports_adapters() else []
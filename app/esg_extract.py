@@ -0,0 +1,199 @@
+"""
+ESG Figure Extraction
+Pulls standard ESG figures out of report text with regexes, no model call:
+scope 1/2/3 emissions, water withdrawal and waste generated, each converted
+to one canonical unit and tagged with its reporting year.
+
+A figure is a metric label ("Scope 1 emissions", "total water withdrawal")
+followed within a short window by a number with a recognised unit, either
+right after the number ("12,345 tCO2e") or as a header between the label
+and the number ("Scope 1 (tCO2e) 12,345"). Labels without a unit are
+skipped rather than guessed.
+"""
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+
+METRICS = (
+    "scope1_emissions",
+    "scope2_emissions",
+    "scope3_emissions",
+    "water_withdrawal",
+    "waste_generated",
+)
+
+LABELS = {
+    # "Scope 1 and 2" totals are not scope 1 figures
+    "scope1_emissions": r"scope\s*(?:1|one)\b(?!\s*(?:and|&|\+|/|,)\s*(?:2|two)\b)",
+    "scope2_emissions": r"scope\s*(?:2|two)\b(?!\s*(?:and|&|\+|/|,)\s*(?:3|three)\b)",
+    "scope3_emissions": r"scope\s*(?:3|three)\b",
+    "water_withdrawal": r"water\s+(?:withdrawal|withdrawn|consumption|consumed|usage|use)",
+    "waste_generated": r"(?:total\s+waste|waste\s+(?:generated|generation|produced))",
+}
+
+EMISSIONS_UNITS = [
+    (r"(?-i:M)t\s?co2[\s-]?e(?:q)?|million\s+(?:metric\s+)?(?:tonnes|tons)\s+(?:of\s+)?co2[\s-]?e(?:q)?", 1e6),
+    (r"kt\s?co2[\s-]?e(?:q)?|thousand\s+(?:metric\s+)?(?:tonnes|tons)\s+(?:of\s+)?co2[\s-]?e(?:q)?", 1e3),
+    (r"(?:t|mt|(?:metric\s+)?(?:tonnes|tons))\s?(?:of\s+)?co2[\s-]?(?:e|eq|equivalents?)\b", 1.0),
+]
+WATER_UNITS = [
+    (r"million\s+(?:m3|m³|cubic\s+met(?:re|er)s)|(?-i:Mm)(?:3|³)", 1e6),
+    (r"million\s+(?:us\s+)?gallons", 3785.41),
+    (r"megalit(?:re|er)s?|(?-i:ML)\b", 1e3),
+    (r"m3|m³|cubic\s+met(?:re|er)s?|kilolit(?:re|er)s?|(?-i:kL)\b", 1.0),
+    (r"(?:us\s+)?gallons", 0.00378541),
+    (r"lit(?:re|er)s?", 0.001),
+]
+WASTE_UNITS = [
+    (r"kilo\s?(?:tonnes|tons)|kt\b", 1e3),
+    (r"(?:metric\s+)?(?:tonnes|tons)|t\b", 1.0),
+    (r"kg|kilograms?", 0.001),
+]
+
+# Canonical unit and accepted units per metric
+UNITS = {
+    "scope1_emissions": ("tCO2e", EMISSIONS_UNITS),
+    "scope2_emissions": ("tCO2e", EMISSIONS_UNITS),
+    "scope3_emissions": ("tCO2e", EMISSIONS_UNITS),
+    "water_withdrawal": ("m3", WATER_UNITS),
+    "waste_generated": ("t", WASTE_UNITS),
+}
+
+# How far after a label its figure may appear
+WINDOW_CHARS = 160
+
+# "12,345", "1 234 567", "0.8", optionally "million"/"thousand"; not part of a word (CO2)
+NUMBER = re.compile(
+    r"(?<![\w.,])(\d{1,3}(?:,\d{3})+|\d{1,3}(?: \d{3})+(?![\d,])|\d+)(\.\d+)?(?!\d)"
+    r"(?:\s*(million|thousand|billion)\b)?",
+    re.IGNORECASE,
+)
+SCALES = {"thousand": 1e3, "million": 1e6, "billion": 1e9}
+
+YEAR = re.compile(r"\b(?:FY\s?)?(20[0-4]\d)\b", re.IGNORECASE)
+REPORT_YEAR = re.compile(
+    r"(?:reporting\s+(?:year|period)|fiscal\s+year|financial\s+year|FY|year\s+ended)[^0-9]{0,20}(20[0-4]\d)",
+    re.IGNORECASE,
+)
+
+# A figure's window stops at the next label, a blank line or a sentence end
+ANY_LABEL = re.compile("|".join(f"(?:{pattern})" for pattern in LABELS.values()), re.IGNORECASE)
+WINDOW_END = re.compile(r"\n\s*\n|\.\s+[A-Z]")
+
+_labels = {metric: re.compile(pattern, re.IGNORECASE) for metric, pattern in LABELS.items()}
+_units = {
+    metric: [(re.compile(r"\s*\(?\s*(?:" + pattern + r")", re.IGNORECASE), factor) for pattern, factor in units]
+    for metric, (_, units) in UNITS.items()
+}
+_header_units = {
+    metric: [(re.compile(r"(?<!\w)(?:" + pattern + ")", re.IGNORECASE), factor) for pattern, factor in units]
+    for metric, (_, units) in UNITS.items()
+}
+
+# File name words that aren't part of the company name
+FILE_NAME_NOISE = {
+    "esg", "report", "sustainability", "annual", "csr", "integrated", "impact",
+    "responsibility", "corporate", "environmental", "social", "governance", "final", "fy",
+}
+
+
+def _window(text: str, start: int) -> str:
+    window = text[start:start + WINDOW_CHARS]
+    for pattern in (ANY_LABEL, WINDOW_END):
+        match = pattern.search(window)
+        if match:
+            window = window[:match.start()]
+    return window
+
+
+def _unit_at(metric: str, window: str, position: int) -> Optional[float]:
+    for pattern, factor in _units[metric]:
+        if pattern.match(window, position):
+            return factor
+    return None
+
+
+def _header_unit(metric: str, header: str) -> Optional[float]:
+    for pattern, factor in _header_units[metric]:
+        if pattern.search(header):
+            return factor
+    return None
+
+
+def _number(match) -> float:
+    value = float(match.group(1).replace(",", "").replace(" ", "") + (match.group(2) or ""))
+    if match.group(3):
+        value *= SCALES[match.group(3).lower()]
+    return value
+
+
+def reporting_year(text: str) -> Optional[int]:
+    """The year a report covers: an explicit "reporting year"/"FY" mention, else the most cited year"""
+    explicit = Counter(int(year) for year in REPORT_YEAR.findall(text))
+    if explicit:
+        return explicit.most_common(1)[0][0]
+    cited = Counter(int(year) for year in YEAR.findall(text[:20000]))
+    return cited.most_common(1)[0][0] if cited else None
+
+
+def extract_figures(text: str, default_year: Optional[int] = None) -> List[Dict]:
+    """
+    ESG figures found in a report
+
+    Args:
+        text: Extracted report text
+        default_year: Year for figures with no year of their own (default: reporting_year(text))
+
+    Returns:
+        One dict per (metric, year): metric, value (canonical unit), unit, year.
+        The first figure found wins, reports usually lead with the headline number.
+        Rows under year columns give one figure per column.
+    """
+    if default_year is None:
+        default_year = reporting_year(text)
+
+    figures = {}
+    for metric, label in _labels.items():
+        for label_match in label.finditer(text):
+            window = _window(text, label_match.end())
+            years = []
+            found = 0
+            for number in NUMBER.finditer(window):
+                # Year-shaped integers date the figures after them, never are one: a bare
+                # year ("Scope 1 (tCO2e) 2023: 12,345") or year columns ("2022 2023 tCO2e 900 1,000")
+                if not number.group(2) and not number.group(3) and YEAR.fullmatch(number.group(1)):
+                    if found:
+                        break
+                    years.append(int(number.group(1)))
+                    continue
+                factor = _unit_at(metric, window, number.end())
+                if factor is None:
+                    factor = _header_unit(metric, window[:number.start()])
+                if factor is None:
+                    continue
+                value = _number(number)
+
+                # With year columns the values follow in the same order
+                year = years[found] if years else default_year
+                if year is not None and (metric, year) not in figures:
+                    figures[(metric, year)] = {
+                        "metric": metric,
+                        "value": value * factor,
+                        "unit": UNITS[metric][0],
+                        "year": year,
+                    }
+                found += 1
+                if found >= max(1, len(years)):
+                    break
+    return list(figures.values())
+
+
+def company_from_file_name(file_name: str) -> str:
+    """Best-effort company name from a report file name ("Acme_Corp_ESG_Report_2023.pdf" -> "Acme Corp")"""
+    stem = os.path.splitext(os.path.basename(file_name or ""))[0]
+    words = [
+        word for word in re.split(r"[\s_\-.]+", stem)
+        if word and word.lower() not in FILE_NAME_NOISE and not re.fullmatch(r"(?:fy)?\d{2,4}", word, re.IGNORECASE)
+    ]
+    return " ".join(words) or stem or "Unknown"
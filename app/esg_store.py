@@ -0,0 +1,319 @@
+"""
+ESG Figure Store
+Columnar store for the figures app.esg_extract pulls out of uploaded
+reports, so "compare scope 1 emissions of these five companies" is a few
+vectorized numpy operations instead of a model call over raw PDF text.
+
+Each column is its own .npy file, opened memory-mapped (read-only):
+
+  user_id  int32    owner of the upload the figure came from
+  company  int32    index into manifest.json "companies"
+  year     int16
+  metric   int8     index into esg_extract.METRICS
+  value    float64  in the metric's canonical unit (tCO2e, m3, t)
+
+Writes rewrite the columns into a new, uniquely named generation
+directory and then swap manifest.json, so readers never see columns of
+different lengths. Writers in every process (uvicorn workers, the bulk
+ingestion script) take an flock on ESG_STORE_DIR/.write.lock around
+read-merge-write, so no writer's figures are lost. One row per (user,
+company, year, metric); re-uploading a report replaces its figures.
+
+Settings (environment):
+  ESG_STORE_DIR - where the columns live (default ./esg_store)
+"""
+import json
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: writers are only serialized within the process
+    fcntl = None
+
+from app import metrics
+from app.esg_extract import METRICS, UNITS, company_from_file_name, extract_figures
+from app.logger import get_logger, log_event
+
+logger = get_logger("esg_store")
+
+ESG_STORE_DIR = os.getenv("ESG_STORE_DIR", "./esg_store")
+
+COLUMNS = {
+    "user_id": np.int32,
+    "company": np.int32,
+    "year": np.int16,
+    "metric": np.int8,
+    "value": np.float64,
+}
+KEY_COLUMNS = ("user_id", "company", "year", "metric")
+
+
+class ESGStore:
+    def __init__(self, directory: str = ESG_STORE_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.lock_path = os.path.join(directory, ".write.lock")
+        self.write_lock = threading.Lock()
+        self._loaded_version = None
+        self.generation = 0
+        self.generation_dir = None
+        self.companies: List[str] = []
+        self.company_ids: Dict[str, int] = {}
+        self.columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+    # ----- reading -----
+
+    def refresh(self, attempts: int = 3):
+        """Reopen the columns if another writer (or process) swapped in a new generation"""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return
+        # os.replace gives the manifest a new inode on every write
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version == self._loaded_version:
+            return
+        with open(self.manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        # Stores written before generations were uniquely named record only the number
+        generation_dir = manifest.get("directory", f"gen-{manifest['generation']}")
+        try:
+            columns = {
+                name: np.load(os.path.join(self.directory, generation_dir, f"{name}.npy"), mmap_mode="r")
+                for name in COLUMNS
+            }
+        except FileNotFoundError:
+            # A writer published a newer generation and removed this one in between
+            if attempts <= 1:
+                raise
+            return self.refresh(attempts - 1)
+        self.columns = columns
+        self.generation = manifest["generation"]
+        self.generation_dir = generation_dir
+        self.companies = manifest["companies"]
+        self.company_ids = {name.lower(): index for index, name in enumerate(self.companies)}
+        self._loaded_version = version
+
+    def _snapshot(self) -> Dict[str, np.ndarray]:
+        """
+        Refresh and return the current columns; queries index only this copy, as a
+        concurrent refresh may swap self.columns to another generation midway
+        """
+        self.refresh()
+        return self.columns
+
+    def _mask(
+        self,
+        columns: Dict[str, np.ndarray],
+        user_id: int,
+        metric: Optional[str] = None,
+        companies: Optional[List[str]] = None
+    ) -> np.ndarray:
+        mask = columns["user_id"] == user_id
+        if metric is not None:
+            mask &= columns["metric"] == METRICS.index(metric)
+        if companies:
+            # Company ids are append-only, so a newer mapping still fits older columns
+            company_ids = self.company_ids
+            ids = [company_ids[name.lower()] for name in companies if name.lower() in company_ids]
+            mask &= np.isin(columns["company"], ids)
+        return mask
+
+    def list_companies(self, user_id: int) -> List[Dict]:
+        """Companies with figures for this user, with their year range and figure count"""
+        columns = self._snapshot()
+        mask = self._mask(columns, user_id)
+        company, year = columns["company"][mask], columns["year"][mask]
+        ids, counts = np.unique(company, return_counts=True)
+        results = []
+        for company_id, count in zip(ids, counts):
+            years = year[company == company_id]
+            results.append({
+                "company": self.companies[company_id],
+                "figures": int(count),
+                "first_year": int(years.min()),
+                "last_year": int(years.max()),
+            })
+        return results
+
+    def compare(
+        self,
+        user_id: int,
+        metric: str,
+        companies: Optional[List[str]] = None,
+        year: Optional[int] = None
+    ) -> Dict:
+        """
+        One metric across companies, largest first
+
+        Args:
+            metric: One of esg_extract.METRICS
+            companies: Names to compare (default: every company with the metric)
+            year: Reporting year (default: each company's latest year)
+
+        Returns:
+            Dict with rows (company, year, value, share of the total, ratio to
+            the mean) and summary statistics over them
+        """
+        columns = self._snapshot()
+        mask = self._mask(columns, user_id, metric, companies)
+        if year is not None:
+            mask &= columns["year"] == year
+        company = np.asarray(columns["company"][mask])
+        years = np.asarray(columns["year"][mask])
+        values = np.asarray(columns["value"][mask])
+
+        if year is None and len(company):
+            # Latest year per company: sort by (company, year) and keep each company's last row
+            order = np.lexsort((years, company))
+            company, years, values = company[order], years[order], values[order]
+            last = np.append(company[1:] != company[:-1], True)
+            company, years, values = company[last], years[last], values[last]
+
+        order = np.argsort(-values, kind="stable")
+        company, years, values = company[order], years[order], values[order]
+
+        total = float(values.sum())
+        mean = float(values.mean()) if len(values) else 0.0
+        share = values / total if total else np.zeros_like(values)
+        vs_mean = values / mean if mean else np.zeros_like(values)
+        return {
+            "metric": metric,
+            "unit": UNITS[metric][0],
+            "year": year,
+            "rows": [
+                {
+                    "company": self.companies[company_id],
+                    "year": int(row_year),
+                    "value": float(value),
+                    "share_of_total": round(float(row_share), 4),
+                    "vs_mean": round(float(row_vs_mean), 4),
+                }
+                for company_id, row_year, value, row_share, row_vs_mean in zip(company, years, values, share, vs_mean)
+            ],
+            "count": int(len(values)),
+            "total": total,
+            "mean": mean,
+            "median": float(np.median(values)) if len(values) else 0.0,
+            "min": float(values.min()) if len(values) else 0.0,
+            "max": float(values.max()) if len(values) else 0.0,
+        }
+
+    def series(self, user_id: int, company: str, metric: Optional[str] = None) -> Dict[str, List[Dict]]:
+        """Year-by-year figures for one company, per metric, with the change from the previous year"""
+        columns = self._snapshot()
+        mask = self._mask(columns, user_id, metric, [company])
+        metric_ids = np.asarray(columns["metric"][mask])
+        years = np.asarray(columns["year"][mask])
+        values = np.asarray(columns["value"][mask])
+
+        results = {}
+        for metric_id in np.unique(metric_ids):
+            selected = metric_ids == metric_id
+            order = np.argsort(years[selected])
+            metric_years, metric_values = years[selected][order], values[selected][order]
+            change = np.full(len(metric_values), np.nan)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                change[1:] = (metric_values[1:] - metric_values[:-1]) / metric_values[:-1] * 100
+            results[METRICS[metric_id]] = [
+                {
+                    "year": int(row_year),
+                    "value": float(value),
+                    "change_pct": None if not np.isfinite(pct) else round(float(pct), 2),
+                }
+                for row_year, value, pct in zip(metric_years, metric_values, change)
+            ]
+        return results
+
+    # ----- writing -----
+
+    def add_figures(self, user_id: int, company: str, figures: List[Dict]) -> int:
+        """Upsert figures for one company; returns how many were written"""
+        if not figures:
+            return 0
+        with self._locked():
+            self.refresh()
+            companies = list(self.companies)
+            company_id = self.company_ids.get(company.lower())
+            if company_id is None:
+                company_id = len(companies)
+                companies.append(company)
+
+            new = {
+                "user_id": np.full(len(figures), user_id, dtype=COLUMNS["user_id"]),
+                "company": np.full(len(figures), company_id, dtype=COLUMNS["company"]),
+                "year": np.array([figure["year"] for figure in figures], dtype=COLUMNS["year"]),
+                "metric": np.array([METRICS.index(figure["metric"]) for figure in figures], dtype=COLUMNS["metric"]),
+                "value": np.array([figure["value"] for figure in figures], dtype=COLUMNS["value"]),
+            }
+            merged = {name: np.concatenate([self.columns[name], new[name]]) for name in COLUMNS}
+
+            # Newest row wins per key: dedupe on the reversed columns, keep first occurrences
+            keys = np.stack([merged[name][::-1].astype(np.int64) for name in KEY_COLUMNS], axis=1)
+            _, first = np.unique(keys, axis=0, return_index=True)
+            keep = np.sort(len(keys) - 1 - first)
+            merged = {name: column[keep] for name, column in merged.items()}
+
+            self._write(merged, companies)
+        return len(figures)
+
+    @contextmanager
+    def _locked(self):
+        """Serialize writers: threads via write_lock, processes via an flock on lock_path"""
+        with self.write_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, columns: Dict[str, np.ndarray], companies: List[str]):
+        """Publish a new generation (caller holds _locked and has just refreshed)"""
+        generation = self.generation + 1
+        generation_dir = f"gen-{generation}-{uuid.uuid4().hex[:12]}"
+        generation_path = os.path.join(self.directory, generation_dir)
+        os.makedirs(generation_path)
+        for name, column in columns.items():
+            np.save(os.path.join(generation_path, f"{name}.npy"), column)
+
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "directory": generation_dir, "companies": companies}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+        # Open maps keep the old files readable until they're closed
+        previous_dir = self.generation_dir
+        self.refresh()
+        if previous_dir:
+            shutil.rmtree(os.path.join(self.directory, previous_dir), ignore_errors=True)
+
+
+store = ESGStore()
+
+
+def ingest_report(user_id: int, file_name: str, text: str, company: Optional[str] = None) -> int:
+    """Extract figures from an uploaded report and store them (runs in the background, never raises)"""
+    try:
+        figures = extract_figures(text)
+        if not figures:
+            return 0
+        company = company or company_from_file_name(file_name)
+        written = store.add_figures(user_id, company, figures)
+        for figure in figures:
+            metrics.ESG_FIGURES.labels(metric=figure["metric"]).inc()
+        log_event(logger, "esg_figures_stored", user_id=user_id, company=company, figures=written)
+        return written
+    except Exception as e:
+        log_event(logger, "esg_ingest_failed", file_name=file_name, error=str(e))
+        return 0
@@ -0,0 +1,132 @@
+"""
+Conversation History Export / Import
+NDJSON, one record per line, all conversations first and then their
+messages in conversation order (hot messages, then archived ones):
+
+    {"type": "conversation", "id": ..., "user_id": ..., "title": ..., ...}
+    {"type": "message", "id": ..., "conversation_id": ..., "role": ..., ...}
+
+Rows are streamed from the database with server-side cursors and written
+through an incremental gzip compressor, so memory use does not grow with
+the size of the history. Imports use batched executemany inserts.
+"""
+import json
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy.orm import Session
+
+from app import crud, models, sidebar_cache
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 5000
+
+# Flush compressed output roughly every 64KB of NDJSON
+GZIP_CHUNK_SIZE = 64 * 1024
+
+DATETIME_FIELDS = ("created_at", "updated_at")
+
+
+def _record(record_type: str, columns, row) -> str:
+    record = {"type": record_type}
+    for name, value in zip(columns, row):
+        record[name] = value.isoformat() if isinstance(value, datetime) else value
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def iter_export_lines(db: Session, user_id: Optional[int] = None) -> Iterator[str]:
+    """NDJSON lines for one user's history (or every user's when user_id is None)"""
+    for row in crud.iter_conversation_rows(db, user_id, EXPORT_BATCH_SIZE):
+        yield _record("conversation", crud.EXPORT_CONVERSATION_COLUMNS, row)
+    for model in (models.Message, models.MessageArchive):
+        for row in crud.iter_message_rows(db, user_id, EXPORT_BATCH_SIZE, model):
+            yield _record("message", crud.EXPORT_MESSAGE_COLUMNS, row)
+
+
+def gzip_stream(lines: Iterable[str]) -> Iterator[bytes]:
+    """Compress text lines incrementally into a gzip byte stream"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= GZIP_CHUNK_SIZE:
+            chunk = compressor.compress(b"".join(buffer))
+            buffer, size = [], 0
+            if chunk:
+                yield chunk
+    yield compressor.compress(b"".join(buffer)) + compressor.flush()
+
+
+def _parse(record: dict, columns) -> dict:
+    row = {name: record.get(name) for name in columns}
+    for name in DATETIME_FIELDS:
+        if row.get(name):
+            row[name] = datetime.fromisoformat(row[name])
+    return row
+
+
+def import_lines(db: Session, lines: Iterable[str], user_id: Optional[int] = None) -> dict:
+    """
+    Bulk-insert an NDJSON export
+
+    Conversation and message ids are assigned by the database, so imports
+    never collide with existing rows; messages are remapped to the new ids
+    of their conversations.
+    Pass user_id to import everything into one account, otherwise the
+    exported user_id values must exist in this database.
+
+    Returns:
+        Counts of imported conversations and messages
+    """
+    conversations, messages = [], []
+    exported_ids = []  # exported id of each pending conversation
+    counts = {"conversations": 0, "messages": 0}
+    new_ids = {}  # exported conversation id -> id in this database
+    owners = {}  # new conversation id -> user_id
+
+    def flush():
+        # Conversations first so message foreign keys always resolve
+        for exported_id, new_id, row in zip(exported_ids, crud.bulk_insert_conversations(db, conversations), conversations):
+            new_ids[exported_id] = new_id
+            owners[new_id] = row["user_id"]
+        for row in messages:
+            row["conversation_id"] = new_ids[row["conversation_id"]]
+        crud.bulk_insert_messages(db, messages)
+        db.commit()
+        # Bulk inserts bypass the write-through hooks; drop the affected sidebars
+        for user in {row["user_id"] for row in conversations} | {owners[row["conversation_id"]] for row in messages}:
+            sidebar_cache.invalidate(user)
+        exported_ids.clear()
+        counts["conversations"] += len(conversations)
+        counts["messages"] += len(messages)
+        conversations.clear()
+        messages.clear()
+
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record.get("type") == "conversation":
+            row = _parse(record, crud.EXPORT_CONVERSATION_COLUMNS)
+            exported_ids.append(row.pop("id"))
+            if user_id is not None:
+                row["user_id"] = user_id
+            # Summary cursors point at old message ids; rebuilt on the next refresh
+            row["summary"], row["summary_until_id"] = None, None
+            row["last_message_id"], row["archived_at"] = None, None
+            conversations.append(row)
+        elif record.get("type") == "message":
+            row = _parse(record, crud.EXPORT_MESSAGE_COLUMNS)
+            row.pop("id")
+            messages.append(row)
+        else:
+            raise ValueError(f"Unknown record type: {record.get('type')}")
+
+        if len(conversations) + len(messages) >= IMPORT_BATCH_SIZE:
+            flush()
+
+    flush()
+    return counts
@@ -0,0 +1,100 @@
+"""
+Generation Helpers
+Stopping criteria and the token streamer shared by the transformers-based
+engines (app.ml_engine, app.ml_engine_onnx)
+"""
+import time
+
+import torch
+from transformers import StoppingCriteria
+from transformers.generation.streamers import BaseStreamer
+
+from app import routing
+
+
+class StopOnSequences(StoppingCriteria):
+    """
+    Stops generation as soon as every sequence in the batch has produced EOS
+    or a role marker (e.g. the model starting a fake "User:" turn)
+    """
+    def __init__(self, tokenizer, prompt_length: int, stop_sequences=routing.STOP_SEQUENCES, eos_token_ids=()):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.stop_sequences = stop_sequences
+        self.eos_token_ids = set(eos_token_ids)
+        # Only the tail needs decoding: enough tokens to cover the longest marker
+        self.lookback = max(len(tokenizer.encode(s, add_special_tokens=False)) for s in stop_sequences) + 2
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = []
+        for row in input_ids:
+            new_ids = row[self.prompt_length:]
+            if len(new_ids) == 0:
+                done.append(False)
+                continue
+            if int(new_ids[-1]) in self.eos_token_ids:
+                done.append(True)
+                continue
+            tail = self.tokenizer.decode(new_ids[-self.lookback:], skip_special_tokens=False)
+            done.append(any(stop in tail for stop in self.stop_sequences))
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class StopOnCancel(StoppingCriteria):
+    """Aborts generation once the client cancelled or disconnected"""
+    def __init__(self, cancel_event):
+        self.cancel_event = cancel_event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        cancelled = self.cancel_event.is_set()
+        return torch.full((input_ids.shape[0],), cancelled, dtype=torch.bool, device=input_ids.device)
+
+
+class TokenStreamer(BaseStreamer):
+    """
+    Records when the first new token came out and, if on_token is given,
+    passes each newly decoded piece of text to it
+
+    Pieces are decoded incrementally (only the tokens since the last piece,
+    plus a few before them for context) and cleaned as they go with
+    routing.ReplyStream, so they add up to the reply generate() returns.
+    """
+    def __init__(self, tokenizer, on_token=None, route=None):
+        self.tokenizer = tokenizer
+        self.on_token = on_token
+        self.start = time.perf_counter()
+        self.time_to_first_token = None
+        self.cleaner = routing.ReplyStream(route)
+        self._prompt_seen = False
+        self._token_ids = []
+        # Tokens [prefix_offset:read_offset] were decoded already and only give
+        # the new ones their context (leading spaces, multi-token characters)
+        self._prefix_offset = 0
+        self._read_offset = 0
+
+    def put(self, value):
+        # generate() pushes the prompt ids first, then one call per new token
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - self.start
+        if self.on_token is None:
+            return
+
+        self._token_ids.extend(value.reshape(-1).tolist())
+        prefix = self.tokenizer.decode(self._token_ids[self._prefix_offset:self._read_offset], skip_special_tokens=False)
+        text = self.tokenizer.decode(self._token_ids[self._prefix_offset:], skip_special_tokens=False)
+        if len(text) <= len(prefix) or text.endswith("\ufffd"):  # wait for the rest of a multi-byte character
+            return
+        self._prefix_offset = self._read_offset
+        self._read_offset = len(self._token_ids)
+        self._emit(self.cleaner.feed(text[len(prefix):]))
+
+    def end(self):
+        if self.on_token is not None:
+            self._emit(self.cleaner.close())
+
+    def _emit(self, piece: str):
+        if piece:
+            self.on_token(piece)
@@ -0,0 +1,108 @@
+"""
+Inference Wire Protocol
+Length-prefixed binary frames between API workers and the inference server
+(app.inference_server), one request per connection:
+
+    frame    = u32 length | u8 type | body          (length counts type + body)
+    PREDICT  = u8 flags | u32 len | message utf-8 | u32 len | context utf-8
+    CANCEL   = empty body, client -> server while a PREDICT is running
+    TOKEN    = utf-8 text piece (only when FLAG_STREAM was set)
+    RESULT   = utf-8 final reply
+    ERROR    = utf-8 error message
+
+INFERENCE_SOCKET is a Unix socket path, or host:port for TCP (Windows).
+"""
+import os
+import socket
+import struct
+from typing import Tuple
+
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET", "/tmp/finesg-inference.sock")
+
+PREDICT = 0x01
+CANCEL = 0x02
+TOKEN = 0x11
+RESULT = 0x12
+ERROR = 0x13
+
+FLAG_STREAM = 0x01
+
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+_HEADER = struct.Struct("!IB")
+_LENGTH = struct.Struct("!I")
+
+
+def send_frame(sock: socket.socket, frame_type: int, body: bytes = b""):
+    sock.sendall(_HEADER.pack(len(body) + 1, frame_type) + body)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Inference connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock: socket.socket) -> Tuple[int, bytes]:
+    length, frame_type = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if length < 1 or length > MAX_FRAME_SIZE:
+        raise ConnectionError(f"Invalid frame length {length}")
+    return frame_type, _recv_exact(sock, length - 1)
+
+
+def encode_predict(message: str, context: str, stream: bool) -> bytes:
+    message_bytes = message.encode("utf-8")
+    context_bytes = context.encode("utf-8")
+    return b"".join([
+        bytes([FLAG_STREAM if stream else 0]),
+        _LENGTH.pack(len(message_bytes)), message_bytes,
+        _LENGTH.pack(len(context_bytes)), context_bytes,
+    ])
+
+
+def decode_predict(body: bytes) -> Tuple[str, str, bool]:
+    flags = body[0]
+    offset = 1
+    (message_length,) = _LENGTH.unpack_from(body, offset)
+    offset += _LENGTH.size
+    message = body[offset:offset + message_length].decode("utf-8")
+    offset += message_length
+    (context_length,) = _LENGTH.unpack_from(body, offset)
+    offset += _LENGTH.size
+    context = body[offset:offset + context_length].decode("utf-8")
+    return message, context, bool(flags & FLAG_STREAM)
+
+
+def _is_tcp(address: str) -> bool:
+    host, _, port = address.rpartition(":")
+    return bool(host) and port.isdigit()
+
+
+def connect(address: str = INFERENCE_SOCKET) -> socket.socket:
+    if _is_tcp(address):
+        host, _, port = address.rpartition(":")
+        return socket.create_connection((host, int(port)))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(address)
+    return sock
+
+
+def listen(address: str = INFERENCE_SOCKET, backlog: int = 64) -> socket.socket:
+    if _is_tcp(address):
+        host, _, port = address.rpartition(":")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, int(port)))
+    else:
+        if os.path.exists(address):
+            os.remove(address)  # stale socket from a previous run
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(address)
+        os.chmod(address, 0o660)
+    sock.listen(backlog)
+    return sock
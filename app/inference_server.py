@@ -0,0 +1,150 @@
+"""
+Inference Server
+Runs the HF engine (app.ml_engine) in its own process so API workers don't
+each load a copy of the Qwen weights. API workers use MODEL_ENGINE=remote
+(app.ml_engine_remote) and talk to it over INFERENCE_SOCKET using the
+binary protocol in app.inference_protocol.
+
+The parent process loads the safetensors weights once, then forks a small
+pool of workers that accept connections on the shared socket. The weight
+pages are shared copy-on-write between workers, so model memory stays
+constant as the pool (or the number of API workers) grows. A CUDA context
+does not survive fork(), so with the model on a GPU the server runs a
+single process (one GPU copy of the weights) whatever --workers says.
+
+Usage:
+    python -m app.inference_server --workers 2
+    python -m app.inference_server --socket 127.0.0.1:9300    # TCP (Windows)
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+from app import inference_protocol as protocol
+from app.logger import get_logger, log_event
+
+logger = get_logger("inference_server")
+
+
+def handle_connection(conn, model):
+    """Serve one PREDICT request; a CANCEL frame or disconnect aborts it"""
+    frame_type, body = protocol.recv_frame(conn)
+    if frame_type != protocol.PREDICT:
+        protocol.send_frame(conn, protocol.ERROR, b"Expected PREDICT frame")
+        return
+    message, context, stream = protocol.decode_predict(body)
+
+    cancel_event = threading.Event()
+
+    def watch_for_cancel():
+        try:
+            frame_type, _ = protocol.recv_frame(conn)
+            if frame_type == protocol.CANCEL:
+                cancel_event.set()
+        except (ConnectionError, OSError):
+            cancel_event.set()  # client went away
+
+    threading.Thread(target=watch_for_cancel, daemon=True).start()
+
+    def on_token(text: str):
+        try:
+            protocol.send_frame(conn, protocol.TOKEN, text.encode("utf-8"))
+        except OSError:
+            cancel_event.set()
+
+    result = model.predict(message, context, cancel_event=cancel_event, on_token=on_token if stream else None)
+    if not cancel_event.is_set():
+        protocol.send_frame(conn, protocol.RESULT, result.encode("utf-8"))
+
+
+def serve_forever(listener, model):
+    while True:
+        conn, _ = listener.accept()
+        try:
+            handle_connection(conn, model)
+        except (ConnectionError, OSError) as e:
+            log_event(logger, "connection_error", error=str(e))
+        finally:
+            conn.close()
+
+
+def run_pool(listener, model, workers: int):
+    """Fork workers sharing the loaded weights; restart any that die"""
+    from app import runtime
+    children = {}
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            # This worker's share of the cores and threads (see app.runtime)
+            runtime.apply(index, workers)
+            if runtime.MODEL_WARMUP:
+                model.warm_up()
+            serve_forever(listener, model)
+            os._exit(0)
+        children[pid] = index
+        log_event(logger, "worker_started", pid=pid, index=index)
+
+    def shutdown(signum, frame):
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for index in range(workers):
+        spawn(index)
+
+    while True:
+        pid, status = os.wait()
+        index = children.pop(pid, None)
+        if index is not None:
+            log_event(logger, "worker_exited", pid=pid, index=index, status=status)
+            time.sleep(1)
+            spawn(index)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="FinESG inference server")
+    parser.add_argument("--socket", default=protocol.INFERENCE_SOCKET, help="Unix socket path or host:port")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INFERENCE_WORKERS", "1")))
+    args = parser.parse_args(argv)
+
+    # Loads the tokenizer, base and ESG models once in this process; the
+    # warm-up runs in whichever process ends up serving (not before a fork)
+    from app import runtime
+    runtime.defer_warmup()
+    from app.ml_engine import model_instance
+    if model_instance is None:
+        print("❌ Model failed to load; inference server not started")
+        return 1
+
+    listener = protocol.listen(args.socket)
+
+    workers = args.workers
+    if workers > 1 and model_instance.device == "cuda":
+        log_event(logger, "workers_unsupported_on_cuda", logging.WARNING, requested=workers)
+        print(f"⚠️  --workers {workers} ignored: forked workers cannot use the parent's CUDA context")
+        workers = 1
+    log_event(logger, "listening", address=args.socket, workers=workers)
+
+    if workers > 1 and hasattr(os, "fork"):
+        run_pool(listener, model_instance, workers)
+    else:
+        if runtime.MODEL_WARMUP:
+            model_instance.warm_up()
+        serve_forever(listener, model_instance)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Background File Analysis Jobs
+A small pool of worker threads processes file uploads queued in the
+file_jobs table, so long analyses don't hold HTTP connections open.
+
+Settings (environment):
+  JOB_WORKERS          - worker threads per process (default 2, 0 disables)
+  JOB_POLL_SECONDS     - queue poll interval when idle (default 1)
+  JOB_MAX_ATTEMPTS     - retries before a job is marked failed (default 3)
+  JOB_STALE_SECONDS    - running jobs without progress for this long are requeued (default 900);
+                         workers heartbeat the job row every third of this while the model runs
+  UPLOAD_DIR           - where uploads are spooled until processed (default ./uploads)
+"""
+import os
+import threading
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from app import crud, database, esg_store, memory, metrics, models
+from app.engine import model_instance, context_manager, schedule_model
+from app.logger import get_logger, log_event
+from app.utils import extract_text_from_file
+
+logger = get_logger("jobs")
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "900"))
+JOB_HEARTBEAT_SECONDS = max(1, JOB_STALE_SECONDS / 3)
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_workers: List[threading.Thread] = []
+
+
+def upload_path(file_name: str) -> str:
+    """Fresh path in UPLOAD_DIR for an upload, keeping its extension"""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    extension = os.path.splitext(file_name or "")[1][:10]
+    return os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}{extension}")
+
+
+def remove_upload(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def wait_for_model(db, job: models.FileJob, future):
+    """
+    Wait for a queued model call, touching the job's updated_at meanwhile so
+    requeue_stale_file_jobs in another process doesn't take it for orphaned
+    """
+    while True:
+        try:
+            return future.result(timeout=JOB_HEARTBEAT_SECONDS)
+        except FutureTimeout:
+            crud.update_file_job(db, job, updated_at=datetime.now(timezone.utc))
+
+
+def notify():
+    """Wake an idle worker right away instead of waiting for the next poll"""
+    _wakeup.set()
+
+
+def process_job(db, job: models.FileJob):
+    """Extract, analyze and write the conversation messages for one job"""
+    crud.update_file_job(db, job, stage="extracting", progress=10)
+    file_text = extract_text_from_file(job.file_path, job.content_type)
+    if not file_text.strip():
+        raise ValueError("Could not extract text from file")
+    esg_store.ingest_report(job.user_id, job.file_name, file_text)
+
+    if model_instance is None or context_manager is None:
+        raise RuntimeError("AI model is not available")
+
+    crud.update_file_job(db, job, stage="analyzing", progress=40)
+    context, metadata = context_manager.get_conversation_context(db, job.conversation_id, file_text)
+    # Background work is not shed, only ordered behind cheaper interactive requests
+    future = schedule_model(
+        file_text, context, job.user_id, metadata["total_tokens"], enforce_limits=False
+    )
+    assistant_response = wait_for_model(db, job, future)
+
+    crud.update_file_job(db, job, stage="saving", progress=90)
+    # Messages and the status change commit together, a retry never finds half of them
+    crud.complete_file_job(
+        db, job, f"Analyze this file: {job.file_name}", assistant_response,
+        file_content=file_text
+    )
+    if metadata.get("summary_due"):
+        memory.refresh_summary(job.conversation_id, job.user_id)
+    remove_upload(job.file_path)
+
+
+def _run_one(db) -> bool:
+    """Claim and process one job; returns False when the queue is empty"""
+    metrics.FILE_JOBS_QUEUED.set(crud.count_file_jobs(db, "queued"))
+    job = crud.claim_next_file_job(db)
+    if job is None:
+        return False
+
+    started = datetime.now(timezone.utc)
+    log_event(logger, "job_started", job_id=job.id, attempt=job.attempts, file_name=job.file_name)
+    try:
+        process_job(db, job)
+        status = "done"
+    except Exception as e:
+        db.rollback()
+        status = "queued" if job.attempts < JOB_MAX_ATTEMPTS else "failed"
+        crud.update_file_job(db, job, status=status, stage=status, error=str(e))
+        if status == "failed":
+            remove_upload(job.file_path)  # no retry left to read it
+        log_event(logger, "job_error", job_id=job.id, attempt=job.attempts, will_retry=status == "queued", error=str(e))
+
+    duration = (datetime.now(timezone.utc) - started).total_seconds()
+    metrics.FILE_JOB_DURATION.labels(status=status).observe(duration)
+    log_event(logger, "job_finished", job_id=job.id, status=status, duration=round(duration, 3))
+    return True
+
+
+def _worker_loop():
+    while not _stop.is_set():
+        db = database.SessionLocal()
+        try:
+            busy = _run_one(db)
+        except Exception as e:
+            log_event(logger, "worker_error", error=str(e))
+            busy = False
+        finally:
+            db.close()
+        if not busy:
+            _wakeup.wait(JOB_POLL_SECONDS)
+            _wakeup.clear()
+
+
+def start_workers(count: int = JOB_WORKERS):
+    """Requeue jobs orphaned by a previous crash and start the worker threads"""
+    db = database.SessionLocal()
+    try:
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_SECONDS)
+        requeued = crud.requeue_stale_file_jobs(db, stale_before)
+        if requeued:
+            log_event(logger, "jobs_requeued", count=requeued)
+    finally:
+        db.close()
+
+    _stop.clear()
+    for index in range(count):
+        worker = threading.Thread(target=_worker_loop, name=f"file-job-worker-{index}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+
+
+def stop_workers(timeout: float = 5):
+    _stop.set()
+    _wakeup.set()
+    for worker in _workers:
+        worker.join(timeout)
+    _workers.clear()
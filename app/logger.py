@@ -0,0 +1,51 @@
+"""
+Structured Logging
+JSON-lines logger so timings and routing decisions can be aggregated
+instead of read off print() output
+"""
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object: event name plus its fields"""
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def _configure_root() -> logging.Logger:
+    root = logging.getLogger("finesg")
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter())
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+    return root
+
+
+_configure_root()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Get a child of the application logger, e.g. get_logger("api")"""
+    return logging.getLogger(f"finesg.{name}")
+
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields):
+    """Log an event name with structured key/value fields"""
+    logger.log(level, event, extra={"fields": fields})
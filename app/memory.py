@@ -0,0 +1,77 @@
+"""
+Conversation Summary Memory
+Folds turns that aged out of the recent context window into a running
+summary stored on the conversation, so prompts stay small while long
+discussions keep their early facts. Refreshed after the response is sent.
+"""
+import threading
+
+from app import crud, database, metrics, routing
+from app.engine import context_manager, schedule_model
+from app.logger import get_logger, log_event
+
+logger = get_logger("memory")
+
+# Most history tokens folded in one refresh; the rest waits for the next one
+SUMMARY_MAX_INPUT_TOKENS = 1536
+
+# Routed to ROUTE_SUMMARY: base model, its own instructions and token budget
+SUMMARY_INSTRUCTION = routing.SUMMARY_REQUEST
+
+_refreshing = set()
+_lock = threading.Lock()
+
+
+def refresh_summary(conversation_id: int, user_id: int):
+    """Fold older unsummarized turns into the conversation summary (runs in the background)"""
+    if context_manager is None:
+        return
+    with _lock:
+        if conversation_id in _refreshing:
+            return  # a refresh for this conversation is already running
+        _refreshing.add(conversation_id)
+
+    db = database.SessionLocal()
+    try:
+        conversation = crud.get_conversation(db, conversation_id)
+        if conversation is None:
+            return
+        messages = crud.get_conversation_messages(db, conversation_id, after_id=conversation.summary_until_id)
+        older, _ = context_manager.split_for_summary(messages)
+
+        to_fold, folded_tokens = [], 0
+        for message in older:
+            text = context_manager.format_message(message)
+            folded_tokens += context_manager.message_tokens(message)
+            if to_fold and folded_tokens > SUMMARY_MAX_INPUT_TOKENS:
+                break
+            to_fold.append(text)
+        if not to_fold:
+            return
+
+        context = f"Summary so far:\n{conversation.summary}\n\n" if conversation.summary else ""
+        context += "Conversation:\n" + "".join(to_fold) + "\n"
+        summary = schedule_model(SUMMARY_INSTRUCTION, context, user_id, enforce_limits=False).result()
+
+        if not summary.strip() or summary.startswith("Error"):
+            metrics.SUMMARY_REFRESHES.labels(status="failed").inc()
+            log_event(logger, "summary_failed", conversation_id=conversation_id, error=summary[:200])
+            return
+
+        until_id = older[len(to_fold) - 1].id
+        crud.update_conversation_summary(db, conversation_id, summary.strip(), until_id)
+        metrics.SUMMARY_REFRESHES.labels(status="ok").inc()
+        log_event(
+            logger, "summary_refreshed",
+            conversation_id=conversation_id,
+            messages_folded=len(to_fold),
+            summary_chars=len(summary),
+            until_message_id=until_id,
+        )
+    except Exception as e:
+        metrics.SUMMARY_REFRESHES.labels(status="failed").inc()
+        log_event(logger, "summary_failed", conversation_id=conversation_id, error=str(e))
+    finally:
+        db.close()
+        with _lock:
+            _refreshing.discard(conversation_id)
@@ -0,0 +1,174 @@
+"""
+Prometheus Metrics
+Histograms and counters for inference, context building, database latency,
+routing and caches. Exposed on GET /metrics.
+
+Set PROMETHEUS_MULTIPROC_DIR when running several uvicorn workers so the
+endpoint aggregates all processes.
+"""
+import functools
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+from app import tracing
+
+# Seconds: from a few ms (DB, greetings) up to long CPU generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+# ============================================
+# INFERENCE
+# ============================================
+TIME_TO_FIRST_TOKEN = Histogram(
+    "finesg_time_to_first_token_seconds", "Time from request to first generated token",
+    ["engine", "route"], buckets=LATENCY_BUCKETS
+)
+GENERATION_TIME = Histogram(
+    "finesg_generation_seconds", "Model generation time",
+    ["engine", "route"], buckets=LATENCY_BUCKETS
+)
+TOKENS_PER_SECOND = Histogram(
+    "finesg_tokens_per_second", "Decode throughput per request",
+    ["engine", "route"], buckets=(0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+PROMPT_TOKENS = Counter("finesg_prompt_tokens_total", "Prompt tokens processed", ["engine", "route"])
+COMPLETION_TOKENS = Counter("finesg_completion_tokens_total", "Completion tokens generated", ["engine", "route"])
+GENERATIONS_CANCELLED = Counter(
+    "finesg_generations_cancelled_total", "Generations aborted before completion", ["reason"]
+)
+ROUTE_DECISIONS = Counter("finesg_route_decisions_total", "Queries per route (esg/base/greeting/summary)", ["route"])
+QUEUE_DEPTH = Gauge(
+    "finesg_inference_queue_depth", "Inference requests waiting or running", multiprocess_mode="livesum"
+)
+SCHEDULER_WAIT = Histogram(
+    "finesg_scheduler_wait_seconds", "Time spent queued before the model call started",
+    ["route"], buckets=LATENCY_BUCKETS
+)
+SCHEDULER_REJECTED = Counter(
+    "finesg_scheduler_rejected_total", "Requests shed by admission control", ["reason"]
+)
+FILE_JOBS_QUEUED = Gauge(
+    "finesg_file_jobs_queued", "File analysis jobs waiting in the queue", multiprocess_mode="livemax"
+)
+FILE_JOB_DURATION = Histogram(
+    "finesg_file_job_seconds", "File analysis job processing time", ["status"], buckets=LATENCY_BUCKETS
+)
+ASSISTED_ACCEPTANCE = Histogram(
+    "finesg_assisted_acceptance_ratio", "Share of draft-model tokens accepted by the target model",
+    ["route"], buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+)
+ASSISTED_TOKENS_PER_STEP = Histogram(
+    "finesg_assisted_tokens_per_target_step", "Tokens produced per target forward pass (upper bound on speedup)",
+    ["route"], buckets=(1, 1.25, 1.5, 2, 2.5, 3, 4, 5, 6)
+)
+LORA_ADAPTERS_LOADED = Gauge("finesg_lora_adapters_loaded", "LoRA adapters loaded on the shared base model")
+LORA_ADAPTER_BYTES = Gauge("finesg_lora_adapter_bytes", "Memory held by loaded LoRA adapter weights")
+
+# ============================================
+# CONTEXT
+# ============================================
+CONTEXT_BUILD_TIME = Histogram(
+    "finesg_context_build_seconds", "Time to load history and build the prompt context", buckets=DB_BUCKETS + (2.5, 5)
+)
+CONTEXT_MESSAGES = Histogram(
+    "finesg_context_messages_included", "History messages included in the context",
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128)
+)
+CONTEXT_TOKENS = Histogram(
+    "finesg_context_tokens", "Tokens of history included in the context",
+    buckets=(0, 64, 128, 256, 512, 1024, 2048, 4096)
+)
+CONTEXT_TRUNCATED = Counter("finesg_context_truncated_total", "Contexts that dropped older messages")
+SUMMARY_REFRESHES = Counter(
+    "finesg_summary_refreshes_total", "Conversation summary refreshes by result", ["status"]
+)
+ESG_FIGURES = Counter(
+    "finesg_esg_figures_total", "ESG figures extracted from uploaded reports", ["metric"]
+)
+
+# ============================================
+# DATABASE & CACHES
+# ============================================
+DB_LATENCY = Histogram("finesg_db_seconds", "Latency per crud function", ["function"], buckets=DB_BUCKETS)
+CACHE_REQUESTS = Counter("finesg_cache_requests_total", "Cache lookups by result (hit/miss)", ["cache", "result"])
+SINGLEFLIGHT_REQUESTS = Counter(
+    "finesg_singleflight_requests_total", "Requests that ran (leader), joined or replayed a shared result", ["flight", "outcome"]
+)
+ARCHIVE_MOVES = Counter(
+    "finesg_archive_conversations_total", "Conversations moved to cold storage or rehydrated", ["direction"]
+)
+ARCHIVE_MESSAGES = Counter(
+    "finesg_archive_messages_total", "Messages moved to cold storage or rehydrated", ["direction"]
+)
+
+
+def timed_db(func):
+    """Decorator recording a crud function's latency under its name (metric + Server-Timing span)"""
+    histogram = DB_LATENCY.labels(function=func.__name__)
+    span_name = f"db.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with tracing.span(span_name):
+                return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+    return wrapper
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def record_generation(
+    engine: str,
+    route: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    generation_time: float,
+    time_to_first_token: float = None
+):
+    """Record one model call"""
+    GENERATION_TIME.labels(engine=engine, route=route).observe(generation_time)
+    PROMPT_TOKENS.labels(engine=engine, route=route).inc(prompt_tokens)
+    COMPLETION_TOKENS.labels(engine=engine, route=route).inc(completion_tokens)
+    if generation_time > 0:
+        TOKENS_PER_SECOND.labels(engine=engine, route=route).observe(completion_tokens / generation_time)
+    if time_to_first_token is not None:
+        TIME_TO_FIRST_TOKEN.labels(engine=engine, route=route).observe(time_to_first_token)
+
+
+def record_assisted(route: str, new_tokens: int, target_steps: int, draft_steps: int):
+    """
+    Record one assisted generation. Each target pass verifies the drafted
+    tokens and adds one of its own, so accepted = new_tokens - target_steps.
+    """
+    if target_steps <= 0:
+        return
+    accepted = max(0, new_tokens - target_steps)
+    if draft_steps > 0:
+        ASSISTED_ACCEPTANCE.labels(route=route).observe(min(1.0, accepted / draft_steps))
+    ASSISTED_TOKENS_PER_STEP.labels(route=route).observe(new_tokens / target_steps)
+
+
+def record_context(build_time: float, metadata: dict):
+    CONTEXT_BUILD_TIME.observe(build_time)
+    CONTEXT_MESSAGES.observe(metadata["messages_included"])
+    CONTEXT_TOKENS.observe(metadata["context_tokens"])
+    if metadata["was_truncated"]:
+        CONTEXT_TRUNCATED.inc()
+
+
+def render():
+    """Return (body, content_type) for the /metrics endpoint"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,17 +1,57 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteriaList
 from peft import PeftModel
 import torch
-import re
+import os
+import threading
+import time
+
+from app import routing, metrics, runtime, tracing
+from app.adapters import AdapterCache, DEFAULT_ADAPTER, DEFAULT_ADAPTER_ID, parse_registry
+from app.chat_template import ChatTemplate
+from app.generation import StopOnSequences, StopOnCancel, TokenStreamer
+from app.logger import get_logger, log_event
+
+logger = get_logger("ml_engine")
+
+# Assisted (speculative) decoding: a small draft model sharing the Qwen
+# tokenizer proposes tokens that the base/ESG model verifies in one pass
+ASSISTED_DECODING = os.getenv("ASSISTED_DECODING", "0").lower() in ("1", "true", "yes")
+DRAFT_MODEL_ID = os.getenv("DRAFT_MODEL_ID", "Qwen/Qwen2.5-0.5B-Instruct")
+DRAFT_TOKENS = int(os.getenv("DRAFT_TOKENS", "5"))
+
+
+class ForwardCounter:
+    """Counts forward passes of hooked models, per thread, to measure draft acceptance"""
+    def __init__(self):
+        self._local = threading.local()
+
+    def attach(self, module, name: str):
+        module.register_forward_pre_hook(lambda _module, _args: self._increment(name))
+
+    def _increment(self, name: str):
+        counts = getattr(self._local, "counts", None)
+        if counts is not None:
+            counts[name] = counts.get(name, 0) + 1
+
+    def reset(self):
+        self._local.counts = {}
+
+    def get(self, name: str) -> int:
+        return getattr(self._local, "counts", {}).get(name, 0)
+
 
 class ModelRouter:
     def __init__(self):
-        # Base and adapter IDs
+        # Base model ID and the named LoRA adapters that may be served on it
         self.base_model_id = "Qwen/Qwen2.5-1.5B-Instruct"
-        self.adapter_id = "DeepakJ1218/fingesg4"
+        self.adapter_registry = parse_registry(os.getenv("LORA_ADAPTERS", ""))
 
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"[Router] Using device: {self.device}")
 
+        # Threads, pinning and allocator settings before any weights are allocated
+        self.runtime_profile = runtime.apply()
+
         # Load tokenizer (shared)
         print("[Router] Loading tokenizer...")
         self.tokenizer = AutoTokenizer.from_pretrained(
@@ -20,162 +60,253 @@ class ModelRouter:
         )
         if self.tokenizer.pad_token is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
+        # Decoder-only models continue from the right, so batches pad on the left
+        self.tokenizer.padding_side = "left"
+        # Prompts are assembled as token ids in Qwen's chat format (None: plain-text prompts)
+        self.template = ChatTemplate.for_tokenizer(self.tokenizer)
 
-        # ---- LOAD BASE MODEL (for general questions) ----
-        print("[Router] Loading base model (general chat)...")
-        self.base_model = AutoModelForCausalLM.from_pretrained(
-            self.base_model_id,
-            torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-            trust_remote_code=True,
-            low_cpu_mem_usage=True
-        ).to(self.device)
-        self.base_model.eval()
+        # EOS plus the chat end-of-turn markers all end an answer
+        self.eos_token_ids = [self.tokenizer.eos_token_id]
+        for token in ("<|im_end|>", "<|endoftext|>"):
+            token_id = self.tokenizer.convert_tokens_to_ids(token)
+            if token_id is not None and token_id != self.tokenizer.unk_token_id and token_id not in self.eos_token_ids:
+                self.eos_token_ids.append(token_id)
 
-        # ---- LOAD SEPARATE COPY + ESG ADAPTER ----
-        print("[Router] Loading ESG model (separate copy + adapter)...")
-        esg_base = AutoModelForCausalLM.from_pretrained(
+        # ---- LOAD BASE MODEL + DEFAULT ESG ADAPTER (one copy of the weights) ----
+        print("[Router] Loading base model + fingesg4 adapter...")
+        base = AutoModelForCausalLM.from_pretrained(
             self.base_model_id,
             torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
             trust_remote_code=True,
-            low_cpu_mem_usage=True
+            low_cpu_mem_usage=True,
+            use_safetensors=True
         )
-        
-        self.esg_model = PeftModel.from_pretrained(
-            esg_base,
-            self.adapter_id,
+        self.model = PeftModel.from_pretrained(
+            base,
+            DEFAULT_ADAPTER_ID,
+            adapter_name=DEFAULT_ADAPTER,
             trust_remote_code=True
         ).to(self.device)
-        self.esg_model.eval()
+        self.model.eval()
+
+        # Other adapters load on first use and are evicted LRU (general questions run with none)
+        self.adapters = AdapterCache(self.model, self.adapter_registry)
+
+        # ---- OPTIONAL DRAFT MODEL (assisted decoding) ----
+        self.draft_model = None
+        self.use_assisted = False
+        self.forward_counter = ForwardCounter()
+        if ASSISTED_DECODING:
+            print(f"[Router] Loading draft model for assisted decoding ({DRAFT_MODEL_ID})...")
+            self.draft_model = AutoModelForCausalLM.from_pretrained(
+                DRAFT_MODEL_ID,
+                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
+                trust_remote_code=True,
+                low_cpu_mem_usage=True,
+                use_safetensors=True
+            ).to(self.device)
+            self.draft_model.eval()
+            self.draft_model.generation_config.num_assistant_tokens = DRAFT_TOKENS
+            self.forward_counter.attach(self.draft_model, "draft")
+            self.forward_counter.attach(self.model.get_base_model(), "target")
+            self.use_assisted = True
+
+        print(f"[Router] ✓ Model loaded ({len(self.adapter_registry)} adapters available)\n")
 
-        print("[Router] ✓ Both models loaded successfully!\n")
+        if runtime.warmup_at_load():
+            self.warm_up()
+
+    def warm_up(self, max_tokens=runtime.WARMUP_TOKENS):
+        """
+        One short generation per route, so lazy kernel selection and
+        allocator growth happen at startup instead of in the first requests
+        (forked inference server workers run their own after runtime.apply)
+        """
+        print("[Router] Warming up...")
+        for route, message in runtime.WARMUP_PROMPTS.items():
+            start = time.perf_counter()
+            self.generate(self.prompt_for(route, message), self.adapter_for(route), max_tokens=max_tokens)
+            log_event(logger, "warmup", route=route, max_tokens=max_tokens, seconds=round(time.perf_counter() - start, 3))
 
     # ESG/Finance keyword detector
     def is_esg_query(self, text):
-        text = text.lower()
-        keywords = [
-            "esg", "environment", "carbon", "emissions", "sustainability",
-            "sdg", "scope 1", "scope 2", "scope 3",
-            "water usage", "pollution", "waste",
-            "company", "report", "disclosure", "footprint"
-        ]
-        return any(k in text for k in keywords)
+        return routing.is_esg_query(text)
+
+    def adapter_for(self, route, requested=None):
+        """Adapter for a request: the one asked for, else fingesg4 for ESG questions and none otherwise"""
+        if route == routing.ROUTE_SUMMARY:
+            return None  # summaries always run on the base model
+        if requested:
+            return requested
+        return DEFAULT_ADAPTER if route == routing.ROUTE_ESG else None
+
+    def prompt_for(self, route, user_message, conversation_context=""):
+        """Prompt token ids in the chat template (reusing a ChatContext's ids), else the plain-text prompt"""
+        if self.template is None:
+            return routing.build_prompt(route, user_message, conversation_context)
+        return self.template.prompt_ids(route, user_message, conversation_context)
 
     # Text generation helper with configurable token limit
-    def generate(self, model, prompt, max_tokens=100):
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
-        
-        with torch.no_grad():
-            output_ids = model.generate(
+    def generate(self, prompt, adapter=None, max_tokens=100, stats=None, cancel_event=None, on_token=None, route=None):
+        """
+        Generate a reply for prompt (text, or token ids from prompt_for) with
+        the named LoRA adapter (None = base model)
+
+        Pass a dict as stats to receive prompt_tokens, time_to_first_token
+        (seconds), new_tokens and, with assisted decoding, target/draft
+        forward counts; a threading.Event as cancel_event to abort early (the
+        partial reply is returned) and a callback as on_token to receive text
+        as it is decoded. route selects the reply cleanup (routing.clean_reply).
+        """
+        streamer = TokenStreamer(self.tokenizer, on_token, route)
+        if isinstance(prompt, str):
+            inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
+        else:
+            input_ids = torch.tensor([list(prompt)], dtype=torch.long, device=self.device)
+            inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+        prompt_length = inputs["input_ids"].shape[1]
+
+        stopping_criteria = StoppingCriteriaList([
+            StopOnSequences(self.tokenizer, prompt_length, eos_token_ids=self.eos_token_ids)
+        ])
+        if cancel_event is not None:
+            stopping_criteria.append(StopOnCancel(cancel_event))
+
+        assisted = self.use_assisted and self.draft_model is not None
+        extra_kwargs = {}
+        if assisted:
+            extra_kwargs["assistant_model"] = self.draft_model
+            self.forward_counter.reset()
+
+        with self.adapters.use(adapter), torch.no_grad(), tracing.span("model.generate"):
+            output_ids = self.model.generate(
                 **inputs,
                 max_new_tokens=max_tokens,
                 do_sample=True,
                 top_p=0.9,
                 temperature=0.7,
-                pad_token_id=self.tokenizer.eos_token_id
+                pad_token_id=self.tokenizer.pad_token_id,
+                eos_token_id=self.eos_token_ids,
+                stopping_criteria=stopping_criteria,
+                streamer=streamer,
+                **extra_kwargs
             )
 
-        text = self.tokenizer.decode(output_ids[0], skip_special_tokens=True)
-        
-        # Extract only response after "Assistant:"
-        if "Assistant:" in text:
-            text = text.split("Assistant:")[-1].strip()
-        
-        # Remove ALL hashtags
-        text = re.sub(r'#\w+', '', text)
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        return text
+        # Decode only the newly generated ids, never the prompt
+        new_ids = output_ids[0, prompt_length:]
+
+        if stats is not None:
+            stats["prompt_tokens"] = prompt_length
+            stats["time_to_first_token"] = streamer.time_to_first_token
+            stats["new_tokens"] = len(new_ids)
+            stats["assisted"] = assisted
+            if assisted:
+                stats["target_steps"] = self.forward_counter.get("target")
+                stats["draft_steps"] = self.forward_counter.get("draft")
+
+        text = self.tokenizer.decode(new_ids, skip_special_tokens=False)
+        return routing.clean_reply(text, route)
+
+    def generate_batch(self, prompts, adapter=None, max_tokens=100):
+        """
+        Generate replies for several prompts in one padded batch (offline
+        batch runs, grouped by adapter); rows that hit a stop sequence finish early
+        """
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+        prompt_length = inputs["input_ids"].shape[1]
+        stopping_criteria = StoppingCriteriaList([
+            StopOnSequences(self.tokenizer, prompt_length, eos_token_ids=self.eos_token_ids)
+        ])
+
+        with self.adapters.use(adapter), torch.no_grad(), tracing.span("model.generate_batch"):
+            output_ids = self.model.generate(
+                **inputs,
+                max_new_tokens=max_tokens,
+                do_sample=True,
+                top_p=0.9,
+                temperature=0.7,
+                pad_token_id=self.tokenizer.pad_token_id,
+                eos_token_id=self.eos_token_ids,
+                stopping_criteria=stopping_criteria,
+            )
+
+        replies = []
+        for row in output_ids[:, prompt_length:]:
+            replies.append(routing.clean_reply(self.tokenizer.decode(row, skip_special_tokens=False)))
+        return replies
 
     # Main predict function with conversation context support
-    def predict(self, user_message: str, conversation_context: str = "") -> str:
-        """Routes to model and returns clean response with performance logging."""
-        import time
+    def predict(
+        self,
+        user_message: str,
+        conversation_context: str = "",
+        cancel_event=None,
+        on_token=None,
+        adapter=None
+    ) -> str:
+        """
+        Routes to model and returns clean response with performance logging.
         
+        cancel_event (threading.Event) stops generation early; on_token
+        receives streamed text pieces; adapter picks a named LoRA adapter
+        instead of the route's default.
+        """
         start_time = time.time()
         
         try:
-            # Log input metrics
-            input_chars = len(user_message)
-            print(f"\n{'='*60}")
-            print(f"📥 INPUT: {input_chars} characters")
-            if conversation_context:
-                print(f"📜 Context: Included")
-            print(f"Query: {user_message[:100]}..." if len(user_message) > 100 else f"Query: {user_message}")
+            route = routing.classify(user_message)
+            max_tokens = routing.token_budget(route, user_message)
+            metrics.ROUTE_DECISIONS.labels(route=route).inc()
             
-            # Detect simple greetings/small talk
-            greetings = ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening', 'thanks', 'thank you', 'ok', 'okay']
-            is_greeting = any(greeting in user_message.lower() for greeting in greetings) and len(user_message.split()) <= 5
+            adapter = self.adapter_for(route, adapter)
+            model_name = f"lora-{adapter}" if adapter else "base-qwen2.5-1.5b"
+            prompt = self.prompt_for(route, user_message, conversation_context)
             
-            if self.is_esg_query(user_message):
-                # Use ESG fine-tuned model - FASTER with reduced tokens
-                print(f"🎯 Model: ESG (fingesg3) | Max Tokens: 512")
-                prompt = (
-                    f"{conversation_context}"
-                    f"You are an ESG & Finance specialist. Provide clear analysis using markdown.\n"
-                    f"DO NOT add hashtags or emojis. Be professional and concise.\n\n"
-                    f"User: {user_message}\nAssistant:"
-                )
-                
-                gen_start = time.time()
-                response = self.generate(self.esg_model, prompt, max_tokens=512)
-                gen_time = time.time() - gen_start
-                
-                final_response = response  # Clean response without footer
-            
-            elif is_greeting:
-                # SHORT response for greetings
-                print(f"🎯 Model: Base (Qwen 2.5-1.5B) | Max Tokens: 50 (greeting)")
-                prompt = (
-                    f"{conversation_context}"
-                    f"You are a friendly AI assistant. Give a brief, natural response.\n"
-                    f"Keep it under 20 words. No explanations.\n\n"
-                    f"User: {user_message}\nAssistant:"
-                )
-                
-                gen_start = time.time()
-                response = self.generate(self.base_model, prompt, max_tokens=50)
-                gen_time = time.time() - gen_start
-                
-                # No footer for greetings
-                final_response = response.strip()
-            
-            else:
-                # Regular questions - medium response
-                print(f"🎯 Model: Base (Qwen 2.5-1.5B) | Max Tokens: 250")
-                prompt = (
-                    f"{conversation_context}"
-                    f"You are a helpful AI assistant. Answer the question clearly and concisely.\n"
-                    f"Use the conversation history if available. Be accurate and brief.\n"
-                    f"Stop when you've fully answered the question.\n\n"
-                    f"User: {user_message}\nAssistant:"
-                )
-                
-                gen_start = time.time()
-                response = self.generate(self.base_model, prompt, max_tokens=250)
-                gen_time = time.time() - gen_start
-                
-                final_response = response  # Clean response without footer
+            stats = {}
+            gen_start = time.time()
+            final_response = self.generate(
+                prompt, adapter, max_tokens=max_tokens, stats=stats,
+                cancel_event=cancel_event, on_token=on_token, route=route
+            ).strip()
+            gen_time = time.time() - gen_start
             
             # Calculate metrics
             total_time = time.time() - start_time
-            output_chars = len(final_response)
             
-            # Accurate token counting
-            input_tokens = len(self.tokenizer.encode(user_message))
-            output_tokens = len(self.tokenizer.encode(final_response))
+            # Lengths of the ids actually fed to and produced by the model
+            input_tokens = stats["prompt_tokens"]
+            output_tokens = stats["new_tokens"]
             tokens_per_sec = output_tokens / gen_time if gen_time > 0 else 0
             
-            # Log output metrics
-            print(f"\n📤 OUTPUT: {output_chars} characters, {output_tokens} tokens")
-            print(f"⏱️  Generation Time: {gen_time:.2f}s ({tokens_per_sec:.1f} tokens/sec)")
-            print(f"⏱️  Total Time: {total_time:.2f}s")
-            print(f"🔢 Input Tokens: {input_tokens} | Output Tokens: {output_tokens}")
-            print(f"{'='*60}\n")
+            engine_name = "hf-assisted" if stats.get("assisted") else "hf"
+            metrics.record_generation(
+                engine_name, route, input_tokens, output_tokens, gen_time, stats.get("time_to_first_token")
+            )
+            if stats.get("assisted"):
+                metrics.record_assisted(route, stats["new_tokens"], stats["target_steps"], stats["draft_steps"])
+            log_event(
+                logger, "generation",
+                engine=engine_name,
+                route=route,
+                model=model_name,
+                adapter=adapter,
+                max_tokens=max_tokens,
+                has_context=bool(conversation_context),
+                input_chars=len(user_message),
+                output_chars=len(final_response),
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                time_to_first_token=stats.get("time_to_first_token"),
+                generation_time=round(gen_time, 3),
+                tokens_per_sec=round(tokens_per_sec, 1),
+                total_time=round(total_time, 3),
+                cancelled=bool(cancel_event and cancel_event.is_set()),
+            )
             
             return final_response
                 
         except Exception as e:
-            print(f"❌ Error: {e}")
+            logger.exception("generation_failed", extra={"fields": {"engine": "hf"}})
             return f"Error: {e}"
 
 
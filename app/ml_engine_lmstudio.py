@@ -1,6 +1,15 @@
 from openai import OpenAI
+import logging
 import time
 
+from app import routing, metrics, tracing
+from app.logger import get_logger, log_event
+
+logger = get_logger("ml_engine_lmstudio")
+
+# OpenAI-compatible servers accept at most 4 stop sequences
+LMSTUDIO_STOP_SEQUENCES = ["\nUser:", "\nAssistant:", "<|im_end|>", "<|endoftext|>"]
+
 class SimpleTokenizer:
     """Simple tokenizer for counting tokens (approximate)"""
     def encode(self, text):
@@ -26,19 +35,35 @@ class ModelRouter:
         
         print("✓ Connected to LM Studio server")
     
-    def predict(self, user_message: str, conversation_context: str = "") -> str:
-        """Generate response using LM Studio"""
+    def predict(self, user_message: str, conversation_context: str = "", cancel_event=None, on_token=None) -> str:
+        """
+        Generate response using LM Studio
+        
+        Setting cancel_event closes the HTTP stream so LM Studio stops
+        generating; on_token receives streamed text pieces.
+        """
         
         start_time = time.time()
         
         try:
+            route = routing.classify(user_message)
+            metrics.ROUTE_DECISIONS.labels(route=route).inc()
+            
+            # Summary refreshes get their own instructions and budget, chat the specialist prompt
+            if route == routing.ROUTE_SUMMARY:
+                system_prompt = routing.ROUTE_INSTRUCTIONS[route]
+                max_tokens = routing.token_budget(route, user_message)
+            else:
+                system_prompt = "You are an ESG (Environmental, Social, Governance) specialist. Provide clear, professional analysis."
+                max_tokens = 2000
+            
             # Build messages
             messages = []
             
             # System prompt
             messages.append({
                 "role": "system",
-                "content": "You are an ESG (Environmental, Social, Governance) specialist. Provide clear, professional analysis."
+                "content": system_prompt
             })
             
             # Add context if provided
@@ -52,26 +77,62 @@ class ModelRouter:
             })
             
             # Call LM Studio (works with whatever model is loaded)
-            print(f"🎯 Model: LM Studio (fingesg4) | Max Tokens: 2000")
-            response = self.client.chat.completions.create(
-                model="local-model",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=2000,
-                stream=False
-            )
+            # Streamed so time-to-first-token can be measured
+            with tracing.span("model.lmstudio"):
+                stream = self.client.chat.completions.create(
+                    model="local-model",
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=max_tokens,
+                    stop=LMSTUDIO_STOP_SEQUENCES,
+                    stream=True
+                )
+                
+                time_to_first_token = None
+                chunks = []
+                for chunk in stream:
+                    if cancel_event is not None and cancel_event.is_set():
+                        stream.close()  # drops the connection, LM Studio aborts the completion
+                        break
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if time_to_first_token is None:
+                            time_to_first_token = time.time() - start_time
+                        chunks.append(delta)
+                        if on_token is not None:
+                            on_token(delta)
             
-            result = response.choices[0].message.content.strip()
+            result = routing.truncate_at_stop("".join(chunks)).strip()
             
             total_time = time.time() - start_time
-            print(f"⚡ LM Studio response in {total_time:.2f}s")
-            print(f"📤 OUTPUT: {len(result)} characters")
-            print(f"⏱️  Total Time: {total_time:.2f}s\n")
+            prompt_tokens = sum(len(self.tokenizer.encode(m["content"])) for m in messages)
+            completion_tokens = len(chunks)  # one streamed chunk per token
+            
+            metrics.record_generation(
+                "lmstudio", route, prompt_tokens, completion_tokens, total_time, time_to_first_token
+            )
+            log_event(
+                logger, "generation",
+                engine="lmstudio",
+                route=route,
+                model="fingesg4",
+                max_tokens=max_tokens,
+                has_context=bool(conversation_context),
+                output_chars=len(result),
+                input_tokens=prompt_tokens,
+                output_tokens=completion_tokens,
+                time_to_first_token=time_to_first_token,
+                tokens_per_sec=round(completion_tokens / total_time, 1) if total_time > 0 else 0,
+                total_time=round(total_time, 3),
+                cancelled=bool(cancel_event and cancel_event.is_set()),
+            )
             
             return result
             
         except Exception as e:
-            print(f"❌ LM Studio Error: {e}")
+            log_event(logger, "generation_failed", logging.ERROR, engine="lmstudio", error=str(e))
             return f"Error: Make sure LM Studio server is running on http://localhost:1234"
 
 
@@ -0,0 +1,159 @@
+"""
+ONNX Runtime Model Engine
+Runs the base model and the merged ESG model (fingesg4 folded into Qwen2.5)
+through onnxruntime's CPU execution provider with the KV cache exported as
+graph inputs/outputs. Export the models first:
+
+    python -m scripts.export_onnx [--int8]
+
+Settings (environment):
+  ONNX_DIR      - export directory with base/ and esg/ (default ./onnx_models)
+  ONNX_INT8     - use the int8 dynamically quantized weights (default 0)
+  ONNX_THREADS  - intra-op threads per session (default 0 = onnxruntime picks)
+"""
+import logging
+import os
+import time
+
+import onnxruntime as ort
+import torch
+from optimum.onnxruntime import ORTModelForCausalLM
+from transformers import AutoTokenizer, StoppingCriteriaList
+
+from app import routing, metrics, tracing
+from app.generation import StopOnSequences, StopOnCancel, TokenStreamer
+from app.logger import get_logger, log_event
+
+logger = get_logger("ml_engine_onnx")
+
+ONNX_DIR = os.getenv("ONNX_DIR", "./onnx_models")
+ONNX_INT8 = os.getenv("ONNX_INT8", "0").lower() in ("1", "true", "yes")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+
+
+def session_options() -> ort.SessionOptions:
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if ONNX_THREADS > 0:
+        options.intra_op_num_threads = ONNX_THREADS
+    return options
+
+
+def load_onnx_model(path: str, int8: bool = ONNX_INT8) -> ORTModelForCausalLM:
+    """Load an exported decoder (with past key/values) on the CPU provider"""
+    return ORTModelForCausalLM.from_pretrained(
+        path,
+        file_name=INT8_FILE if int8 else FP32_FILE,
+        provider="CPUExecutionProvider",
+        session_options=session_options(),
+        use_cache=True,
+        use_io_binding=False,
+    )
+
+
+class ModelRouter:
+    """Same interface as app.ml_engine.ModelRouter, backed by onnxruntime"""
+
+    def __init__(self, onnx_dir: str = ONNX_DIR, int8: bool = ONNX_INT8):
+        self.precision = "int8" if int8 else "fp32"
+        print(f"[ONNX] Loading tokenizer and {self.precision} sessions from {onnx_dir}...")
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.join(onnx_dir, "base"), trust_remote_code=True)
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        self.eos_token_ids = [self.tokenizer.eos_token_id]
+        for token in ("<|im_end|>", "<|endoftext|>"):
+            token_id = self.tokenizer.convert_tokens_to_ids(token)
+            if token_id is not None and token_id != self.tokenizer.unk_token_id and token_id not in self.eos_token_ids:
+                self.eos_token_ids.append(token_id)
+
+        self.base_model = load_onnx_model(os.path.join(onnx_dir, "base"), int8)
+        self.esg_model = load_onnx_model(os.path.join(onnx_dir, "esg"), int8)
+        print("[ONNX] ✓ Base and ESG sessions ready\n")
+
+    def generate(self, model, prompt, max_tokens=100, stats=None, cancel_event=None, on_token=None, do_sample=True, route=None):
+        """Generate a reply for prompt; see app.ml_engine.ModelRouter.generate"""
+        streamer = TokenStreamer(self.tokenizer, on_token, route)
+        inputs = self.tokenizer(prompt, return_tensors="pt")
+        prompt_length = inputs["input_ids"].shape[1]
+
+        stopping_criteria = StoppingCriteriaList([
+            StopOnSequences(self.tokenizer, prompt_length, eos_token_ids=self.eos_token_ids)
+        ])
+        if cancel_event is not None:
+            stopping_criteria.append(StopOnCancel(cancel_event))
+
+        sampling = {"do_sample": True, "top_p": 0.9, "temperature": 0.7} if do_sample else {"do_sample": False}
+        with torch.no_grad(), tracing.span("model.generate"):
+            output_ids = model.generate(
+                **inputs,
+                max_new_tokens=max_tokens,
+                pad_token_id=self.tokenizer.pad_token_id,
+                eos_token_id=self.eos_token_ids,
+                stopping_criteria=stopping_criteria,
+                streamer=streamer,
+                **sampling
+            )
+
+        new_ids = output_ids[0, prompt_length:]
+        if stats is not None:
+            stats["time_to_first_token"] = streamer.time_to_first_token
+            stats["new_tokens"] = len(new_ids)
+
+        return routing.clean_reply(self.tokenizer.decode(new_ids, skip_special_tokens=False), route)
+
+    def predict(self, user_message: str, conversation_context: str = "", cancel_event=None, on_token=None) -> str:
+        start_time = time.time()
+        try:
+            route = routing.classify(user_message)
+            max_tokens = routing.token_budget(route, user_message)
+            metrics.ROUTE_DECISIONS.labels(route=route).inc()
+
+            model = self.esg_model if route == routing.ROUTE_ESG else self.base_model
+            prompt = routing.build_prompt(route, user_message, conversation_context)
+
+            stats = {}
+            gen_start = time.time()
+            final_response = self.generate(
+                model, prompt, max_tokens=max_tokens, stats=stats,
+                cancel_event=cancel_event, on_token=on_token, route=route
+            ).strip()
+            gen_time = time.time() - gen_start
+
+            input_tokens = len(self.tokenizer.encode(user_message))
+            output_tokens = len(self.tokenizer.encode(final_response))
+            metrics.record_generation(
+                "onnx", route, input_tokens, output_tokens, gen_time, stats.get("time_to_first_token")
+            )
+            log_event(
+                logger, "generation",
+                engine="onnx",
+                precision=self.precision,
+                route=route,
+                max_tokens=max_tokens,
+                has_context=bool(conversation_context),
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                time_to_first_token=stats.get("time_to_first_token"),
+                generation_time=round(gen_time, 3),
+                tokens_per_sec=round(output_tokens / gen_time, 1) if gen_time > 0 else 0,
+                total_time=round(time.time() - start_time, 3),
+                cancelled=bool(cancel_event and cancel_event.is_set()),
+            )
+            return final_response
+
+        except Exception as e:
+            log_event(logger, "generation_failed", logging.ERROR, engine="onnx", error=str(e))
+            return f"Error: {e}"
+
+
+# Global instance
+try:
+    model_instance = ModelRouter()
+except Exception as e:
+    print(f"❌ Failed to load ONNX models from {ONNX_DIR}: {e}")
+    print("   Run: python -m scripts.export_onnx")
+    model_instance = None
@@ -0,0 +1,78 @@
+"""
+Remote Model Engine
+Client for the standalone inference server (python -m app.inference_server).
+API workers only load the tokenizer (for context budgeting); the model
+weights live once in the inference server process.
+"""
+import logging
+import os
+import select
+import time
+
+from transformers import AutoTokenizer
+
+from app import inference_protocol as protocol
+from app import tracing
+from app.logger import get_logger, log_event
+
+logger = get_logger("ml_engine_remote")
+
+TOKENIZER_ID = os.getenv("INFERENCE_TOKENIZER", "Qwen/Qwen2.5-1.5B-Instruct")
+
+# How often a waiting client checks its cancel event
+CANCEL_POLL_SECONDS = 0.1
+
+
+class ModelRouter:
+    """Same interface as app.ml_engine.ModelRouter, served over a local socket"""
+
+    def __init__(self, address: str = protocol.INFERENCE_SOCKET):
+        self.address = address
+        self.tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_ID, trust_remote_code=True)
+        print(f"✓ Using inference server at {address}")
+
+    def predict(self, user_message: str, conversation_context: str = "", cancel_event=None, on_token=None) -> str:
+        start_time = time.time()
+        try:
+            with tracing.span("model.remote"):
+                sock = protocol.connect(self.address)
+                try:
+                    protocol.send_frame(
+                        sock, protocol.PREDICT,
+                        protocol.encode_predict(user_message, conversation_context, stream=on_token is not None)
+                    )
+                    return self._read_reply(sock, cancel_event, on_token)
+                finally:
+                    sock.close()
+        except Exception as e:
+            log_event(logger, "generation_failed", logging.ERROR, engine="remote", error=str(e),
+                      total_time=round(time.time() - start_time, 3))
+            return f"Error: inference server unavailable at {self.address}"
+
+    def _read_reply(self, sock, cancel_event, on_token) -> str:
+        pieces = []
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                # Server aborts generation on CANCEL; keep what was streamed
+                protocol.send_frame(sock, protocol.CANCEL)
+                return "".join(pieces)
+            readable, _, _ = select.select([sock], [], [], CANCEL_POLL_SECONDS)
+            if not readable:
+                continue
+            frame_type, body = protocol.recv_frame(sock)
+            text = body.decode("utf-8")
+            if frame_type == protocol.TOKEN:
+                pieces.append(text)
+                on_token(text)
+            elif frame_type == protocol.RESULT:
+                return text
+            elif frame_type == protocol.ERROR:
+                raise RuntimeError(text)
+
+
+# Global instance
+try:
+    model_instance = ModelRouter()
+except Exception as e:
+    print(f"❌ Failed to initialize remote model client: {e}")
+    model_instance = None
@@ -0,0 +1,93 @@
+"""
+Stub Model Engine
+Deterministic stand-in for the real models, used by the benchmark suite.
+Emits tokens at a configurable rate so server overhead can be measured
+without a GPU or LM Studio:
+  STUB_TOKENS_PER_SEC - decode speed (default 200)
+  STUB_TTFT_MS        - time to first token / prefill (default 50)
+"""
+import hashlib
+import os
+import random
+import time
+
+from app import routing, metrics, tracing
+from app.logger import get_logger, log_event
+
+logger = get_logger("ml_engine_stub")
+
+VOCAB = [
+    "emissions", "scope", "carbon", "disclosure", "governance", "board", "water",
+    "waste", "report", "the", "and", "of", "company", "reduced", "increased",
+    "target", "net-zero", "supply", "chain", "risk", "climate", "social", "energy",
+]
+
+
+class StubTokenizer:
+    """Whitespace tokenizer: one token per word"""
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, ids):
+        return " ".join(ids)
+
+    @property
+    def eos_token_id(self):
+        return 0
+
+
+class ModelRouter:
+    """Fake model returning deterministic text at a fixed token rate"""
+
+    def __init__(self):
+        self.tokens_per_sec = float(os.getenv("STUB_TOKENS_PER_SEC", "200"))
+        self.ttft = float(os.getenv("STUB_TTFT_MS", "50")) / 1000
+        self.tokenizer = StubTokenizer()
+
+    def _completion(self, user_message: str, max_tokens: int) -> list:
+        """Same message -> same answer; length is 50-100% of the budget"""
+        seed = int.from_bytes(hashlib.sha256(user_message.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        length = rng.randint(max(1, max_tokens // 2), max_tokens)
+        return [rng.choice(VOCAB) for _ in range(length)]
+
+    def predict(self, user_message: str, conversation_context: str = "", cancel_event=None, on_token=None) -> str:
+        start_time = time.time()
+        route = routing.classify(user_message)
+        max_tokens = routing.token_budget(route, user_message)
+        metrics.ROUTE_DECISIONS.labels(route=route).inc()
+
+        words = self._completion(user_message, max_tokens)
+        with tracing.span("model.stub"):
+            if on_token is None and cancel_event is None:
+                time.sleep(self.ttft + len(words) / self.tokens_per_sec)
+            else:
+                # Token by token so streaming and cancellation behave like a real model
+                time.sleep(self.ttft)
+                emitted = []
+                for word in words:
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    time.sleep(1 / self.tokens_per_sec)
+                    emitted.append(word)
+                    if on_token is not None:
+                        on_token(word if len(emitted) == 1 else " " + word)
+                words = emitted
+        result = " ".join(words)
+
+        total_time = time.time() - start_time
+        prompt_tokens = len(self.tokenizer.encode(conversation_context + user_message))
+        metrics.record_generation("stub", route, prompt_tokens, len(words), total_time, self.ttft)
+        log_event(
+            logger, "generation",
+            engine="stub",
+            route=route,
+            max_tokens=max_tokens,
+            input_tokens=prompt_tokens,
+            output_tokens=len(words),
+            total_time=round(total_time, 3),
+        )
+        return result
+
+
+model_instance = ModelRouter()
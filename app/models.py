@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from app.database import Base
+from app.compression import CompressedText
 
 class User(Base):
     __tablename__ = "users"
@@ -21,6 +22,10 @@ class Conversation(Base):
     title = Column(String, default="New Chat")
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    summary = Column(Text, nullable=True)  # Rolling summary of turns older than the context window
+    summary_until_id = Column(Integer, nullable=True)  # Last message folded into summary
+    last_message_id = Column(Integer, nullable=True)  # Message high-water mark (ETags)
+    archived_at = Column(DateTime, nullable=True)  # Set while messages live in messages_archive
 
     owner = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan", order_by="Message.created_at")
@@ -28,13 +33,77 @@ class Conversation(Base):
 class Message(Base):
     """Individual messages within a conversation"""
     __tablename__ = "messages"
+    # Ids must stay unique across messages and messages_archive: without
+    # AUTOINCREMENT SQLite would hand archived messages' ids to new ones
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(Integer, ForeignKey("conversations.id"))
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), index=True)
     role = Column(String)  # "user" or "assistant"
-    content = Column(Text)
+    content = Column(CompressedText)
     file_name = Column(String, nullable=True)  # For file uploads
-    file_content = Column(Text, nullable=True)  # Store full file content
+    file_content = Column(CompressedText, nullable=True)  # Store full file content
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     conversation = relationship("Conversation", back_populates="messages")
+
+class MessageArchive(Base):
+    """Cold storage for messages of inactive conversations (same ids and columns as messages)"""
+    __tablename__ = "messages_archive"
+
+    id = Column(Integer, primary_key=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), index=True)
+    role = Column(String)
+    content = Column(CompressedText)
+    file_name = Column(String, nullable=True)
+    file_content = Column(CompressedText, nullable=True)
+    created_at = Column(DateTime)
+
+class FileJob(Base):
+    """Background file analysis job; the table doubles as the persistent work queue"""
+    __tablename__ = "file_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    conversation_id = Column(Integer, ForeignKey("conversations.id"))
+    status = Column(String, default="queued", index=True)  # queued, running, done, failed
+    stage = Column(String, default="queued")  # extracting, analyzing, saving
+    progress = Column(Integer, default=0)  # 0-100
+    attempts = Column(Integer, default=0)
+    file_name = Column(String)
+    content_type = Column(String)
+    file_path = Column(String)  # Upload spooled to disk until processed
+    error = Column(Text, nullable=True)
+    message_id = Column(Integer, ForeignKey("messages.id"), nullable=True)  # Assistant reply once done
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+class Document(Base):
+    """A report loaded by the bulk corpus ingestion (scripts.ingest_corpus); its text lives in chunks"""
+    __tablename__ = "documents"
+    __table_args__ = (Index("ix_documents_user_sha256", "user_id", "sha256", unique=True),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    sha256 = Column(String)  # Content hash; the same file is only stored once per user
+    file_name = Column(String)
+    source_path = Column(String)  # Relative to the ingested directory
+    size_bytes = Column(Integer)
+    chars = Column(Integer)
+    tokens = Column(Integer)
+    chunk_count = Column(Integer)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan", order_by="DocumentChunk.chunk_index")
+
+class DocumentChunk(Base):
+    """Token-bounded piece of a document's extracted text"""
+    __tablename__ = "document_chunks"
+
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), index=True)
+    chunk_index = Column(Integer)
+    content = Column(CompressedText)
+    tokens = Column(Integer)
+
+    document = relationship("Document", back_populates="chunks")
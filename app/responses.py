@@ -0,0 +1,100 @@
+"""
+Fast JSON Responses
+Conditional GET (ETag / Last-Modified -> 304) and a serialization path that
+dumps plain dicts built from row tuples with orjson, compressed with br or
+gzip when the client accepts it. Used by the polled conversation endpoints.
+"""
+import gzip
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+try:
+    import orjson
+except ImportError:  # falls back to the stdlib encoder
+    orjson = None
+    import json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this aren't worth compressing
+COMPRESS_MIN_BYTES = 1024
+
+# Clients may keep a copy but must revalidate it on every poll
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag (the body may be re-encoded) from the values that version a resource"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes; they're stored in UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(_as_utc(value).replace(microsecond=0), usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """True when the client's cached copy (If-None-Match / If-Modified-Since) is current"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return _as_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def _validators(etag: str, last_modified: Optional[datetime]) -> dict:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding, Cookie"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    return Response(status_code=304, headers=_validators(etag, last_modified))
+
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, default=lambda value: value.isoformat(), separators=(",", ":")).encode("utf-8")
+
+
+def json_response(request: Request, payload, etag: str, last_modified: Optional[datetime] = None) -> Response:
+    """Serialize payload (dicts/lists of plain values) and compress it if worthwhile"""
+    body = dumps(payload)
+    headers = _validators(etag, last_modified)
+
+    if len(body) >= COMPRESS_MIN_BYTES:
+        accepted = {
+            coding.split(";")[0].strip().lower()
+            for coding in request.headers.get("accept-encoding", "").split(",")
+        }
+        if brotli is not None and "br" in accepted:
+            body = brotli.compress(body, quality=4)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,210 @@
+"""
+Query Routing Helpers
+Shared by the model engines: picks a route (ESG / greeting / base, or
+summary for app.memory's refreshes) for a query, sizes its generation
+budget, builds the prompt and lists the stop sequences
+"""
+import re
+from typing import List
+
+ROUTE_ESG = "esg"
+ROUTE_GREETING = "greeting"
+ROUTE_BASE = "base"
+ROUTE_SUMMARY = "summary"
+
+# The request app.memory sends to fold old turns into the conversation
+# summary; routed on its own (base model, no adapter), never by keywords
+SUMMARY_REQUEST = (
+    "Summarize the conversation above in under 150 words for your own memory. "
+    "Keep company names, figures, dates, ESG metrics and the user's goals."
+)
+
+# ESG/Finance keyword detector
+ESG_KEYWORDS = [
+    "esg", "environment", "carbon", "emissions", "sustainability",
+    "sdg", "scope 1", "scope 2", "scope 3",
+    "water usage", "pollution", "waste",
+    "company", "report", "disclosure", "footprint"
+]
+
+# Simple greetings/small talk
+GREETINGS = ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening', 'thanks', 'thank you', 'ok', 'okay']
+
+# Hard ceiling (the old fixed limits) and floor of new tokens per route
+# (150 words of summary is about 200 tokens)
+MAX_TOKENS = {ROUTE_ESG: 512, ROUTE_BASE: 250, ROUTE_GREETING: 50, ROUTE_SUMMARY: 200}
+MIN_TOKENS = {ROUTE_ESG: 160, ROUTE_BASE: 64, ROUTE_GREETING: 24, ROUTE_SUMMARY: 200}
+
+# Extra tokens granted per word of the question
+TOKENS_PER_QUERY_WORD = 8
+
+# Questions asking for depth get the full ceiling, quick lookups the floor
+DETAIL_HINTS = ("explain", "analy", "compare", "describe", "detail", "summar", "list", "breakdown", "step by step", "why", "how does", "how do")
+BRIEF_HINTS = ("what is", "what's", "define", "who is", "when ", "briefly", "in one sentence", "yes or no", "short answer")
+
+# Role markers that mean the model has finished its answer and started
+# writing the next turn of the conversation itself
+STOP_SEQUENCES = ["\nUser:", "\nuser:", "\nAssistant:", "\nSystem:", "<|im_end|>", "<|endoftext|>"]
+
+
+def is_esg_query(text: str) -> bool:
+    text = text.lower()
+    return any(k in text for k in ESG_KEYWORDS)
+
+
+def is_greeting(text: str) -> bool:
+    return any(greeting in text.lower() for greeting in GREETINGS) and len(text.split()) <= 5
+
+
+def classify(user_message: str) -> str:
+    """Pick the route for a query: ESG model, short greeting or base model (or a summary refresh)"""
+    if user_message == SUMMARY_REQUEST:
+        return ROUTE_SUMMARY
+    if is_esg_query(user_message):
+        return ROUTE_ESG
+    if is_greeting(user_message):
+        return ROUTE_GREETING
+    return ROUTE_BASE
+
+
+def token_budget(route: str, user_message: str) -> int:
+    """
+    Max new tokens for a query, adapted to its length and type
+
+    Short factual questions get the route's floor, longer or "explain/compare"
+    style questions grow towards the route's ceiling.
+    """
+    ceiling = MAX_TOKENS[route]
+    floor = MIN_TOKENS[route]
+    if route in (ROUTE_GREETING, ROUTE_SUMMARY):
+        return floor
+
+    text = user_message.lower()
+    words = len(text.split())
+
+    if any(hint in text for hint in DETAIL_HINTS):
+        return ceiling
+    if words <= 12 and any(hint in text for hint in BRIEF_HINTS):
+        return floor
+
+    budget = floor + words * TOKENS_PER_QUERY_WORD
+    return max(floor, min(ceiling, budget))
+
+
+def truncate_at_stop(text: str, stop_sequences: List[str] = STOP_SEQUENCES) -> str:
+    """Cut generated text at the first role marker / end token"""
+    cut = len(text)
+    for stop in stop_sequences:
+        index = text.find(stop)
+        if index != -1:
+            cut = min(cut, index)
+    return text[:cut]
+
+
+# Instructions placed before the user turn, per route
+ROUTE_INSTRUCTIONS = {
+    ROUTE_ESG: (
+        "You are an ESG & Finance specialist. Provide clear analysis using markdown.\n"
+        "DO NOT add hashtags or emojis. Be professional and concise."
+    ),
+    ROUTE_GREETING: (
+        "You are a friendly AI assistant. Give a brief, natural response.\n"
+        "Keep it under 20 words. No explanations."
+    ),
+    ROUTE_BASE: (
+        "You are a helpful AI assistant. Answer the question clearly and concisely.\n"
+        "Use the conversation history if available. Be accurate and brief.\n"
+        "Stop when you've fully answered the question."
+    ),
+    ROUTE_SUMMARY: (
+        "You keep notes on this conversation for later turns. Write plain sentences, no markdown.\n"
+        "Record facts only; do not answer or add anything new."
+    ),
+}
+
+
+def build_prompt(route: str, user_message: str, conversation_context: str = "") -> str:
+    """Plain-text prompt used by the local (HF / ONNX) engines"""
+    return f"{conversation_context}{ROUTE_INSTRUCTIONS[route]}\n\nUser: {user_message}\nAssistant:"
+
+
+def clean_reply(text: str, route: str = None) -> str:
+    """Cut a decoded reply at the first stop marker and strip leftovers"""
+    text = truncate_at_stop(text)
+    text = re.sub(r'<\|[^|>]*\|>', '', text)  # leftover special tokens
+    if route == ROUTE_SUMMARY:
+        # Stored as memory, not shown: keep its line breaks and figures as written
+        return re.sub(r'[ \t]+', ' ', text).strip()
+
+    # Remove ALL hashtags
+    text = re.sub(r'#\w+', '', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class ReplyStream:
+    """
+    clean_reply for streamed text: feed() takes raw decoded pieces and
+    returns the cleaned text that is final so far, close() the rest, so the
+    pieces add up to exactly clean_reply(whole text, route)
+
+    Text that could still turn out to be part of a stop marker, a special
+    token or a hashtag is held back until the next piece decides it.
+    """
+    _LOOKBACK = max(len(stop) for stop in STOP_SEQUENCES) - 1
+    _PARTIAL_SPECIAL = re.compile(r'<(\|[^|>]*\|?)?$')
+    _PARTIAL_HASHTAG = re.compile(r'#\w*$')
+
+    def __init__(self, route: str = None):
+        self.route = route
+        self.whitespace = re.compile(r'[ \t]+' if route == ROUTE_SUMMARY else r'\s+')
+        self._raw = ""  # decoded text not checked for stop markers / special tokens yet
+        self._text = ""  # special tokens removed, may end in an unfinished hashtag
+        self._space = ""  # whitespace held until more text follows (the reply is stripped)
+        self._started = False
+        self._stopped = False
+
+    def feed(self, text: str) -> str:
+        if self._stopped:
+            return ""
+        self._raw += text
+        cut = len(self._raw)
+        for stop in STOP_SEQUENCES:
+            index = self._raw.find(stop)
+            if index != -1:
+                cut = min(cut, index)
+        if cut < len(self._raw):
+            self._stopped = True
+            ready, self._raw = self._raw[:cut], ""
+            return self._clean(ready, final=True)
+
+        cut = max(0, len(self._raw) - self._LOOKBACK)
+        match = self._PARTIAL_SPECIAL.search(self._raw, 0, cut)
+        if match:
+            cut = match.start()
+        ready, self._raw = self._raw[:cut], self._raw[cut:]
+        return self._clean(ready)
+
+    def close(self) -> str:
+        ready, self._raw = self._raw, ""
+        return self._clean(ready, final=True)
+
+    def _clean(self, text: str, final: bool = False) -> str:
+        text = self._text + re.sub(r'<\|[^|>]*\|>', '', text)
+        self._text = ""
+        if self.route != ROUTE_SUMMARY:
+            match = None if final else self._PARTIAL_HASHTAG.search(text)
+            if match:
+                text, self._text = text[:match.start()], text[match.start():]
+            text = re.sub(r'#\w+', '', text)
+        text = self.whitespace.sub(" ", text)
+
+        body = text.strip()
+        if not body:
+            self._space += text
+            return ""
+        leading = text[:len(text) - len(text.lstrip())]
+        trailing = text[len(text.rstrip()):]
+        out = self.whitespace.sub(" ", self._space + leading) + body if self._started else body
+        self._started = True
+        self._space = trailing
+        return out
@@ -0,0 +1,208 @@
+"""
+CPU Runtime Profile
+Threading, core pinning and allocator settings for the torch (hf) engine,
+applied before the weights load and again in each forked inference
+server worker, plus the prompts used to warm the model up at startup.
+
+Without a profile every process uses torch's default of one intra-op
+thread per core, so two workers on a 32-core host run 64 threads on 32
+cores. With CPU_WORKERS set, each worker gets its share of the cores: a
+contiguous block, taken from one NUMA node when the host has several.
+Pinning covers CPUs only; memory follows first touch, so weights loaded by
+the inference server parent live on the parent's node.
+
+Settings (environment):
+  TORCH_THREADS            - intra-op threads per worker (default: the worker's cores)
+  TORCH_INTEROP_THREADS    - inter-op threads (default 0 = torch default)
+  CPU_WORKERS              - processes sharing this host's cores (default 1)
+  CPU_AFFINITY             - "auto" pins each worker to its share of the cores, or a
+                             cpulist ("0-15,32-47") to split instead; empty = no pinning
+  MALLOC_ARENAS            - glibc malloc arenas (default: glibc's 8 per core)
+  MALLOC_MMAP_THRESHOLD_MB - fixed glibc mmap threshold; buffers below it are reused
+                             instead of unmapped and zeroed again (default: glibc adaptive)
+  MODEL_WARMUP             - one short generation per route at startup, in each forked
+                             worker after its profile is applied (default 1)
+  WARMUP_TOKENS            - tokens generated per warm-up prompt (default 16)
+"""
+import ctypes
+import ctypes.util
+import glob
+import os
+import re
+from typing import Dict, List, Optional
+
+import torch
+
+from app import routing
+from app.logger import get_logger, log_event
+
+logger = get_logger("runtime")
+
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", "0"))
+TORCH_INTEROP_THREADS = int(os.getenv("TORCH_INTEROP_THREADS", "0"))
+CPU_WORKERS = max(1, int(os.getenv("CPU_WORKERS", "1")))
+CPU_AFFINITY = os.getenv("CPU_AFFINITY", "").strip()
+MALLOC_ARENAS = int(os.getenv("MALLOC_ARENAS", "0"))
+MALLOC_MMAP_THRESHOLD_MB = float(os.getenv("MALLOC_MMAP_THRESHOLD_MB", "0"))
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1").lower() in ("1", "true", "yes")
+WARMUP_TOKENS = int(os.getenv("WARMUP_TOKENS", "16"))
+
+# Representative question per route; each compiles its own prompt shapes
+WARMUP_PROMPTS = {
+    routing.ROUTE_GREETING: "hello there",
+    routing.ROUTE_BASE: "What is the difference between a bond and a stock? Give an example.",
+    routing.ROUTE_ESG: "How should a company report scope 1, scope 2 and scope 3 emissions in its sustainability report?",
+}
+
+# Set by processes that fork workers after loading the model
+_warmup_deferred = False
+
+# glibc mallopt() parameters
+M_MMAP_THRESHOLD = -3
+M_ARENA_MAX = -8
+
+# Cores this process may use, read before anything here narrows them
+HOST_CORES = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+
+
+def defer_warmup():
+    """
+    Skip the warm-up when the model loads; for parents that fork workers
+    after loading (each worker warms up after apply() instead). Warming up
+    first would start torch's thread pools before fork, which children can
+    deadlock on, and would only size the parent's pools.
+    """
+    global _warmup_deferred
+    _warmup_deferred = True
+
+
+def warmup_at_load() -> bool:
+    return MODEL_WARMUP and not _warmup_deferred
+
+
+def parse_cpulist(spec: str) -> List[int]:
+    """Linux cpulist format: "0-3,8,10-11" -> [0, 1, 2, 3, 8, 10, 11]"""
+    cores = set()
+    for part in spec.strip().split(","):
+        if not part.strip():
+            continue
+        start, _, end = part.partition("-")
+        cores.update(range(int(start), int(end or start) + 1))
+    return sorted(cores)
+
+
+def format_cpulist(cores: List[int]) -> str:
+    ranges = []
+    for core in sorted(cores):
+        if ranges and core == ranges[-1][1] + 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+    return ",".join(f"{start}-{end}" if end != start else str(start) for start, end in ranges)
+
+
+def numa_nodes() -> List[List[int]]:
+    """Cores of each NUMA node (one group on single-node hosts and outside Linux)"""
+    paths = glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")
+    paths.sort(key=lambda path: int(re.search(r"node(\d+)", path).group(1)))
+    nodes = []
+    for path in paths:
+        with open(path) as f:
+            cores = parse_cpulist(f.read())
+        if cores:
+            nodes.append(cores)
+    return nodes or [HOST_CORES]
+
+
+def _split(cores: List[int], parts: int, index: int) -> List[int]:
+    size, extra = divmod(len(cores), parts)
+    start = index * size + min(index, extra)
+    return cores[start:start + size + (1 if index < extra else 0)]
+
+
+def worker_cores(index: int, workers: int, setting: Optional[str] = None) -> Optional[List[int]]:
+    """
+    Cores for worker index of workers, or None when pinning is off
+
+    With at least as many workers as NUMA nodes, workers are spread over
+    the nodes round-robin and each node's cores split between its workers,
+    so no worker straddles two nodes.
+    """
+    setting = CPU_AFFINITY if setting is None else setting
+    if not setting:
+        return None
+    pool = HOST_CORES if setting == "auto" else [core for core in parse_cpulist(setting) if core in HOST_CORES]
+    if not pool:
+        return None
+
+    nodes = [[core for core in node if core in pool] for node in numa_nodes()]
+    nodes = [node for node in nodes if node]
+    if len(nodes) > 1 and workers >= len(nodes):
+        node = index % len(nodes)
+        workers_on_node = len(range(node, workers, len(nodes)))
+        return _split(nodes[node], workers_on_node, index // len(nodes)) or None
+    return _split(pool, workers, index % workers) or None
+
+
+def configure_allocator() -> Dict:
+    """Apply the glibc malloc settings; reports a preloaded jemalloc/tcmalloc instead"""
+    preload = os.getenv("LD_PRELOAD", "")
+    for name in ("jemalloc", "tcmalloc", "mimalloc"):
+        if name in preload:
+            return {"allocator": name}
+    if not (MALLOC_ARENAS or MALLOC_MMAP_THRESHOLD_MB):
+        return {"allocator": "default"}
+
+    libc_path = ctypes.util.find_library("c")
+    try:
+        mallopt = ctypes.CDLL(libc_path).mallopt
+    except (OSError, AttributeError, TypeError):
+        log_event(logger, "allocator_settings_unsupported", libc=libc_path)
+        return {"allocator": "default"}
+
+    settings = {"allocator": "glibc"}
+    if MALLOC_ARENAS:
+        mallopt(M_ARENA_MAX, MALLOC_ARENAS)
+        settings["malloc_arenas"] = MALLOC_ARENAS
+    if MALLOC_MMAP_THRESHOLD_MB:
+        mallopt(M_MMAP_THRESHOLD, int(MALLOC_MMAP_THRESHOLD_MB * 1024 * 1024))
+        settings["mmap_threshold_mb"] = MALLOC_MMAP_THRESHOLD_MB
+    return settings
+
+
+def apply(worker_index: Optional[int] = None, workers: int = CPU_WORKERS, threads: int = TORCH_THREADS) -> Dict:
+    """
+    Apply the runtime profile to this process
+
+    Args:
+        worker_index: This process's slot among workers; None when unknown
+            (e.g. uvicorn workers), which skips pinning but still divides
+            the threads between the workers
+        workers: Processes sharing the host's cores
+        threads: Intra-op threads (0 = the worker's cores)
+
+    Returns:
+        The applied settings (also logged as runtime_profile)
+    """
+    profile = {"worker": worker_index, "workers": workers}
+
+    cores = worker_cores(worker_index, workers) if worker_index is not None else None
+    if cores:
+        os.sched_setaffinity(0, cores)
+        profile["cores"] = format_cpulist(cores)
+
+    if not threads:
+        threads = len(cores) if cores else (max(1, len(HOST_CORES) // workers) if workers > 1 else 0)
+    if threads:
+        torch.set_num_threads(threads)
+    if TORCH_INTEROP_THREADS:
+        try:
+            torch.set_num_interop_threads(TORCH_INTEROP_THREADS)
+        except RuntimeError:
+            pass  # only settable once per process; forked workers keep the parent's
+    profile["threads"] = torch.get_num_threads()
+    profile["interop_threads"] = torch.get_num_interop_threads()
+
+    profile.update(configure_allocator())
+    log_event(logger, "runtime_profile", **profile)
+    return profile
@@ -0,0 +1,213 @@
+"""
+Inference Scheduler
+Admission control and ordering for model calls:
+  - bounded queue: requests beyond SCHEDULER_MAX_QUEUE are shed (429 + Retry-After)
+  - per-user token buckets: each user spends estimated cost units, refilled over time
+  - shortest-job-first with aging: cheap requests (greetings) overtake expensive ones
+    (512-token ESG analyses), but waiting raises priority so big jobs never starve
+
+Settings (environment):
+  SCHEDULER_CONCURRENCY    - model calls running at once (default 2)
+  SCHEDULER_MAX_QUEUE      - queued requests before shedding (default 32)
+  SCHEDULER_AGING_RATE     - cost units of priority gained per second waited (default 50)
+  USER_BUCKET_CAPACITY     - burst of cost units per user (default 4000)
+  USER_BUCKET_REFILL       - cost units per second refilled per user (default 20)
+"""
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from app import metrics, routing, tracing
+from app.logger import get_logger, log_event
+
+logger = get_logger("scheduler")
+
+# Prefill is much cheaper per token than decode on CPU
+PREFILL_COST_PER_TOKEN = 0.1
+
+
+class AdmissionRejected(Exception):
+    """Request refused before queuing; retry_after is a hint in seconds"""
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def estimate_cost(route: str, prompt_tokens: int, max_tokens: int) -> float:
+    """Expected work of a model call in decode-token units"""
+    return prompt_tokens * PREFILL_COST_PER_TOKEN + max_tokens
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_sec: float):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, amount: float) -> float:
+        """Spend amount; returns 0 on success, else seconds until it would fit"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_sec)
+        self.updated = now
+        # Requests bigger than the whole bucket are allowed once it is full
+        if self.tokens >= min(amount, self.capacity):
+            self.tokens -= amount
+            return 0.0
+        return (min(amount, self.capacity) - self.tokens) / self.refill_per_sec
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "future", "route", "cost", "user_id", "cancel_event", "enqueued", "context")
+
+    def __init__(self, fn, args, kwargs, route, cost, user_id, cancel_event):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.route = route
+        self.cost = cost
+        self.user_id = user_id
+        self.cancel_event = cancel_event
+        self.enqueued = time.monotonic()
+        # Run in the submitter's context so request spans/profiling follow the call
+        self.context = contextvars.copy_context()
+
+
+class InferenceScheduler:
+    def __init__(
+        self,
+        concurrency: int = 2,
+        max_queue: int = 32,
+        aging_rate: float = 50,
+        bucket_capacity: float = 4000,
+        bucket_refill: float = 20
+    ):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.aging_rate = aging_rate
+        self.bucket_capacity = bucket_capacity
+        self.bucket_refill = bucket_refill
+
+        self._heap: List[tuple] = []
+        self._sequence = itertools.count()
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._lock = threading.Condition()
+        self._running = 0
+        self._workers: List[threading.Thread] = []
+        # Moving average of seconds per model call, for Retry-After hints
+        self._avg_service_time = 5.0
+
+    @classmethod
+    def from_env(cls) -> "InferenceScheduler":
+        return cls(
+            concurrency=int(os.getenv("SCHEDULER_CONCURRENCY", "2")),
+            max_queue=int(os.getenv("SCHEDULER_MAX_QUEUE", "32")),
+            aging_rate=float(os.getenv("SCHEDULER_AGING_RATE", "50")),
+            bucket_capacity=float(os.getenv("USER_BUCKET_CAPACITY", "4000")),
+            bucket_refill=float(os.getenv("USER_BUCKET_REFILL", "20")),
+        )
+
+    def submit(
+        self,
+        fn: Callable,
+        *args,
+        user_id: int,
+        route: str = routing.ROUTE_BASE,
+        cost: float = 0,
+        cancel_event: Optional[threading.Event] = None,
+        enforce_limits: bool = True,
+        **kwargs
+    ) -> Future:
+        """
+        Queue fn(*args, **kwargs) and return a Future for its result
+
+        Raises AdmissionRejected when the queue is full or the user is over
+        quota. Background work (enforce_limits=False) is never shed but is
+        still ordered by cost. A cancel_event that is set while queued skips
+        the call (result ""); otherwise it is passed on to fn.
+        """
+        self._ensure_workers()
+        if cancel_event is not None:
+            kwargs["cancel_event"] = cancel_event
+        job = _Job(fn, args, kwargs, route, cost, user_id, cancel_event)
+
+        with self._lock:
+            if enforce_limits:
+                if len(self._heap) >= self.max_queue:
+                    retry_after = len(self._heap) * self._avg_service_time / self.concurrency
+                    self._reject("queue_full", retry_after)
+                bucket = self._buckets.setdefault(user_id, TokenBucket(self.bucket_capacity, self.bucket_refill))
+                wait = bucket.take(cost)
+                if wait > 0:
+                    self._reject("user_quota", wait)
+
+            # Aging: ordering by cost - aging_rate * waited is the same as
+            # ordering by cost + aging_rate * enqueue time, which never changes
+            priority = cost + self.aging_rate * job.enqueued
+            heapq.heappush(self._heap, (priority, next(self._sequence), job))
+            self._update_depth()
+            self._lock.notify()
+        return job.future
+
+    def _reject(self, reason: str, retry_after: float):
+        metrics.SCHEDULER_REJECTED.labels(reason=reason).inc()
+        log_event(logger, "request_rejected", reason=reason, retry_after=round(retry_after, 1))
+        raise AdmissionRejected(reason, retry_after)
+
+    def _update_depth(self):
+        metrics.QUEUE_DEPTH.set(len(self._heap) + self._running)
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        with self._lock:
+            if self._workers:
+                return
+            for index in range(self.concurrency):
+                worker = threading.Thread(target=self._worker_loop, name=f"inference-{index}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _worker_loop(self):
+        while True:
+            with self._lock:
+                while not self._heap:
+                    self._lock.wait()
+                _, _, job = heapq.heappop(self._heap)
+                self._running += 1
+                self._update_depth()
+
+            waited = time.monotonic() - job.enqueued
+            metrics.SCHEDULER_WAIT.labels(route=job.route).observe(waited)
+            job.context.run(tracing.record, "queue", waited * 1000)
+            started = time.monotonic()
+            ran = False
+            try:
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                if job.cancel_event is not None and job.cancel_event.is_set():
+                    # Client left while queued: skip the model call entirely
+                    job.future.set_result("")
+                    continue
+                ran = True
+                try:
+                    job.future.set_result(job.context.run(job.fn, *job.args, **job.kwargs))
+                except BaseException as e:
+                    job.future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    if ran:
+                        self._avg_service_time = 0.9 * self._avg_service_time + 0.1 * (time.monotonic() - started)
+                    self._update_depth()
+
+
+inference_scheduler = InferenceScheduler.from_env()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
 # ============================================
@@ -80,9 +80,119 @@ class ChatRequest(BaseModel):
     """Request for sending a message"""
     message: str
     conversation_id: Optional[int] = None  # If None, creates new conversation
+    adapter: Optional[str] = None  # Named LoRA adapter (hf engine); default picked by route
 
 class ChatResponse(BaseModel):
     """Response after sending a message"""
     message: MessageResponse
     conversation_id: int
     conversation_title: str
+
+class FileJobResponse(BaseModel):
+    """Status of a background file analysis job"""
+    id: int
+    status: str  # queued, running, done, failed
+    stage: Optional[str] = None
+    progress: int = 0
+    conversation_id: int
+    file_name: str
+    error: Optional[str] = None
+    message: Optional[MessageResponse] = None  # Assistant reply once done
+    created_at: datetime
+    updated_at: datetime
+
+class SearchHit(BaseModel):
+    """One matching message; snippet marks matched terms with <mark></mark>"""
+    message_id: int
+    conversation_id: int
+    conversation_title: str
+    role: str
+    file_name: Optional[str] = None
+    snippet: str
+    rank: float  # lower is better
+    created_at: datetime
+
+class SearchResponse(BaseModel):
+    query: str
+    hits: List[SearchHit]
+    limit: int
+    offset: int
+    has_more: bool
+
+# ============================================
+# DOCUMENT LIBRARY SCHEMAS
+# ============================================
+class DocumentResponse(BaseModel):
+    """A report loaded by scripts.ingest_corpus"""
+    id: int
+    file_name: str
+    source_path: str
+    size_bytes: int
+    tokens: int
+    chunk_count: int
+    created_at: datetime
+
+class DocumentChunkResponse(BaseModel):
+    chunk_index: int
+    content: str
+    tokens: int
+
+class DocumentDetailResponse(DocumentResponse):
+    chunks: List[DocumentChunkResponse]
+
+class DocumentSearchHit(BaseModel):
+    """One matching chunk; snippet marks matched terms with <mark></mark>"""
+    document_id: int
+    file_name: str
+    source_path: str
+    chunk_index: int
+    snippet: str
+    rank: float  # lower is better
+
+class DocumentSearchResponse(BaseModel):
+    query: str
+    hits: List[DocumentSearchHit]
+    limit: int
+    offset: int
+    has_more: bool
+
+# ============================================
+# ESG ANALYTICS SCHEMAS
+# ============================================
+class ESGCompany(BaseModel):
+    """A company with extracted ESG figures"""
+    company: str
+    figures: int
+    first_year: int
+    last_year: int
+
+class ESGComparisonRow(BaseModel):
+    company: str
+    year: int
+    value: float
+    share_of_total: float
+    vs_mean: float  # 1.0 = average of the compared companies
+
+class ESGComparison(BaseModel):
+    """One metric across companies, largest first (values in unit)"""
+    metric: str
+    unit: str
+    year: Optional[int] = None  # None = each company's latest year
+    rows: List[ESGComparisonRow]
+    count: int
+    total: float
+    mean: float
+    median: float
+    min: float
+    max: float
+
+class ESGPoint(BaseModel):
+    year: int
+    value: float
+    change_pct: Optional[float] = None  # vs the previous reported year
+
+class ESGSeries(BaseModel):
+    """Year-by-year figures for one company, keyed by metric"""
+    company: str
+    units: Dict[str, str]
+    series: Dict[str, List[ESGPoint]]
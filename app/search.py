@@ -0,0 +1,146 @@
+"""
+Full-Text Search Index
+Indexes message content and extracted file text for GET /search, and the
+chunks of bulk-loaded documents (scripts.ingest_corpus) for
+GET /documents/search.
+
+  SQLite   - FTS5 external-content table messages_fts over messages and
+             messages_archive, kept in sync by triggers (chat, file jobs,
+             imports and deletes)
+  Postgres - generated tsvector column search_vector + GIN index on
+             messages, messages_archive and document_chunks
+
+Document chunks get their own FTS5 table, document_chunks_fts, with
+insert and delete triggers (chunks are never updated).
+"""
+import re
+
+from sqlalchemy import text
+
+from app.database import engine
+
+# Text is read through finesg_decompress (app.compression) because message
+# columns may hold compressed values, and from both the hot and the archive
+# table so archived conversations stay searchable. Moving rows between the
+# two tables (insert into one, then delete from the other) leaves the index
+# alone; only real inserts and deletes touch it.
+SQLITE_SETUP = [
+    """CREATE VIEW IF NOT EXISTS messages_fts_source AS
+        SELECT id, finesg_decompress(content) AS content, finesg_decompress(file_content) AS file_content
+        FROM messages
+        UNION ALL
+        SELECT id, finesg_decompress(content), finesg_decompress(file_content)
+        FROM messages_archive""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, file_content, content='messages_fts_source', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages
+    WHEN NOT EXISTS (SELECT 1 FROM messages_archive WHERE id = new.id) BEGIN
+        INSERT INTO messages_fts(rowid, content, file_content)
+        VALUES (new.id, finesg_decompress(new.content), finesg_decompress(new.file_content));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages
+    WHEN NOT EXISTS (SELECT 1 FROM messages_archive WHERE id = old.id) BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, file_content)
+        VALUES ('delete', old.id, finesg_decompress(old.content), finesg_decompress(old.file_content));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content, file_content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, file_content)
+        VALUES ('delete', old.id, finesg_decompress(old.content), finesg_decompress(old.file_content));
+        INSERT INTO messages_fts(rowid, content, file_content)
+        VALUES (new.id, finesg_decompress(new.content), finesg_decompress(new.file_content));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_archive_fts_delete AFTER DELETE ON messages_archive
+    WHEN NOT EXISTS (SELECT 1 FROM messages WHERE id = old.id) BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, file_content)
+        VALUES ('delete', old.id, finesg_decompress(old.content), finesg_decompress(old.file_content));
+    END""",
+]
+
+DOCUMENT_SQLITE_SETUP = [
+    """CREATE VIEW IF NOT EXISTS document_chunks_fts_source AS
+        SELECT id, finesg_decompress(content) AS content FROM document_chunks""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS document_chunks_fts USING fts5(
+        content, content='document_chunks_fts_source', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS document_chunks_fts_insert AFTER INSERT ON document_chunks BEGIN
+        INSERT INTO document_chunks_fts(rowid, content) VALUES (new.id, finesg_decompress(new.content));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS document_chunks_fts_delete AFTER DELETE ON document_chunks BEGIN
+        INSERT INTO document_chunks_fts(document_chunks_fts, rowid, content)
+        VALUES ('delete', old.id, finesg_decompress(old.content));
+    END""",
+]
+
+# Index objects from before messages could be compressed or archived
+SQLITE_LEGACY_OBJECTS = [
+    "DROP TRIGGER IF EXISTS messages_fts_insert",
+    "DROP TRIGGER IF EXISTS messages_fts_delete",
+    "DROP TRIGGER IF EXISTS messages_fts_update",
+    "DROP TABLE IF EXISTS messages_fts",
+]
+
+POSTGRES_SETUP = [
+    """ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            to_tsvector('english', coalesce(content, '') || ' ' || coalesce(file_content, ''))
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING GIN (search_vector)",
+    """ALTER TABLE messages_archive ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            to_tsvector('english', coalesce(content, '') || ' ' || coalesce(file_content, ''))
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_messages_archive_search_vector ON messages_archive USING GIN (search_vector)",
+    """ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_document_chunks_search_vector ON document_chunks USING GIN (search_vector)",
+]
+
+
+def setup_search_index(bind=engine) -> bool:
+    """Create the index (and backfill it on SQLite the first time); False if unsupported"""
+    try:
+        with bind.begin() as connection:
+            if bind.dialect.name == "sqlite":
+                existing = connection.execute(
+                    text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'")
+                ).scalar()
+                if existing and "messages_fts_source" not in existing:
+                    for statement in SQLITE_LEGACY_OBJECTS:
+                        connection.execute(text(statement))
+                    existing = None
+                for statement in SQLITE_SETUP:
+                    connection.execute(text(statement))
+                if not existing:
+                    connection.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+
+                documents_indexed = connection.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'document_chunks_fts'")
+                ).scalar()
+                for statement in DOCUMENT_SQLITE_SETUP:
+                    connection.execute(text(statement))
+                if not documents_indexed:
+                    connection.execute(text("INSERT INTO document_chunks_fts(document_chunks_fts) VALUES ('rebuild')"))
+            elif bind.dialect.name == "postgresql":
+                for statement in POSTGRES_SETUP:
+                    connection.execute(text(statement))
+            else:
+                return False
+        return True
+    except Exception as e:
+        print(f"⚠️  Full-text search index unavailable: {e}")
+        return False
+
+
+def to_fts5_query(query: str) -> str:
+    """
+    Turn free text into a safe FTS5 MATCH expression: every word must match,
+    the last one as a prefix (search-as-you-type). FTS5 operators in the
+    input are treated as plain words.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
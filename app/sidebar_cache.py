@@ -0,0 +1,275 @@
+"""
+Conversation Sidebar Cache
+Per-user cache of the GET /conversations listing (the sidebar, polled on
+every page load and chat turn). crud keeps it up to date write-through:
+create_conversation, create_message and delete_conversation patch the
+cached rows after their commit, so the listing is served from memory and
+always matches the database. Anything the patches can't express (bulk
+imports, a change outside the cached window) just drops the user's entry.
+
+The local backend only sees its own process's writes: other uvicorn workers
+and scripts (scripts/history.py imports) change the database behind it, so
+its entries are reloaded after SIDEBAR_CACHE_LOCAL_TTL seconds. Run several
+workers with the redis backend to get the listing exact across them.
+
+A per-user sequence number is bumped on every write; a listing loaded from
+the database is only stored if no write happened while it was loading.
+
+Backends (SIDEBAR_CACHE):
+  local      - in-process LRU (default; one worker, or tests; briefly stale across workers)
+  redis://.. - shared between workers (needs the redis package)
+  off        - always read from the database
+
+Settings (environment):
+  SIDEBAR_CACHE_USERS - users kept by the local backend (default 10000)
+  SIDEBAR_CACHE_LOCAL_TTL - seconds a local entry is served after loading it from the database (default 10)
+  SIDEBAR_CACHE_TTL   - seconds a redis entry lives without writes (default 3600)
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Tuple
+
+from app import metrics, responses
+from app.logger import get_logger, log_event
+
+try:
+    import redis
+except ImportError:  # only needed for the shared backend
+    redis = None
+
+logger = get_logger("sidebar_cache")
+
+SIDEBAR_CACHE = os.getenv("SIDEBAR_CACHE", "local")
+SIDEBAR_CACHE_USERS = int(os.getenv("SIDEBAR_CACHE_USERS", "10000"))
+SIDEBAR_CACHE_TTL = int(os.getenv("SIDEBAR_CACHE_TTL", "3600"))
+SIDEBAR_CACHE_LOCAL_TTL = float(os.getenv("SIDEBAR_CACHE_LOCAL_TTL", "10"))
+
+# Conversations in the sidebar (crud.get_user_conversation_rows default)
+SIDEBAR_LIMIT = 50
+
+
+def _stamp(value: datetime) -> str:
+    # Naive UTC ISO strings, like SQLite returns them, so rows sort as strings
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat()
+
+
+def row_dict(row, message_count: Optional[int] = None) -> dict:
+    """JSON-ready sidebar row from a query row or a Conversation"""
+    return {
+        "title": row.title,
+        "id": row.id,
+        "user_id": row.user_id,
+        "created_at": _stamp(row.created_at),
+        "updated_at": _stamp(row.updated_at),
+        "message_count": row.message_count if message_count is None else message_count,
+    }
+
+
+def make_entry(user_id: int, rows: List[dict], complete: bool) -> dict:
+    """
+    Cached listing with its validators
+
+    complete is False when the user has more conversations than the rows
+    hold, so a delete can't be patched (the next one would be missing).
+    """
+    rows = sorted(rows, key=lambda row: (row["updated_at"], row["id"]), reverse=True)
+    if len(rows) > SIDEBAR_LIMIT:
+        rows, complete = rows[:SIDEBAR_LIMIT], False
+    etag = responses.make_etag(
+        "conversations", user_id,
+        *[f"{row['id']}:{row['updated_at']}:{row['message_count']}:{row['title']}" for row in rows]
+    )
+    return {
+        "rows": rows,
+        "complete": complete,
+        "etag": etag,
+        "last_modified": rows[0]["updated_at"] if rows else None,
+    }
+
+
+class LocalBackend:
+    """
+    In-process LRU of entries; writes and loads are ordered by a per-user sequence
+
+    Entries expire ttl seconds after their rows were loaded (patches don't
+    extend that), bounding staleness from writes made by other processes.
+    """
+    def __init__(self, max_users: int = SIDEBAR_CACHE_USERS, ttl: float = SIDEBAR_CACHE_LOCAL_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[dict, float]]" = OrderedDict()
+        self._sequence = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Tuple[Optional[dict], int]:
+        with self._lock:
+            cached = self._entries.get(user_id)
+            if cached is not None and time.monotonic() - cached[1] >= self.ttl:
+                del self._entries[user_id]
+                cached = None
+            if cached is not None:
+                self._entries.move_to_end(user_id)
+            return (cached[0] if cached else None), self._sequence.get(user_id, 0)
+
+    def put_if_unchanged(self, user_id: int, entry: dict, sequence: int) -> bool:
+        with self._lock:
+            if self._sequence.get(user_id, 0) != sequence:
+                return False  # written to while loading; the loaded rows may be stale
+            self._entries[user_id] = (entry, time.monotonic())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                evicted, _ = self._entries.popitem(last=False)
+                self._sequence.pop(evicted, None)
+            return True
+
+    def update(self, user_id: int, patch: Callable[[dict], Optional[dict]]):
+        with self._lock:
+            self._sequence[user_id] = self._sequence.get(user_id, 0) + 1
+            cached = self._entries.get(user_id)
+            if cached is None:
+                return
+            entry, loaded_at = cached
+            entry = patch(entry)
+            if entry is None:
+                del self._entries[user_id]
+            else:
+                self._entries[user_id] = (entry, loaded_at)
+
+
+class RedisBackend:
+    """Entries shared by all workers; patches use optimistic WATCH/MULTI transactions"""
+    def __init__(self, url: str, ttl: int = SIDEBAR_CACHE_TTL):
+        if redis is None:
+            raise RuntimeError("SIDEBAR_CACHE is a redis URL but the redis package is not installed")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    @staticmethod
+    def _keys(user_id: int) -> Tuple[str, str]:
+        return f"finesg:sidebar:{user_id}", f"finesg:sidebar:{user_id}:seq"
+
+    def get(self, user_id: int) -> Tuple[Optional[dict], int]:
+        raw, sequence = self.client.mget(self._keys(user_id))
+        return (json.loads(raw) if raw else None), int(sequence or 0)
+
+    def put_if_unchanged(self, user_id: int, entry: dict, sequence: int) -> bool:
+        entry_key, sequence_key = self._keys(user_id)
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(sequence_key)
+                if int(pipe.get(sequence_key) or 0) != sequence:
+                    return False
+                pipe.multi()
+                pipe.set(entry_key, json.dumps(entry), ex=self.ttl)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def update(self, user_id: int, patch: Callable[[dict], Optional[dict]]):
+        entry_key, sequence_key = self._keys(user_id)
+        # Bump first so loads already in progress don't store what they read
+        self.client.incr(sequence_key)
+        self.client.expire(sequence_key, self.ttl)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(entry_key)
+                    raw = pipe.get(entry_key)
+                    if raw is None:
+                        pipe.unwatch()
+                        return
+                    entry = patch(json.loads(raw))
+                    pipe.multi()
+                    if entry is None:
+                        pipe.delete(entry_key)
+                    else:
+                        pipe.set(entry_key, json.dumps(entry), ex=self.ttl)
+                    pipe.execute()
+                    return
+                except redis.WatchError:
+                    continue  # another worker patched it first; patch the new version
+
+
+def make_backend(setting: str = SIDEBAR_CACHE):
+    if setting in ("", "off", "none", "0"):
+        return None
+    if setting.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(setting)
+    return LocalBackend()
+
+
+backend = make_backend()
+
+
+def listing(user_id: int, load: Callable[[], list]) -> dict:
+    """The user's sidebar entry, from the cache or loaded with load() (row tuples) on a miss"""
+    sequence = 0
+    if backend is not None:
+        try:
+            entry, sequence = backend.get(user_id)
+        except Exception as e:
+            log_event(logger, "sidebar_cache_error", operation="get", error=str(e))
+            entry = None
+        metrics.record_cache("sidebar", entry is not None)
+        if entry is not None:
+            return entry
+
+    rows = [row_dict(row) for row in load()]
+    entry = make_entry(user_id, rows, complete=len(rows) < SIDEBAR_LIMIT)
+    if backend is not None:
+        try:
+            backend.put_if_unchanged(user_id, entry, sequence)
+        except Exception as e:
+            log_event(logger, "sidebar_cache_error", operation="put", error=str(e))
+    return entry
+
+
+def _patch(user_id: int, patch: Callable[[dict], Optional[dict]]):
+    if backend is None:
+        return
+    try:
+        backend.update(user_id, patch)
+    except Exception as e:
+        log_event(logger, "sidebar_cache_error", operation="update", user_id=user_id, error=str(e))
+
+
+# ----- write-through hooks (called by crud after commit) -----
+
+def conversation_created(conversation):
+    user_id = conversation.user_id
+
+    def patch(entry):
+        return make_entry(user_id, [row_dict(conversation, message_count=0)] + entry["rows"], entry["complete"])
+    _patch(user_id, patch)
+
+
+def message_created(user_id: int, conversation_id: int, updated_at: datetime):
+    def patch(entry):
+        rows = [dict(row) for row in entry["rows"]]
+        for row in rows:
+            if row["id"] == conversation_id:
+                row["message_count"] += 1
+                row["updated_at"] = _stamp(updated_at)
+                return make_entry(user_id, rows, entry["complete"])
+        return None  # outside the cached window: it moves to the top, reload
+    _patch(user_id, patch)
+
+
+def conversation_deleted(user_id: int, conversation_id: int):
+    def patch(entry):
+        rows = [row for row in entry["rows"] if row["id"] != conversation_id]
+        if len(rows) < len(entry["rows"]) and not entry["complete"]:
+            return None  # the next conversation down isn't cached
+        return make_entry(user_id, rows, entry["complete"])
+    _patch(user_id, patch)
+
+
+def invalidate(user_id: int):
+    _patch(user_id, lambda entry: None)
@@ -0,0 +1,152 @@
+"""
+In-Flight Request Coalescing (single-flight)
+Duplicate chat submissions (frontend retries on slow responses, double
+clicks on send) share one generation instead of each running the model and
+writing its own message pair:
+
+  - a duplicate arriving while the first is still generating awaits the
+    same in-flight work
+  - a duplicate arriving shortly after it finished gets the stored result
+    replayed for SINGLEFLIGHT_REPLAY_SECONDS
+
+The shared work runs as its own task, so it survives the client that
+started it going away; it is cancelled only once every waiting client has
+disconnected. Errors are shared with the waiters but never replayed.
+
+Settings (environment):
+  SINGLEFLIGHT_REPLAY_SECONDS - how long finished results are replayed (default 30, 0 disables)
+  SINGLEFLIGHT_MAX_REPLAYS    - finished results kept for replay (default 1024)
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app import metrics
+
+SINGLEFLIGHT_REPLAY_SECONDS = float(os.getenv("SINGLEFLIGHT_REPLAY_SECONDS", "30"))
+SINGLEFLIGHT_MAX_REPLAYS = int(os.getenv("SINGLEFLIGHT_MAX_REPLAYS", "1024"))
+
+LEADER = "leader"
+JOINED = "joined"
+REPLAYED = "replayed"
+
+
+def chat_key(
+    user_id: int,
+    conversation_id: Optional[int],
+    message: str,
+    idempotency_key: Optional[str] = None,
+    adapter: Optional[str] = None
+) -> tuple:
+    """Identity of a chat submission: same user, conversation, message text, client key and adapter"""
+    digest = hashlib.sha256(message.encode("utf-8")).hexdigest()
+    return (user_id, conversation_id, digest, idempotency_key or "", adapter or "")
+
+
+class _Flight:
+    __slots__ = ("task", "cancel_event", "waiters")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_event = threading.Event()
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(
+        self,
+        name: str,
+        replay_seconds: float = SINGLEFLIGHT_REPLAY_SECONDS,
+        max_replays: int = SINGLEFLIGHT_MAX_REPLAYS
+    ):
+        self.name = name
+        self.replay_seconds = replay_seconds
+        self.max_replays = max_replays
+        self._in_flight: Dict[tuple, _Flight] = {}
+        self._finished: "OrderedDict[tuple, Tuple[float, Any]]" = OrderedDict()
+
+    def _replay(self, key: tuple):
+        entry = self._finished.get(key)
+        if entry is None:
+            return None
+        expires, result = entry
+        if expires < time.monotonic():
+            del self._finished[key]
+            return None
+        return result
+
+    def _remember(self, key: tuple, result):
+        if self.replay_seconds <= 0:
+            return
+        self._finished[key] = (time.monotonic() + self.replay_seconds, result)
+        self._finished.move_to_end(key)
+        while len(self._finished) > self.max_replays:
+            self._finished.popitem(last=False)
+
+    async def _execute(self, key: tuple, flight: _Flight, work: Callable[[threading.Event], Awaitable[Any]]):
+        try:
+            result = await work(flight.cancel_event)
+            if result is not None and not flight.cancel_event.is_set():
+                self._remember(key, result)
+            return result
+        finally:
+            if self._in_flight.get(key) is flight:
+                del self._in_flight[key]
+
+    async def run(
+        self,
+        key: tuple,
+        work: Callable[[threading.Event], Awaitable[Any]],
+        is_disconnected: Callable[[], Awaitable[bool]],
+        poll_seconds: float = 0.25
+    ) -> Tuple[Optional[Any], str]:
+        """
+        Run work(cancel_event) once per key, or share the run already going
+
+        Args:
+            key: Identity of the request (see chat_key)
+            work: Coroutine function doing the real work; returns None when cancelled
+            is_disconnected: Checked while waiting; a waiter whose client left stops waiting
+            poll_seconds: How often to check is_disconnected
+
+        Returns:
+            Tuple of (result or None if this client disconnected, outcome: leader/joined/replayed)
+        """
+        result = self._replay(key)
+        if result is not None:
+            self._record(REPLAYED)
+            return result, REPLAYED
+
+        flight = self._in_flight.get(key)
+        # A flight whose clients all left is winding down; start over rather than join it
+        if flight is None or flight.cancel_event.is_set():
+            flight = _Flight()
+            self._in_flight[key] = flight
+            flight.task = asyncio.create_task(self._execute(key, flight, work))
+            # Nobody may be left to read a failure; don't let asyncio warn about it
+            flight.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            outcome = LEADER
+        else:
+            outcome = JOINED
+        self._record(outcome)
+
+        flight.waiters += 1
+        try:
+            while True:
+                done, _ = await asyncio.wait({flight.task}, timeout=poll_seconds)
+                if done:
+                    return flight.task.result(), outcome
+                if await is_disconnected():
+                    return None, outcome
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.cancel_event.set()  # every client is gone: stop generating
+
+    def _record(self, outcome: str):
+        metrics.SINGLEFLIGHT_REQUESTS.labels(flight=self.name, outcome=outcome).inc()
+        metrics.record_cache(f"{self.name}_singleflight", outcome != LEADER)
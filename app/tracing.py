@@ -0,0 +1,168 @@
+"""
+Request Tracing
+Lightweight per-request spans emitted as a Server-Timing response header,
+plus an opt-in sampling profiler that dumps flamegraph-compatible (folded)
+stacks for slow requests.
+
+Profiling is enabled for a random fraction of all requests with
+PROFILE_SAMPLE_RATE (0.0 - 1.0), or per request with the "X-Profile: 1"
+header when the operator allows it with PROFILE_ALLOW_HEADER=1 (off by
+default: anyone could otherwise start the sampler and its file writes).
+"""
+import contextvars
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.logger import get_logger, log_event
+
+logger = get_logger("tracing")
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ALLOW_HEADER = os.getenv("PROFILE_ALLOW_HEADER", "0").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "1000"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+
+
+class SpanCollector:
+    """Collects the spans of one request"""
+    def __init__(self):
+        self.spans: List[Tuple[str, float]] = []  # (name, milliseconds)
+        self.threads: Set[int] = {threading.get_ident()}
+
+    def add(self, name: str, duration_ms: float):
+        self.spans.append((name, duration_ms))
+
+    def header(self) -> str:
+        """Server-Timing value; repeated spans (e.g. two commits) are summed"""
+        totals: Dict[str, float] = {}
+        counts: Dict[str, int] = {}
+        for name, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+            counts[name] = counts.get(name, 0) + 1
+        entries = []
+        for name, duration in totals.items():
+            entry = f"{name};dur={duration:.1f}"
+            if counts[name] > 1:
+                entry += f';desc="x{counts[name]}"'
+            entries.append(entry)
+        return ", ".join(entries)
+
+
+_collector: contextvars.ContextVar[Optional[SpanCollector]] = contextvars.ContextVar("span_collector", default=None)
+
+
+@contextmanager
+def span(name: str):
+    """Time a block as a Server-Timing span (no-op outside a request)"""
+    collector = _collector.get()
+    if collector is None:
+        yield
+        return
+    # Work may run in a threadpool; let the profiler follow it there
+    collector.threads.add(threading.get_ident())
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        collector.add(name, (time.perf_counter() - start) * 1000)
+
+
+def record(name: str, duration_ms: float):
+    """Add an already measured span (e.g. time spent queued)"""
+    collector = _collector.get()
+    if collector is not None:
+        collector.add(name, duration_ms)
+
+
+# ============================================
+# SAMPLING PROFILER
+# ============================================
+class SamplingProfiler:
+    """
+    Samples the stacks of the threads working on one request at a fixed
+    interval and aggregates them in folded format ("a;b;c count")
+    """
+    def __init__(self, threads: Set[int], interval_ms: float = PROFILE_INTERVAL_MS):
+        self.threads = threads
+        self.interval = interval_ms / 1000
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.threads):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.samples[self._fold(frame)] += 1
+
+    @staticmethod
+    def _fold(frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def dump(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _should_profile(request) -> bool:
+    if PROFILE_ALLOW_HEADER and request.headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes"):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+# ============================================
+# MIDDLEWARE
+# ============================================
+async def server_timing_middleware(request, call_next):
+    """Collect spans for the request and add the Server-Timing header"""
+    collector = SpanCollector()
+    token = _collector.set(collector)
+
+    profiler = None
+    if _should_profile(request):
+        profiler = SamplingProfiler(collector.threads)
+        profiler.start()
+
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _collector.reset(token)
+        if profiler is not None:
+            profiler.stop()
+    total_ms = (time.perf_counter() - start) * 1000
+
+    collector.add("total", total_ms)
+    response.headers["Server-Timing"] = collector.header()
+
+    if profiler is not None and total_ms >= PROFILE_SLOW_MS and profiler.samples:
+        route = request.url.path.strip("/").replace("/", "_") or "root"
+        path = os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}_{route}_{total_ms:.0f}ms.folded")
+        profiler.dump(path)
+        log_event(logger, "profile_dumped", path=path, route=request.url.path, total_ms=round(total_ms, 1))
+
+    return response
@@ -1,16 +1,36 @@
 import io
+import mmap
 from pypdf import PdfReader
 
+def _extract_pdf(stream) -> str:
+    reader = PdfReader(stream)
+    return "".join(page.extract_text() or "" for page in reader.pages)
+
 def extract_text_from_pdf(file_bytes: bytes) -> str:
     """
     Extracts text from a PDF file provided as bytes.
     """
     try:
-        reader = PdfReader(io.BytesIO(file_bytes))
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        return text
+        return _extract_pdf(io.BytesIO(file_bytes))
     except Exception as e:
         print(f"Error extracting text from PDF: {e}")
         return ""
+
+def extract_text_from_pdf_file(path: str) -> str:
+    """
+    Extracts text from a PDF on disk through a read-only memory map, so the
+    file is paged in by the OS instead of being copied into the heap.
+    """
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return _extract_pdf(mapped)
+    except Exception as e:
+        print(f"Error extracting text from PDF: {e}")
+        return ""
+
+def extract_text_from_file(path: str, content_type: str) -> str:
+    """Text of an uploaded PDF or plain-text file spooled to disk"""
+    if content_type == "application/pdf":
+        return extract_text_from_pdf_file(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
@@ -0,0 +1,78 @@
+"""
+Assisted Decoding Benchmark
+Measures decode tokens/sec of the HF engine per route with and without the
+draft model, plus the draft acceptance rate.
+
+Usage:
+    python -m benchmarks.assisted
+    DRAFT_MODEL_ID=Qwen/Qwen2.5-0.5B-Instruct DRAFT_TOKENS=4 python -m benchmarks.assisted --repeats 5
+"""
+import argparse
+import os
+import sys
+import time
+
+# The draft model is only loaded when assisted decoding is enabled at import
+os.environ["ASSISTED_DECODING"] = "1"
+
+import torch  # noqa: E402
+
+from app import routing  # noqa: E402
+from app.ml_engine import model_instance  # noqa: E402
+
+PROMPTS = {
+    routing.ROUTE_ESG: "Explain how a company should report scope 1, scope 2 and scope 3 emissions in its sustainability report.",
+    routing.ROUTE_BASE: "What is the difference between a bond and a stock? Explain with an example.",
+    routing.ROUTE_GREETING: "hello there",
+}
+
+
+def run(route: str, message: str, assisted: bool, repeats: int) -> dict:
+    model_instance.use_assisted = assisted
+    adapter = model_instance.adapter_for(route)
+    prompt = f"User: {message}\nAssistant:"
+    max_tokens = routing.token_budget(route, message)
+
+    tokens, seconds, target_steps, draft_steps = 0, 0.0, 0, 0
+    for repeat in range(repeats):
+        torch.manual_seed(repeat)
+        stats = {}
+        start = time.perf_counter()
+        model_instance.generate(prompt, adapter, max_tokens=max_tokens, stats=stats)
+        seconds += time.perf_counter() - start
+        tokens += stats["new_tokens"]
+        target_steps += stats.get("target_steps", 0)
+        draft_steps += stats.get("draft_steps", 0)
+
+    result = {"tokens_per_sec": tokens / seconds if seconds > 0 else 0.0}
+    if assisted and target_steps:
+        result["acceptance"] = min(1.0, max(0, tokens - target_steps) / draft_steps) if draft_steps else 0.0
+        result["tokens_per_step"] = tokens / target_steps
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tokens/sec with and without assisted decoding")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if model_instance is None or model_instance.draft_model is None:
+        print("❌ HF engine or draft model failed to load")
+        return 1
+
+    # Warm-up so lazy kernel init doesn't count against the first run
+    run(routing.ROUTE_GREETING, PROMPTS[routing.ROUTE_GREETING], False, 1)
+
+    print(f"\n{'route':<10}{'plain tok/s':>13}{'assisted tok/s':>16}{'speedup':>9}{'accept':>8}{'tok/step':>10}")
+    for route, message in PROMPTS.items():
+        plain = run(route, message, False, args.repeats)
+        assisted = run(route, message, True, args.repeats)
+        speedup = assisted["tokens_per_sec"] / plain["tokens_per_sec"] if plain["tokens_per_sec"] else 0.0
+        print(f"{route:<10}{plain['tokens_per_sec']:>13.1f}{assisted['tokens_per_sec']:>16.1f}{speedup:>8.2f}x"
+              f"{assisted.get('acceptance', 0):>8.0%}{assisted.get('tokens_per_step', 0):>10.2f}")
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
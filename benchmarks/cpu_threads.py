@@ -0,0 +1,127 @@
+"""
+CPU Thread Sweep
+Finds the worker/thread layout with the best decode throughput on this
+host for the HF engine. For each combination of worker processes and
+intra-op threads per worker that fits the cores, the loaded model is
+forked into that many workers, each pinned to its share of the cores
+(app.runtime, CPU_AFFINITY=auto), and all of them generate the same ESG
+and general prompts at once.
+
+Usage:
+    python -m benchmarks.cpu_threads                       # 1 worker, 1..all cores
+    python -m benchmarks.cpu_threads --workers 1,2,4 --max-tokens 64
+    python -m benchmarks.cpu_threads --threads 4,8,16 --output sweep.json
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+# Every process is configured explicitly below; keep the warm-up short
+os.environ.setdefault("WARMUP_TOKENS", "4")
+
+import torch  # noqa: E402
+
+from app import routing, runtime  # noqa: E402
+
+# Workers are forked from this process: each warms up after its own runtime.apply
+runtime.defer_warmup()
+
+from app.ml_engine import model_instance  # noqa: E402
+from benchmarks import harness  # noqa: E402
+
+SWEEP_ROUTES = (routing.ROUTE_ESG, routing.ROUTE_BASE)
+
+
+def parse_list(value: str):
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def default_threads(cores: int) -> list:
+    threads, count = [], 1
+    while count < cores:
+        threads.append(count)
+        count *= 2
+    return threads + [cores]
+
+
+def run_worker(index: int, workers: int, threads: int, repeats: int, max_tokens: int) -> dict:
+    """Inside a forked worker: pin, set threads, generate; returns tokens and seconds"""
+    runtime.apply(index, workers, threads=threads)
+    if runtime.MODEL_WARMUP:
+        model_instance.warm_up()
+    tokens, seconds = 0, 0.0
+    for repeat in range(repeats):
+        for route in SWEEP_ROUTES:
+            torch.manual_seed(repeat)
+            prompt = model_instance.prompt_for(route, runtime.WARMUP_PROMPTS[route])
+            stats = {}
+            start = time.perf_counter()
+            model_instance.generate(prompt, model_instance.adapter_for(route), max_tokens=max_tokens, stats=stats)
+            seconds += time.perf_counter() - start
+            tokens += stats["new_tokens"]
+    return {"tokens": tokens, "seconds": seconds}
+
+
+def measure(workers: int, threads: int, repeats: int, max_tokens: int) -> dict:
+    context = multiprocessing.get_context("fork")
+    with context.Pool(workers) as pool:
+        results = pool.starmap(run_worker, [(index, workers, threads, repeats, max_tokens) for index in range(workers)])
+    tokens = sum(result["tokens"] for result in results)
+    # Workers run side by side: the host finished when the slowest did
+    seconds = max(result["seconds"] for result in results)
+    return {
+        "workers": workers,
+        "threads": threads,
+        "tokens_per_sec": round(tokens / seconds, 2) if seconds > 0 else 0.0,
+        "tokens_per_sec_per_worker": round(tokens / seconds / workers, 2) if seconds > 0 else 0.0,
+    }
+
+
+def main(argv=None) -> int:
+    cores = len(runtime.HOST_CORES)
+    parser = argparse.ArgumentParser(description="Sweep torch thread counts and worker layouts for decode tokens/sec")
+    parser.add_argument("--workers", type=parse_list, default=[1], help="worker counts, e.g. 1,2,4")
+    parser.add_argument("--threads", type=parse_list, help="threads per worker (default: powers of two up to the cores)")
+    parser.add_argument("--repeats", type=int, default=2)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--output", help="write the JSON results here")
+    args = parser.parse_args(argv)
+
+    if model_instance is None:
+        print("❌ HF engine failed to load")
+        return 1
+    if model_instance.device == "cuda":
+        print("❌ The sweep forks workers, which cannot use a CUDA context; run it on a CPU host")
+        return 1
+
+    # Pin every layout so the numbers match CPU_AFFINITY=auto in production
+    runtime.CPU_AFFINITY = "auto"
+    print(f"🧵 {cores} cores, {len(runtime.numa_nodes())} NUMA node(s), device {model_instance.device}")
+    print(f"\n{'workers':>8}{'threads':>9}{'tok/s':>10}{'tok/s/worker':>14}")
+
+    results = []
+    for workers in args.workers:
+        for threads in args.threads or default_threads(cores // workers):
+            if workers * threads > cores:
+                continue
+            result = measure(workers, threads, args.repeats, args.max_tokens)
+            results.append(result)
+            print(f"{workers:>8}{threads:>9}{result['tokens_per_sec']:>10.1f}{result['tokens_per_sec_per_worker']:>14.1f}")
+
+    if not results:
+        print("No layout fits the cores")
+        return 1
+    best = max(results, key=lambda result: result["tokens_per_sec"])
+    print(f"\n✓ Best: {best['workers']} worker(s) x {best['threads']} threads = {best['tokens_per_sec']:.1f} tok/s")
+    print(f"  CPU_WORKERS={best['workers']} TORCH_THREADS={best['threads']} CPU_AFFINITY=auto "
+          f"python -m app.inference_server --workers {best['workers']}\n")
+
+    if args.output:
+        harness.save_json(args.output, {"cores": cores, "results": results, "best": best})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Benchmark Harness
+Starts the FastAPI app in a subprocess against a throwaway SQLite database
+with the stub model engine, and turns raw latency samples into reports
+that can be compared with a stored baseline.
+"""
+import json
+import math
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEMO_EMAIL = "demo@example.com"
+DEMO_PASSWORD = "demo123456"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def stub_server(tokens_per_sec: float = 200, ttft_ms: float = 50, workers: int = 1, extra_env: Optional[Dict[str, str]] = None):
+    """
+    Run main:app with MODEL_ENGINE=stub on a temp-file SQLite database
+
+    Yields the base URL; the server and database are removed on exit.
+    """
+    port = _free_port()
+    db_dir = tempfile.mkdtemp(prefix="finesg-bench-")
+    env = dict(os.environ)
+    env.update({
+        "MODEL_ENGINE": "stub",
+        "DATABASE_URL": f"sqlite:///{os.path.join(db_dir, 'bench.db')}",
+        "STUB_TOKENS_PER_SEC": str(tokens_per_sec),
+        "STUB_TTFT_MS": str(ttft_ms),
+        "LOG_LEVEL": "WARNING",
+    })
+    env.update(extra_env or {})
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(base_url, process)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+def wait_until_ready(base_url: str, process: Optional[subprocess.Popen] = None, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            requests.get(f"{base_url}/me", timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start within {timeout}s")
+
+
+def login(base_url: str) -> requests.Session:
+    """Session carrying the demo user's auth cookie"""
+    session = requests.Session()
+    response = session.post(f"{base_url}/login", json={"email": DEMO_EMAIL, "password": DEMO_PASSWORD})
+    response.raise_for_status()
+    return session
+
+
+# ============================================
+# REPORTING
+# ============================================
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples: List[dict], wall_time: float) -> dict:
+    """
+    Build a report from samples of the form
+    {"op": str, "latency": seconds, "ok": bool, "tokens": int}
+    """
+    by_op: Dict[str, List[dict]] = {}
+    for sample in samples:
+        by_op.setdefault(sample["op"], []).append(sample)
+
+    ops = {}
+    for op, op_samples in sorted(by_op.items()):
+        latencies = sorted(s["latency"] for s in op_samples)
+        ops[op] = {
+            "count": len(op_samples),
+            "errors": sum(1 for s in op_samples if not s["ok"]),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
+
+    total_tokens = sum(s.get("tokens", 0) for s in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if not s["ok"]),
+        "wall_time_s": round(wall_time, 3),
+        "requests_per_sec": round(len(samples) / wall_time, 2) if wall_time > 0 else 0,
+        "tokens_per_sec": round(total_tokens / wall_time, 2) if wall_time > 0 else 0,
+        "ops": ops,
+    }
+
+
+def print_report(report: dict):
+    print(f"\n{'op':<14}{'count':>7}{'err':>5}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for op, stats in report["ops"].items():
+        print(f"{op:<14}{stats['count']:>7}{stats['errors']:>5}{stats['mean_ms']:>10.1f}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    print(f"\n{report['requests']} requests in {report['wall_time_s']}s | "
+          f"{report['requests_per_sec']} req/s | {report['tokens_per_sec']} tokens/s | "
+          f"{report['errors']} errors\n")
+
+
+def compare_to_baseline(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    List regressions: latency percentiles above baseline * (1 + tolerance)
+    or throughput below baseline * (1 - tolerance)
+    """
+    regressions = []
+    for op, stats in report["ops"].items():
+        base = baseline.get("ops", {}).get(op)
+        if not base:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if stats[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{op} {key}: {stats[key]:.1f} > baseline {base[key]:.1f}")
+    for key in ("requests_per_sec", "tokens_per_sec"):
+        if key in baseline and report[key] < baseline[key] * (1 - tolerance):
+            regressions.append(f"{key}: {report[key]} < baseline {baseline[key]}")
+    return regressions
+
+
+def load_json(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_json(path: str, data: dict):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
@@ -0,0 +1,92 @@
+"""
+ONNX Parity / Speed Check
+Compares the onnx engine against the PyTorch (HF) engine on the same
+prompts: last-token logits, greedy token agreement and decode tokens/sec.
+Exits non-zero when the fp32 export drifts from PyTorch.
+
+Usage:
+    python -m benchmarks.onnx_parity
+    python -m benchmarks.onnx_parity --int8 --new-tokens 64
+"""
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+from app import routing
+
+PROMPTS = {
+    routing.ROUTE_ESG: "Explain how a company should report scope 1, scope 2 and scope 3 emissions.",
+    routing.ROUTE_BASE: "What is the difference between a bond and a stock?",
+    routing.ROUTE_GREETING: "hello there",
+}
+
+
+def greedy(tokenizer, model, prompt: str, new_tokens: int):
+    """Greedy decode a fixed number of tokens; returns (new ids, seconds)"""
+    inputs = tokenizer(prompt, return_tensors="pt")
+    start = time.perf_counter()
+    with torch.no_grad():
+        output = model.generate(
+            **inputs, max_new_tokens=new_tokens, min_new_tokens=new_tokens,
+            do_sample=False, pad_token_id=tokenizer.pad_token_id
+        )
+    return output[0, inputs["input_ids"].shape[1]:].tolist(), time.perf_counter() - start
+
+
+def last_logits(tokenizer, model, prompt: str) -> torch.Tensor:
+    inputs = tokenizer(prompt, return_tensors="pt")
+    with torch.no_grad():
+        return model(**inputs).logits[0, -1].float()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="ONNX Runtime vs PyTorch parity and tokens/sec")
+    parser.add_argument("--int8", action="store_true", help="check the int8 weights (parity is reported, not enforced)")
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--tolerance", type=float, default=1e-2, help="max abs logit difference allowed for fp32")
+    args = parser.parse_args(argv)
+
+    # The onnx engine picks its weights at import
+    os.environ["ONNX_INT8"] = "1" if args.int8 else "0"
+    from app.ml_engine import model_instance as hf_instance
+    from app.ml_engine_onnx import model_instance as onnx_instance
+
+    if hf_instance is None or onnx_instance is None:
+        print("❌ HF or ONNX engine failed to load")
+        return 1
+
+    tokenizer = hf_instance.tokenizer
+    failed = False
+    print(f"\nprecision: {onnx_instance.precision}, {args.new_tokens} new tokens per prompt")
+    print(f"{'route':<10}{'max |Δlogit|':>14}{'token match':>13}{'torch tok/s':>13}{'onnx tok/s':>12}{'speedup':>9}")
+    for route, message in PROMPTS.items():
+        prompt = routing.build_prompt(route, message)
+        onnx_model = onnx_instance.esg_model if route == routing.ROUTE_ESG else onnx_instance.base_model
+        hf_model = hf_instance.model
+
+        # The torch side is one PEFT model; hold the route's adapter (or none) active
+        with hf_instance.adapters.use(hf_instance.adapter_for(route)):
+            diff = (last_logits(tokenizer, hf_model, prompt) - last_logits(tokenizer, onnx_model, prompt)).abs().max().item()
+
+            greedy(tokenizer, onnx_model, prompt, 2)  # warm-up
+            hf_ids, hf_seconds = greedy(tokenizer, hf_model, prompt, args.new_tokens)
+            onnx_ids, onnx_seconds = greedy(tokenizer, onnx_model, prompt, args.new_tokens)
+
+        # Agreement up to the first diverging token (greedy drift compounds after)
+        matched = next((i for i, (a, b) in enumerate(zip(hf_ids, onnx_ids)) if a != b), min(len(hf_ids), len(onnx_ids)))
+        match_rate = matched / max(1, len(hf_ids))
+        hf_rate, onnx_rate = len(hf_ids) / hf_seconds, len(onnx_ids) / onnx_seconds
+        print(f"{route:<10}{diff:>14.4f}{match_rate:>13.0%}{hf_rate:>13.1f}{onnx_rate:>12.1f}{onnx_rate / hf_rate:>8.2f}x")
+
+        if not args.int8 and diff > args.tolerance:
+            failed = True
+
+    print("\n❌ fp32 ONNX output differs from PyTorch" if failed else "\n✅ Done")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
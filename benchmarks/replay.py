@@ -0,0 +1,262 @@
+"""
+Captured Traffic Replay
+Re-issues traffic recorded by app.capture (CAPTURE_FILE) against a test
+instance with the stub model engine, keeping the captured timing and the
+order of each session's requests, and reports latency per endpoint.
+
+Usage:
+    python -m benchmarks.replay capture.jsonl                 # real time (1x)
+    python -m benchmarks.replay capture.jsonl --speed 10      # 10x faster
+    python -m benchmarks.replay capture.jsonl --speed max     # as fast as possible
+    python -m benchmarks.replay capture.jsonl --url http://127.0.0.1:8080 --output replay.json
+
+The capture holds no message text, so requests are rebuilt from their
+shape: a message of the captured length that routes the same way
+(greeting / ESG / general), an upload of the captured size. Each captured
+session replays in order on its own connection, each request sent at its
+captured offset divided by --speed; captured conversations map to the
+ones created during the replay. Requests that failed when captured are
+not replayed.
+
+Schedule lag (how late requests went out versus the scaled timeline) is
+reported too: when it grows, the client or --concurrency is the
+bottleneck, not the server.
+"""
+import argparse
+import itertools
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+
+from benchmarks import harness
+from benchmarks.run import make_file
+
+# Replayable endpoints: (method, route template) -> op name in the report
+OPS = {
+    ("POST", "/chat"): "chat",
+    ("POST", "/chat/file"): "chat_file",
+    ("POST", "/chat/file/jobs"): "file_job",
+    ("POST", "/predict"): "predict",
+    ("GET", "/history"): "history",
+    ("GET", "/conversations"): "list",
+    ("POST", "/conversations"): "new",
+    ("GET", "/conversations/{conversation_id}"): "get",
+    ("DELETE", "/conversations/{conversation_id}"): "delete",
+    ("GET", "/me"): "me",
+}
+
+# Words that keep a synthesized message on its captured route (see app.routing)
+ROUTE_WORDS = {
+    "greeting": ["hello", "thanks", "good", "morning", "there"],
+    "esg": ["emissions", "scope", "1", "carbon", "disclosure", "targets", "progress", "against", "the", "sustainability", "goals", "this", "year"],
+    "base": ["bond", "duration", "interest", "rate", "risk", "for", "a", "retail", "investor", "portfolio", "allocation", "across", "markets"],
+}
+DEFAULT_WORDS = 8
+
+
+def load_capture(path: str) -> Dict[str, List[dict]]:
+    """Captured records grouped by session, in time order, with offsets from the first request"""
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda record: record["t"])
+    if not records:
+        return {}
+
+    first = records[0]["t"]
+    sessions: Dict[str, List[dict]] = {}
+    for record in records:
+        record["offset"] = record["t"] - first
+        sessions.setdefault(record["session"], []).append(record)
+    return sessions
+
+
+def synthesize_message(route: Optional[str], words: Optional[int]) -> str:
+    """Message of about the captured length that app.routing classifies as route"""
+    vocabulary = ROUTE_WORDS.get(route or "base", ROUTE_WORDS["base"])
+    words = max(1, words or DEFAULT_WORDS)
+    if route == "greeting":
+        words = min(words, len(vocabulary))  # longer ones stop being greetings
+    return " ".join(itertools.islice(itertools.cycle(vocabulary), words))
+
+
+class Replay:
+    def __init__(self, base_url: str, speed: float):
+        """speed: 1 = captured pace, 10 = ten times faster, 0 = no waiting"""
+        self.base_url = base_url
+        self.speed = speed
+        self.conversations: Dict[str, int] = {}  # captured hash -> conversation id in this run
+        self.lock = threading.Lock()
+        self.skipped: Dict[str, int] = {}
+        self.start = 0.0
+
+    def _skip(self, reason: str):
+        with self.lock:
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def _conversation(self, record: dict) -> Optional[int]:
+        if record.get("new_conversation") or "conversation" not in record:
+            return None
+        with self.lock:
+            return self.conversations.get(record["conversation"])
+
+    def _remember(self, record: dict, conversation_id: int):
+        if "conversation" in record:
+            with self.lock:
+                self.conversations[record["conversation"]] = conversation_id
+
+    def _send(self, session: requests.Session, op: str, record: dict) -> Optional[requests.Response]:
+        url = self.base_url
+        conversation_id = self._conversation(record)
+        message = synthesize_message(record.get("query_route"), record.get("message_words"))
+
+        if op == "chat":
+            return session.post(f"{url}/chat", json={"message": message, "conversation_id": conversation_id})
+        if op in ("chat_file", "file_job"):
+            path = "/chat/file" if op == "chat_file" else "/chat/file/jobs"
+            params = {"conversation_id": conversation_id} if conversation_id else {}
+            size_kb = max(1, record.get("file_bytes", 64 * 1024) // 1024)
+            files = {"file": ("report.txt", make_file(size_kb), "text/plain")}
+            return session.post(f"{url}{path}", params=params, files=files)
+        if op == "predict":
+            return session.post(f"{url}/predict", json={"text": message})
+        if op == "new":
+            return session.post(f"{url}/conversations", json={"title": "Replay"})
+        if op in ("get", "delete"):
+            if conversation_id is None:
+                self._skip("unknown_conversation")
+                return None
+            method = session.get if op == "get" else session.delete
+            return method(f"{url}/conversations/{conversation_id}")
+        paths = {"history": "/history", "list": "/conversations", "me": "/me"}
+        return session.get(f"{url}{paths[op]}")
+
+    def run_session(self, records: List[dict]) -> List[dict]:
+        """Replay one captured session in order; returns samples with their schedule lag"""
+        session = harness.login(self.base_url)
+        samples = []
+        for record in records:
+            op = OPS.get((record["method"], record["path"]))
+            if op is None:
+                self._skip(f"{record['method']} {record['path']}")
+                continue
+            if record["status"] >= 400:
+                self._skip("failed_when_captured")
+                continue
+
+            scheduled = self.start + (record["offset"] / self.speed if self.speed else 0)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            sent = time.perf_counter()
+            try:
+                response = self._send(session, op, record)
+                if response is None:
+                    continue
+                latency = time.perf_counter() - sent
+                ok = response.ok
+            except requests.RequestException:
+                latency = time.perf_counter() - sent
+                ok, response = False, None
+
+            tokens = 0
+            if ok and op in ("chat", "chat_file"):
+                body = response.json()
+                self._remember(record, body["conversation_id"])
+                tokens = len(body["message"]["content"].split())  # stub emits one word per token
+            elif ok and op == "predict":
+                tokens = len(response.json()["output_text"].split())
+            elif ok and op in ("new", "file_job"):
+                body = response.json()
+                self._remember(record, body["id"] if op == "new" else body["conversation_id"])
+            samples.append({
+                "op": op, "latency": latency, "ok": ok, "tokens": tokens,
+                "lag": max(0.0, sent - scheduled) if self.speed else 0.0,
+            })
+        return samples
+
+    def run(self, sessions: Dict[str, List[dict]], concurrency: int) -> dict:
+        # Sessions start in order of their first request
+        ordered = sorted(sessions.values(), key=lambda records: records[0]["offset"])
+        samples: List[dict] = []
+
+        self.start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for session_samples in pool.map(self.run_session, ordered):
+                samples.extend(session_samples)
+        wall_time = time.perf_counter() - self.start
+
+        report = harness.summarize(samples, wall_time)
+        lags = sorted(sample["lag"] for sample in samples)
+        report["schedule_lag"] = {
+            "p50_ms": round(harness.percentile(lags, 50) * 1000, 2),
+            "p95_ms": round(harness.percentile(lags, 95) * 1000, 2),
+            "max_ms": round(lags[-1] * 1000, 2) if lags else 0.0,
+        }
+        report["skipped"] = dict(self.skipped)
+        return report
+
+
+def parse_speed(value: str) -> float:
+    if value.lower() == "max":
+        return 0.0
+    speed = float(value.lower().rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay captured FinESG traffic against a stub model backend")
+    parser.add_argument("capture", help="JSONL written with CAPTURE_FILE")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="1, 10, ... or max (default 1)")
+    parser.add_argument("--concurrency", type=int, default=64, help="sessions replayed at once")
+    parser.add_argument("--tokens-per-sec", type=float, default=200, help="stub decode speed")
+    parser.add_argument("--ttft-ms", type=float, default=50, help="stub time to first token")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--url", help="replay against an already running server instead")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    sessions = load_capture(args.capture)
+    if not sessions:
+        print(f"No captured requests in {args.capture}")
+        return 1
+    records = [record for records in sessions.values() for record in records]
+    captured_seconds = max(record["offset"] for record in records)
+
+    if args.url:
+        report = Replay(args.url, args.speed).run(sessions, args.concurrency)
+    else:
+        with harness.stub_server(args.tokens_per_sec, args.ttft_ms, args.workers) as base_url:
+            report = Replay(base_url, args.speed).run(sessions, args.concurrency)
+
+    report["config"] = {
+        "capture": args.capture,
+        "captured_requests": len(records),
+        "captured_sessions": len(sessions),
+        "captured_seconds": round(captured_seconds, 3),
+        "speed": args.speed or "max",
+        "concurrency": args.concurrency,
+        "tokens_per_sec": args.tokens_per_sec,
+        "ttft_ms": args.ttft_ms,
+        "workers": args.workers,
+    }
+    harness.print_report(report)
+    lag = report["schedule_lag"]
+    print(f"schedule lag: p50 {lag['p50_ms']}ms | p95 {lag['p95_ms']}ms | max {lag['max_ms']}ms")
+    if report["skipped"]:
+        print("skipped: " + ", ".join(f"{reason} x{count}" for reason, count in sorted(report["skipped"].items())))
+
+    if args.output:
+        harness.save_json(args.output, report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Load Test / Benchmark Runner
+Drives concurrent /chat, /chat/file, /conversations and /conversations/{id}
+traffic from a JSONL workload and reports p50/p95/p99 latency, requests/sec
+and tokens/sec, optionally failing on regressions against a baseline.
+
+Usage:
+    python -m benchmarks.run                          # stub server, default workload
+    python -m benchmarks.run --concurrency 16 --iterations 5
+    python -m benchmarks.run --save-baseline          # record benchmarks/baseline.json
+    python -m benchmarks.run --url http://127.0.0.1:8080   # existing server
+
+Workload lines: {"session": name, "op": op, ...}. A session runs its ops in
+order against its own conversation; sessions run concurrently.
+  chat       {"message": str}    POST /chat
+  chat_file  {"file_kb": int}    POST /chat/file (generated text/plain file)
+  list                           GET /conversations
+  get                            GET /conversations/{id} of the session's conversation
+  new                            start a new conversation for the session
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+
+from benchmarks import harness
+
+DEFAULT_WORKLOAD = os.path.join(os.path.dirname(__file__), "workload.jsonl")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+FILE_LINE = "The company reported scope 1 emissions of 12,400 tCO2e and reduced water usage by 8%.\n"
+
+
+def load_workload(path: str) -> Dict[str, List[dict]]:
+    sessions: Dict[str, List[dict]] = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                step = json.loads(line)
+                sessions.setdefault(step["session"], []).append(step)
+    return sessions
+
+
+def make_file(size_kb: int) -> bytes:
+    size = size_kb * 1024
+    return (FILE_LINE * (size // len(FILE_LINE) + 1)).encode("utf-8")[:size]
+
+
+def run_session(base_url: str, steps: List[dict]) -> List[dict]:
+    """Run one session's steps in order, returning latency samples"""
+    session = harness.login(base_url)
+    conversation_id: Optional[int] = None
+    samples = []
+
+    for step in steps:
+        op = step["op"]
+        if op == "new":
+            conversation_id = None
+            continue
+        if op == "get" and conversation_id is None:
+            continue
+
+        start = time.perf_counter()
+        try:
+            if op == "chat":
+                response = session.post(f"{base_url}/chat", json={
+                    "message": step["message"], "conversation_id": conversation_id
+                })
+            elif op == "chat_file":
+                params = {"conversation_id": conversation_id} if conversation_id else {}
+                files = {"file": ("report.txt", make_file(step.get("file_kb", 64)), "text/plain")}
+                response = session.post(f"{base_url}/chat/file", params=params, files=files)
+            elif op == "list":
+                response = session.get(f"{base_url}/conversations")
+            elif op == "get":
+                response = session.get(f"{base_url}/conversations/{conversation_id}")
+            else:
+                raise ValueError(f"Unknown workload op: {op}")
+            latency = time.perf_counter() - start
+            ok = response.ok
+        except requests.RequestException:
+            latency = time.perf_counter() - start
+            ok, response = False, None
+
+        tokens = 0
+        if ok and op in ("chat", "chat_file"):
+            body = response.json()
+            conversation_id = body["conversation_id"]
+            tokens = len(body["message"]["content"].split())  # stub emits one word per token
+        samples.append({"op": op, "latency": latency, "ok": ok, "tokens": tokens})
+
+    return samples
+
+
+def run_workload(base_url: str, sessions: Dict[str, List[dict]], concurrency: int, iterations: int) -> dict:
+    jobs = [steps for _ in range(iterations) for steps in sessions.values()]
+    samples: List[dict] = []
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for session_samples in pool.map(lambda steps: run_session(base_url, steps), jobs):
+            samples.extend(session_samples)
+    wall_time = time.perf_counter() - start
+
+    return harness.summarize(samples, wall_time)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="FinESG load test with a stub model backend")
+    parser.add_argument("--workload", default=DEFAULT_WORKLOAD)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=3, help="times each session is replayed")
+    parser.add_argument("--tokens-per-sec", type=float, default=200, help="stub decode speed")
+    parser.add_argument("--ttft-ms", type=float, default=50, help="stub time to first token")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--url", help="benchmark an already running server instead")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (0.2 = 20%%)")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    sessions = load_workload(args.workload)
+
+    if args.url:
+        report = run_workload(args.url, sessions, args.concurrency, args.iterations)
+    else:
+        with harness.stub_server(args.tokens_per_sec, args.ttft_ms, args.workers) as base_url:
+            # Warm-up pass so imports/first queries don't skew the numbers
+            run_workload(base_url, sessions, 1, 1)
+            report = run_workload(base_url, sessions, args.concurrency, args.iterations)
+
+    report["config"] = {
+        "workload": os.path.basename(args.workload),
+        "concurrency": args.concurrency,
+        "iterations": args.iterations,
+        "tokens_per_sec": args.tokens_per_sec,
+        "ttft_ms": args.ttft_ms,
+        "workers": args.workers,
+    }
+    harness.print_report(report)
+
+    if args.output:
+        harness.save_json(args.output, report)
+
+    if args.save_baseline:
+        harness.save_json(args.baseline, report)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    baseline = harness.load_json(args.baseline)
+    if baseline is None:
+        print("No baseline found; run with --save-baseline to record one.")
+        return 0
+
+    regressions = harness.compare_to_baseline(report, baseline, args.tolerance)
+    if regressions:
+        print("❌ Performance regressions vs baseline:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print(f"✓ Within {args.tolerance:.0%} of baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,13 +2,20 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
-from app.api import router
-from app import models, database, crud, auth, schemas
+from app.api import router, UploadSizeLimit
+from app import models, database, crud, auth, schemas, tracing, jobs, search, archiver, capture
 import os
-import torch
+
+try:
+    import torch
+except ImportError:  # LM Studio / stub engines don't need torch
+    torch = None
 
 # Create Database Tables
 models.Base.metadata.create_all(bind=database.engine)
+database.add_missing_columns()
+database.migrate_message_ids()
+search.setup_search_index()
 
 # Create default user on startup
 def create_default_user():
@@ -31,7 +38,7 @@ create_default_user()
 
 # Display GPU/CPU Status on Startup
 print("\n" + "="*50)
-if torch.cuda.is_available():
+if torch is not None and torch.cuda.is_available():
     print(f"🚀 GPU DETECTED: {torch.cuda.get_device_name(0)}")
     print(f"CUDA Version: {torch.version.cuda}")
 else:
@@ -54,9 +61,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request Server-Timing spans and opt-in sampling profiler
+app.middleware("http")(tracing.server_timing_middleware)
+
+# Refuse oversized uploads, with or without Content-Length, before the body is spooled
+app.add_middleware(UploadSizeLimit)
+
+# Opt-in anonymized traffic capture for benchmarks.replay (CAPTURE_FILE)
+app.middleware("http")(capture.capture_middleware)
+
 # Include API routes
 app.include_router(router)
 
+# Background file analysis workers
+@app.on_event("startup")
+def start_job_workers():
+    jobs.start_workers()
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    jobs.stop_workers()
+
+# Move idle conversations to cold storage
+@app.on_event("startup")
+def start_archiver():
+    archiver.start_archiver()
+
+@app.on_event("shutdown")
+def stop_archiver():
+    archiver.stop_archiver()
+
 # Serve frontend static files
 frontend_path = os.path.join(os.path.dirname(__file__), "frontend", "public")
 if os.path.exists(frontend_path):
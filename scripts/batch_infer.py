@@ -0,0 +1,176 @@
+"""
+Offline Batch Inference
+Runs a JSONL file of questions through the configured engine (MODEL_ENGINE)
+without going through the API or the chat database, writing one JSONL
+result per question with its timings.
+
+  hf engine     - questions grouped by route and LoRA adapter, generated in padded batches
+  other engines - questions sent concurrently (LM Studio / remote / onnx / stub)
+
+Re-running with the same --output skips questions already answered, so an
+interrupted run picks up where it stopped (failed questions are retried).
+
+Input lines need an id ("id" or "request_id", else the line number) and the
+question ("prompt", "message" or "question", else "title" + "body").
+
+Usage:
+    python -m scripts.batch_infer questions.jsonl -o answers.jsonl
+    MODEL_ENGINE=hf python -m scripts.batch_infer checklist.jsonl -o out.jsonl --batch-size 8
+    python -m scripts.batch_infer checklist.jsonl -o out.jsonl --concurrency 8
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from app import routing
+from app.engine import MODEL_ENGINE, model_instance
+
+
+def load_items(path: str) -> List[Dict]:
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            item_id = str(record.get("id") or record.get("request_id") or line_number)
+            prompt = record.get("prompt") or record.get("message") or record.get("question")
+            if not prompt:
+                prompt = "\n\n".join(part for part in (record.get("title"), record.get("body")) if part)
+            if prompt:
+                items.append({"id": item_id, "prompt": prompt})
+    return items
+
+
+def load_done(path: str) -> set:
+    """Ids already written to the output (a truncated last line is ignored)"""
+    done = set()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("error") is None:
+                    done.add(record["id"])
+    return done
+
+
+class ResultWriter:
+    """Appends result lines, flushed one by one so a crash loses at most one"""
+    def __init__(self, path: str):
+        # A previous run killed mid-write can leave a partial last line
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        else:
+            needs_newline = False
+        self.file = open(path, "a", encoding="utf-8")
+        if needs_newline:
+            self.file.write("\n")
+        self.lock = threading.Lock()
+        self.written = 0
+
+    def write(self, result: Dict):
+        with self.lock:
+            self.file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self.file.flush()
+            self.written += 1
+            print(f"  [{self.written}] {result['id']} {result['route']} {result['seconds']:.2f}s"
+                  + (f" ERROR {result['error']}" if result["error"] else ""), file=sys.stderr)
+
+    def close(self):
+        self.file.close()
+
+
+def result_for(item: Dict, route: str, response: str, seconds: float, **extra) -> Dict:
+    error = response if response.startswith("Error") else None
+    return {
+        "id": item["id"],
+        "prompt": item["prompt"],
+        "route": route,
+        "response": None if error else response,
+        "error": error,
+        "seconds": round(seconds, 3),
+        "prompt_tokens": len(model_instance.tokenizer.encode(item["prompt"])),
+        "completion_tokens": 0 if error else len(model_instance.tokenizer.encode(response)),
+        **extra
+    }
+
+
+def run_batched(items: List[Dict], writer: ResultWriter, batch_size: int, adapter: Optional[str] = None):
+    """HF engine: one padded generate() per batch of questions sharing a route and adapter"""
+    groups: Dict[tuple, List[Dict]] = {}
+    for item in items:
+        route = routing.classify(item["prompt"])
+        groups.setdefault((route, model_instance.adapter_for(route, adapter)), []).append(item)
+
+    # Adapter-major order so each adapter is switched to once
+    for (route, route_adapter), group in sorted(groups.items(), key=lambda entry: (entry[0][1] or "", entry[0][0])):
+        for start in range(0, len(group), batch_size):
+            batch = group[start:start + batch_size]
+            prompts = [routing.build_prompt(route, item["prompt"]) for item in batch]
+            max_tokens = max(routing.token_budget(route, item["prompt"]) for item in batch)
+            batch_start = time.perf_counter()
+            try:
+                replies = model_instance.generate_batch(prompts, route_adapter, max_tokens=max_tokens)
+            except Exception as e:
+                replies = [f"Error: {e}"] * len(batch)
+            seconds = time.perf_counter() - batch_start
+            for item, reply in zip(batch, replies):
+                writer.write(result_for(item, route, reply, seconds, batch_size=len(batch), adapter=route_adapter))
+
+
+def run_concurrent(items: List[Dict], writer: ResultWriter, concurrency: int):
+    def run_one(item: Dict):
+        start = time.perf_counter()
+        reply = model_instance.predict(item["prompt"])
+        writer.write(result_for(item, routing.classify(item["prompt"]), reply, time.perf_counter() - start))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run_one, items))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run a JSONL question set through the model")
+    parser.add_argument("input")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--batch-size", type=int, default=8, help="hf engine: questions per generate() call")
+    parser.add_argument("--concurrency", type=int, default=4, help="other engines: requests in flight")
+    parser.add_argument("--adapter", help="hf engine: LoRA adapter for every question (default: picked by route)")
+    args = parser.parse_args(argv)
+
+    if model_instance is None:
+        print(f"❌ Model engine '{MODEL_ENGINE}' failed to load")
+        return 1
+
+    items = load_items(args.input)
+    done = load_done(args.output)
+    pending = [item for item in items if item["id"] not in done]
+    print(f"📋 {len(items)} questions, {len(items) - len(pending)} already answered, {len(pending)} to run "
+          f"({MODEL_ENGINE} engine)", file=sys.stderr)
+
+    writer = ResultWriter(args.output)
+    start = time.perf_counter()
+    try:
+        if hasattr(model_instance, "generate_batch"):
+            run_batched(pending, writer, args.batch_size, args.adapter)
+        else:
+            run_concurrent(pending, writer, args.concurrency)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ {writer.written} results in {elapsed:.1f}s -> {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+ONNX Export
+Merges the fingesg4 LoRA adapter into Qwen2.5-1.5B and exports it, and the
+plain base model, to ONNX with past key/values as inputs/outputs so the
+onnx engine (MODEL_ENGINE=onnx) decodes one token per step with a KV cache.
+
+Usage:
+    python -m scripts.export_onnx                 # fp32 to ./onnx_models/{base,esg}
+    python -m scripts.export_onnx --int8          # also write int8 dynamically quantized weights
+    python -m scripts.export_onnx --only esg --output /data/onnx_models
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import torch
+from optimum.onnxruntime import ORTModelForCausalLM
+from peft import PeftModel
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+# Same layout app.ml_engine_onnx loads from
+ONNX_DIR = os.getenv("ONNX_DIR", "./onnx_models")
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+
+BASE_MODEL_ID = "Qwen/Qwen2.5-1.5B-Instruct"
+ADAPTER_ID = "DeepakJ1218/fingesg4"
+
+
+def merge_adapter(base_model_id: str, adapter_id: str, output_dir: str):
+    """Fold the LoRA weights into the base model and save it as safetensors"""
+    print(f"🔧 Merging {adapter_id} into {base_model_id}...")
+    base = AutoModelForCausalLM.from_pretrained(base_model_id, torch_dtype=torch.float32, trust_remote_code=True)
+    merged = PeftModel.from_pretrained(base, adapter_id).merge_and_unload()
+    merged.save_pretrained(output_dir, safe_serialization=True)
+    AutoTokenizer.from_pretrained(base_model_id, trust_remote_code=True).save_pretrained(output_dir)
+
+
+def export(model_path: str, output_dir: str):
+    """Export a causal LM with its KV cache to output_dir/model.onnx"""
+    print(f"📦 Exporting {model_path} -> {output_dir}")
+    model = ORTModelForCausalLM.from_pretrained(model_path, export=True, use_cache=True, provider="CPUExecutionProvider")
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_path, trust_remote_code=True).save_pretrained(output_dir)
+
+
+def quantize(output_dir: str):
+    """Write int8 weights (dynamic quantization, activations stay fp32)"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    print(f"⚖️  Quantizing {output_dir} to int8...")
+    quantize_dynamic(
+        model_input=os.path.join(output_dir, FP32_FILE),
+        model_output=os.path.join(output_dir, INT8_FILE),
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        use_external_data_format=True,  # 1.5B weights exceed the 2GB protobuf limit
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export the base and merged ESG models to ONNX")
+    parser.add_argument("--output", default=ONNX_DIR)
+    parser.add_argument("--only", choices=["base", "esg"], help="export a single model")
+    parser.add_argument("--int8", action="store_true", help="also write int8 quantized weights")
+    parser.add_argument("--base-model", default=BASE_MODEL_ID)
+    parser.add_argument("--adapter", default=ADAPTER_ID)
+    args = parser.parse_args(argv)
+
+    if args.only in (None, "base"):
+        base_dir = os.path.join(args.output, "base")
+        export(args.base_model, base_dir)
+        if args.int8:
+            quantize(base_dir)
+
+    if args.only in (None, "esg"):
+        esg_dir = os.path.join(args.output, "esg")
+        merged_dir = tempfile.mkdtemp(prefix="finesg-merged-")
+        try:
+            merge_adapter(args.base_model, args.adapter, merged_dir)
+            export(merged_dir, esg_dir)
+        finally:
+            shutil.rmtree(merged_dir, ignore_errors=True)
+        if args.int8:
+            quantize(esg_dir)
+
+    print(f"✅ ONNX models written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
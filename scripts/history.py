@@ -0,0 +1,90 @@
+"""
+Conversation History Export / Import
+Streams the conversations and messages tables to gzipped NDJSON and loads
+such files back with batched inserts (format: app.export).
+
+Usage:
+    python -m scripts.history export -o history.ndjson.gz               # all users
+    python -m scripts.history export --user-id 3 -o user3.ndjson.gz
+    python -m scripts.history import history.ndjson.gz
+    python -m scripts.history import user3.ndjson.gz --user-id 7         # into another account
+"""
+import argparse
+import gzip
+import io
+import sys
+import time
+
+from app import database, export, models
+
+
+def open_text(path: str, mode: str):
+    """Open path as text, gzipped when it ends in .gz; '-' is stdin/stdout"""
+    if path == "-":
+        stream = sys.stdin.buffer if "r" in mode else sys.stdout.buffer
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def run_export(args) -> int:
+    db = database.SessionLocal()
+    start = time.perf_counter()
+    lines = 0
+    try:
+        if args.output.endswith(".gz"):
+            # Same incremental compressor the HTTP endpoint streams through
+            with open(args.output, "wb") as f:
+                def counted():
+                    nonlocal lines
+                    for line in export.iter_export_lines(db, args.user_id):
+                        lines += 1
+                        yield line
+                for chunk in export.gzip_stream(counted()):
+                    f.write(chunk)
+        else:
+            with open_text(args.output, "w") as f:
+                for line in export.iter_export_lines(db, args.user_id):
+                    f.write(line)
+                    lines += 1
+    finally:
+        db.close()
+    print(f"✅ Exported {lines} records to {args.output} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return 0
+
+
+def run_import(args) -> int:
+    models.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    start = time.perf_counter()
+    try:
+        with open_text(args.input, "r") as f:
+            counts = export.import_lines(db, f, args.user_id)
+    finally:
+        db.close()
+    print(
+        f"✅ Imported {counts['conversations']} conversations and {counts['messages']} messages "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export or import conversation history (NDJSON)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="stream history to NDJSON (.gz compresses)")
+    export_parser.add_argument("-o", "--output", default="-")
+    export_parser.add_argument("--user-id", type=int, help="only this user's conversations")
+
+    import_parser = commands.add_parser("import", help="bulk-load an NDJSON export")
+    import_parser.add_argument("input")
+    import_parser.add_argument("--user-id", type=int, help="assign every conversation to this user")
+
+    args = parser.parse_args(argv)
+    return run_export(args) if args.command == "export" else run_import(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""
+Bulk Corpus Ingestion
+Loads a directory tree of report PDFs / text files into the documents
+tables without any model calls: text is extracted in a process pool (the
+same app.utils extraction /chat/file uses), chunked and token-counted, and
+written with batched executemany inserts, one transaction per batch.
+
+Files are deduplicated by content hash, against the user's documents
+already in the database and within the run, so re-running over the same
+directory skips what was loaded and retries only what failed or never
+got committed: an interrupted run resumes where it stopped. Document ids
+come from the database, so several runs can load into one database at
+once; a file another run committed first is counted as a duplicate.
+
+The chunks are indexed for full-text search (GET /documents/search) by
+the same triggers the API sets up, and listed under GET /documents.
+
+Usage:
+    python -m scripts.ingest_corpus ./reports                          # demo user
+    python -m scripts.ingest_corpus ./reports --user-id 3 --workers 8
+    python -m scripts.ingest_corpus ./reports --esg-figures            # also fill the /esg/* figure store
+    python -m scripts.ingest_corpus ./reports --tokenizer simple       # no transformers needed
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from multiprocessing import Pool
+from typing import Dict, Iterator, List
+
+from sqlalchemy.exc import IntegrityError
+
+from app import crud, database, models, search
+from app.chunking import CHUNK_TOKENS, chunk_text
+from app.utils import extract_text_from_file
+
+CONTENT_TYPES = {".pdf": "application/pdf", ".txt": "text/plain"}
+DEFAULT_TOKENIZER = "Qwen/Qwen2.5-1.5B-Instruct"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Per worker process, set by init_worker
+_tokenizer = None
+_known_hashes: set = set()
+_max_tokens = CHUNK_TOKENS
+
+
+def load_tokenizer(name: str):
+    """The Qwen tokenizer the engines count with, or the ~4 chars/token estimate for 'simple'"""
+    if name != "simple":
+        try:
+            from transformers import AutoTokenizer
+            return AutoTokenizer.from_pretrained(name, trust_remote_code=True)
+        except Exception as e:
+            print(f"⚠️  Could not load tokenizer {name} ({e}); using the ~4 chars/token estimate", file=sys.stderr)
+    from app.ml_engine_lmstudio import SimpleTokenizer
+    return SimpleTokenizer()
+
+
+def init_worker(tokenizer_name: str, known_hashes: set, max_tokens: int):
+    global _tokenizer, _known_hashes, _max_tokens
+    _tokenizer = load_tokenizer(tokenizer_name)
+    _known_hashes = known_hashes
+    _max_tokens = max_tokens
+
+
+def iter_files(root: str) -> Iterator[str]:
+    """Supported files under root, in a stable order"""
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in CONTENT_TYPES:
+                yield os.path.join(directory, name)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_CHUNK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def process_file(path: str) -> Dict:
+    """
+    Worker: hash, extract and chunk one file
+
+    Returns a dict with status "new" (with text and chunks), "known"
+    (already in the database, not extracted), "empty" or "failed".
+    """
+    result = {"path": path, "size": 0, "sha256": None}
+    try:
+        result["size"] = os.path.getsize(path)
+        result["sha256"] = file_sha256(path)
+        if result["sha256"] in _known_hashes:
+            return {**result, "status": "known"}
+
+        content_type = CONTENT_TYPES[os.path.splitext(path)[1].lower()]
+        text = extract_text_from_file(path, content_type)
+        if not text.strip():
+            return {**result, "status": "empty"}
+        return {**result, "status": "new", "text": text, "chunks": chunk_text(text, _tokenizer, _max_tokens)}
+    except Exception as e:
+        return {**result, "status": "failed", "error": str(e)}
+
+
+class BatchWriter:
+    """Collects new documents and their chunks and inserts them one transaction per batch"""
+    def __init__(self, db, user_id: int, root: str, batch_size: int, esg_figures: bool):
+        self.db = db
+        self.user_id = user_id
+        self.root = root
+        self.batch_size = batch_size
+        self.esg_figures = esg_figures
+        self.documents: List[Dict] = []
+        self.chunks: Dict[str, List[Dict]] = {}  # by content hash until the document has an id
+        self.texts: Dict[str, tuple] = {}
+        self.committed = 0
+        self.committed_chunks = 0
+        self.raced = 0  # committed by a concurrent run first
+
+    def add(self, result: Dict):
+        self.documents.append({
+            "user_id": self.user_id,
+            "sha256": result["sha256"],
+            "file_name": os.path.basename(result["path"]),
+            "source_path": os.path.relpath(result["path"], self.root),
+            "size_bytes": result["size"],
+            "chars": len(result["text"]),
+            "tokens": sum(tokens for _, tokens in result["chunks"]),
+            "chunk_count": len(result["chunks"]),
+            "created_at": datetime.now(timezone.utc),
+        })
+        self.chunks[result["sha256"]] = [
+            {"chunk_index": index, "content": content, "tokens": tokens}
+            for index, (content, tokens) in enumerate(result["chunks"])
+        ]
+        if self.esg_figures:
+            self.texts[result["sha256"]] = (os.path.basename(result["path"]), result["text"])
+        if len(self.documents) >= self.batch_size:
+            self.flush()
+
+    def _insert(self):
+        """Insert the batch in one transaction; the database assigns the document ids"""
+        crud.bulk_insert_documents(self.db, self.documents)
+        ids = crud.get_document_ids(self.db, self.user_id, [document["sha256"] for document in self.documents])
+        chunks = [
+            {**chunk, "document_id": ids[document["sha256"]]}
+            for document in self.documents
+            for chunk in self.chunks[document["sha256"]]
+        ]
+        crud.bulk_insert_document_chunks(self.db, chunks)
+        self.db.commit()
+        return len(chunks)
+
+    def flush(self):
+        if not self.documents:
+            return
+        try:
+            chunk_count = self._insert()
+        except IntegrityError:
+            # Another run committed some of these files since we checked: drop them and retry once
+            self.db.rollback()
+            known = crud.get_document_hashes(self.db, self.user_id)
+            before = len(self.documents)
+            self.documents = [document for document in self.documents if document["sha256"] not in known]
+            self.raced += before - len(self.documents)
+            chunk_count = self._insert() if self.documents else 0
+        self.committed += len(self.documents)
+        self.committed_chunks += chunk_count
+
+        if self.texts:
+            from app import esg_store
+            for document in self.documents:
+                file_name, text = self.texts[document["sha256"]]
+                esg_store.ingest_report(self.user_id, file_name, text)
+        self.documents, self.chunks, self.texts = [], {}, {}
+
+
+def print_progress(counts: Dict[str, int], total: int, size: int, elapsed: float, final: bool = False):
+    done = sum(counts.values())
+    rate = done / elapsed if elapsed > 0 else 0
+    mb_rate = size / 1024 / 1024 / elapsed if elapsed > 0 else 0
+    print(
+        f"\r  {done}/{total} files | {rate:.1f} files/s | {mb_rate:.1f} MB/s | "
+        f"{counts['new']} new, {counts['known'] + counts['duplicate']} duplicate, "
+        f"{counts['empty']} empty, {counts['failed']} failed",
+        end="\n" if final else "", file=sys.stderr, flush=True
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk-load a directory of ESG reports into the documents tables")
+    parser.add_argument("directory")
+    parser.add_argument("--user-id", type=int, default=1, help="owner of the documents (default: demo user)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="extraction processes")
+    parser.add_argument("--batch-size", type=int, default=100, help="documents per transaction")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS)
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER, help="HF tokenizer for token counts, or 'simple'")
+    parser.add_argument("--esg-figures", action="store_true", help="also extract figures into the /esg/* store")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        print(f"❌ Not a directory: {args.directory}")
+        return 1
+
+    models.Base.metadata.create_all(bind=database.engine)
+    database.add_missing_columns()
+    database.migrate_message_ids()
+    search.setup_search_index()
+    db = database.SessionLocal()
+
+    paths = list(iter_files(args.directory))
+    known = crud.get_document_hashes(db, args.user_id)
+    print(f"📚 {len(paths)} files under {args.directory}, {len(known)} documents already loaded for user "
+          f"{args.user_id}, {args.workers} workers", file=sys.stderr)
+
+    writer = BatchWriter(db, args.user_id, args.directory, args.batch_size, args.esg_figures)
+    counts = {"new": 0, "known": 0, "duplicate": 0, "empty": 0, "failed": 0}
+    seen = set()
+    size = 0
+    last_progress = 0.0
+    start = time.perf_counter()
+    try:
+        with Pool(args.workers, init_worker, (args.tokenizer, known, args.chunk_tokens)) as pool:
+            for result in pool.imap_unordered(process_file, paths, chunksize=4):
+                size += result["size"]
+                status = result["status"]
+                if status == "new" and result["sha256"] in seen:
+                    status = "duplicate"  # same content twice in this run
+                if status == "new":
+                    seen.add(result["sha256"])
+                    writer.add(result)
+                elif status == "failed":
+                    print(f"\n  ⚠️  {result['path']}: {result['error']}", file=sys.stderr)
+                counts[status] += 1
+
+                now = time.perf_counter()
+                if now - last_progress >= 1:
+                    print_progress(counts, len(paths), size, now - start)
+                    last_progress = now
+        writer.flush()
+    finally:
+        db.close()
+
+    elapsed = time.perf_counter() - start
+    print_progress(counts, len(paths), size, elapsed, final=True)
+    if writer.raced:
+        print(f"  {writer.raced} file(s) were loaded by a concurrent run first", file=sys.stderr)
+    print(
+        f"✅ {writer.committed} documents ({writer.committed_chunks} chunks) loaded in {elapsed:.1f}s: "
+        f"{len(paths) / elapsed if elapsed > 0 else 0:.1f} files/s, "
+        f"{size / 1024 / 1024 / elapsed if elapsed > 0 else 0:.1f} MB/s",
+        file=sys.stderr
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
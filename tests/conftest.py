@@ -0,0 +1,42 @@
+import os
+import tempfile
+
+# The app modules build their engine from DATABASE_URL at import time
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="finesg-test-"), "app.db"))
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app import database, models, search
+from app.compression import register_sqlite_functions
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """A fresh SQLite database with the app's schema and search index"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", lambda connection, record: register_sqlite_functions(connection))
+    models.Base.metadata.create_all(bind=engine)
+    database.add_missing_columns(engine)
+    database.migrate_message_ids(engine)
+    assert search.setup_search_index(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(email="test@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
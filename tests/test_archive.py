@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from app import crud, database, models, search
+
+
+def idle_conversation(db, user, *contents):
+    conversation = crud.create_conversation(db, user.id, "Old chat")
+    for content in contents:
+        crud.create_message(db, conversation.id, "user", content)
+    conversation.updated_at = datetime.now(timezone.utc) - timedelta(days=60)
+    db.commit()
+    return conversation
+
+
+def test_archive_insert_search_rehydrate(db, user):
+    old = idle_conversation(db, user, "scope 3 emissions of the supplier", "water usage in 2022")
+    archived_ids = {message.id for message in old.messages}
+    cutoff = datetime.now(timezone.utc) - timedelta(days=30)
+
+    assert crud.archive_conversation(db, old.id, cutoff) == 2
+    assert db.query(models.Message).count() == 0
+
+    # New messages must not reuse the ids that moved to messages_archive
+    current = crud.create_conversation(db, user.id, "New chat")
+    fresh = crud.create_message(db, current.id, "user", "biodiversity offsets")
+    assert fresh.id not in archived_ids
+    assert fresh.id > max(archived_ids)
+
+    hits = crud.search_messages(db, user.id, "biodiversity")
+    assert [hit.id for hit in hits] == [fresh.id]
+    assert [hit.id for hit in crud.search_messages(db, user.id, "emissions")] == [min(archived_ids)]
+
+    db.refresh(old)
+    crud.ensure_hot(db, old)
+    assert old.archived_at is None
+    assert {message.id for message in crud.get_conversation_messages(db, old.id)} == archived_ids
+    assert db.query(models.MessageArchive).count() == 0
+
+
+def test_messages_table_migrated_to_autoincrement(engine, db, user):
+    conversation = idle_conversation(db, user, "first", "second")
+    crud.archive_conversation(db, conversation.id, datetime.now(timezone.utc) - timedelta(days=30))
+
+    # Recreate messages the way databases from before the fix have it: no AUTOINCREMENT
+    with engine.begin() as connection:
+        sql = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'messages'")).scalar()
+        connection.execute(text("DROP TABLE messages"))
+        connection.execute(text(sql.replace("AUTOINCREMENT", "")))
+        connection.execute(text("DELETE FROM sqlite_sequence WHERE name = 'messages'"))
+
+    database.migrate_message_ids(engine)
+    assert search.setup_search_index(engine)
+    with engine.connect() as connection:
+        sql = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'messages'")).scalar()
+    assert "AUTOINCREMENT" in sql
+
+    current = crud.create_conversation(db, user.id, "New chat")
+    fresh = crud.create_message(db, current.id, "user", "third")
+    assert fresh.id == 3
+    assert [hit.id for hit in crud.search_messages(db, user.id, "third")] == [3]
+    crud.ensure_hot(db, conversation)
+    assert db.query(models.Message).count() == 3
@@ -0,0 +1,29 @@
+from app.esg_extract import extract_figures
+
+
+def figures_by_year(text, metric, default_year=None):
+    return {
+        figure["year"]: figure["value"]
+        for figure in extract_figures(text, default_year)
+        if figure["metric"] == metric
+    }
+
+
+def test_year_columns_are_not_values():
+    text = "Scope 1 emissions 2022 2023 tCO2e 900 1,000"
+    assert figures_by_year(text, "scope1_emissions") == {2022: 900.0, 2023: 1000.0}
+
+
+def test_year_columns_with_unit_header():
+    text = "Scope 3 emissions (ktCO2e) 2021 2022 2023\n12.5 14 15.25"
+    assert figures_by_year(text, "scope3_emissions") == {2021: 12500.0, 2022: 14000.0, 2023: 15250.0}
+
+
+def test_single_year_dates_the_figure():
+    text = "Scope 1 (tCO2e) 2023: 12,345"
+    assert figures_by_year(text, "scope1_emissions") == {2023: 12345.0}
+
+
+def test_figure_without_year_uses_default():
+    text = "Total water withdrawal was 1.2 million m3."
+    assert figures_by_year(text, "water_withdrawal", default_year=2022) == {2022: 1.2e6}
@@ -0,0 +1,20 @@
+from app import crud, export, models
+
+
+def test_import_assigns_new_conversation_ids(db, user):
+    original = crud.create_conversation(db, user.id, "Report review")
+    crud.create_message(db, original.id, "user", "scope 2 figures?")
+    crud.create_message(db, original.id, "assistant", "12,400 tCO2e in 2023")
+    lines = list(export.iter_export_lines(db, user.id))
+
+    counts = export.import_lines(db, lines)
+    assert counts == {"conversations": 1, "messages": 2}
+
+    imported = db.query(models.Conversation).filter(models.Conversation.id != original.id).one()
+    assert imported.title == "Report review"
+    assert [message.content for message in crud.get_conversation_messages(db, imported.id)] == [
+        "scope 2 figures?", "12,400 tCO2e in 2023"
+    ]
+    # The next conversation gets a fresh id after the imported ones
+    later = crud.create_conversation(db, user.id, "Later")
+    assert later.id > imported.id